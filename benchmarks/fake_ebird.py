@@ -0,0 +1,254 @@
+import argparse
+import glob
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+try:
+    from . import fixtures
+except ImportError:
+    import fixtures
+
+SPECIES_PATH = re.compile(r"data/obs/[^/]+/recent/[^/]+")
+
+
+def parse_latency(spec):
+    # "fixed:0.1", "uniform:0.05,0.3" or "lognormal:<median>,<sigma>" in seconds
+    kind, _, args = spec.partition(":")
+    values = [float(value) for value in args.split(",") if value]
+    if kind == "fixed":
+        return lambda rng: values[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "lognormal":
+        median, sigma = values
+        return lambda rng: rng.lognormvariate(0, sigma) * median
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def region_bodies(region_fixtures):
+    # Observation bodies for every fixture plus region lists that lead to them
+    bodies = {}
+    codes = [fixture.region_code.split("-") for fixture in region_fixtures]
+    for fixture in region_fixtures:
+        bodies.update(fixture.responses())
+    for country_code in {parts[0] for parts in codes}:
+        for level in (1, 2):
+            regions = sorted(
+                {
+                    "-".join(parts[: level + 1])
+                    for parts in codes
+                    if parts[0] == country_code and len(parts) > level
+                }
+            )
+            bodies[f"ref/region/list/subnational{level}/{country_code}"] = json.dumps(
+                [{"code": code, "name": code} for code in regions]
+            ).encode()
+    return bodies
+
+
+def load_recorded(fixtures_dir):
+    # Recorded responses are stored as <fixtures_dir>/<api path>.json
+    bodies = {}
+    for path in glob.glob(os.path.join(fixtures_dir, "**", "*.json"), recursive=True):
+        with open(path, "rb") as f:
+            bodies[os.path.relpath(path, fixtures_dir)[: -len(".json")]] = f.read()
+    return bodies
+
+
+def save_recorded(bodies, fixtures_dir):
+    for api_path, body in bodies.items():
+        path = os.path.join(fixtures_dir, f"{api_path}.json")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(body)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "FakeEBird/1.0"
+
+    def do_GET(self):
+        fake = self.server.fake
+        fake.started()
+        try:
+            status, body, delay = fake.respond(self.path)
+            if delay:
+                time.sleep(delay)
+            self.send_response(status)
+            if status == 429:
+                self.send_header("Retry-After", "1")
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            fake.finished()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Server(ThreadingHTTPServer):
+    # The default backlog of 5 drops bursts of connections from the fan-out
+    request_queue_size = 128
+    daemon_threads = True
+
+
+# Serves eBird API paths from fixture bodies with simulated latency, server errors
+# and a server-wide rate limit that answers 429 once its token bucket is empty
+class FakeEBird:
+    def __init__(
+        self,
+        bodies,
+        latency="fixed:0",
+        error_rate=0.0,
+        rate_limit=None,
+        burst=None,
+        seed=0,
+        clock=time.monotonic,
+    ):
+        self.bodies = bodies
+        self.latency = parse_latency(latency) if isinstance(latency, str) else latency
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.burst = burst or rate_limit or 0
+        self._rng = random.Random(seed)
+        self._clock = clock
+        self._tokens = float(self.burst)
+        self._refilled_at = clock()
+        self._lock = threading.Lock()
+        self.stats = {
+            "requests": 0,
+            "errors": 0,
+            "throttled": 0,
+            "not_found": 0,
+            "max_in_flight": 0,
+        }
+        # Every request path in the order received, with its query string
+        self.paths = []
+        self.in_flight = 0
+        self._server = None
+
+    def started(self):
+        with self._lock:
+            self.in_flight += 1
+            self.stats["max_in_flight"] = max(
+                self.stats["max_in_flight"], self.in_flight
+            )
+
+    def finished(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def body(self, path):
+        body = self.bodies.get(path)
+        if body is None and SPECIES_PATH.fullmatch(path):
+            # Species not seen in the region return an empty list, as eBird does
+            body = b"[]"
+        return body
+
+    def respond(self, request_path):
+        path = urlparse(request_path).path.split("/v2/", 1)[-1]
+        with self._lock:
+            self.stats["requests"] += 1
+            self.paths.append(request_path)
+            delay = self.latency(self._rng)
+            if self.rate_limit:
+                now = self._clock()
+                self._tokens = min(
+                    self.burst,
+                    self._tokens + (now - self._refilled_at) * self.rate_limit,
+                )
+                self._refilled_at = now
+                if self._tokens < 1:
+                    self.stats["throttled"] += 1
+                    return 429, b'{"errors": ["Too many requests"]}', 0
+                self._tokens -= 1
+            if self._rng.random() < self.error_rate:
+                self.stats["errors"] += 1
+                return 503, b'{"errors": ["Service unavailable"]}', delay
+
+        body = self.body(path)
+        if body is None:
+            with self._lock:
+                self.stats["not_found"] += 1
+            return 404, b"[]", delay
+        return 200, body, delay
+
+    def start(self, host="127.0.0.1", port=0):
+        self._server = _Server((host, port), _Handler)
+        self._server.fake = self
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v2"
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start() if self._server is None else self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.fake_ebird",
+        description="Serve a local stand-in for the eBird API.",
+    )
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument(
+        "--scale", action="append", choices=list(fixtures.SCALES), dest="scales"
+    )
+    parser.add_argument("--days-back", type=int, default=7)
+    parser.add_argument("--fixtures-dir", help="serve recorded responses instead")
+    parser.add_argument(
+        "--record-dir", help="write the generated responses here as fixtures"
+    )
+    parser.add_argument("--latency", default="lognormal:0.15,0.5")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=float, help="requests per second")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.fixtures_dir:
+        bodies = load_recorded(args.fixtures_dir)
+    else:
+        bodies = region_bodies(
+            [
+                fixtures.synthetic_region(scale, args.days_back, args.seed)
+                for scale in args.scales or fixtures.SCALES
+            ]
+        )
+    if args.record_dir:
+        save_recorded(bodies, args.record_dir)
+
+    fake = FakeEBird(
+        bodies,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        rate_limit=args.rate_limit,
+        seed=args.seed,
+    ).start(port=args.port)
+    print(f"Serving {len(bodies)} responses at {fake.base_url}", file=sys.stderr)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        fake.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
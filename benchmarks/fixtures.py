@@ -0,0 +1,171 @@
+import io
+import json
+import numpy as np
+import pandas as pd
+from lifers import taxonomy
+
+# Rough shapes of an eBird region: how many species are reported and how many
+# hotspots they are spread over
+SCALES = {
+    "suburb": {"region_code": "AU-VIC-MEL", "species": 150, "locations": 40},
+    "state": {"region_code": "AU-VIC", "species": 450, "locations": 1500},
+    "country": {"region_code": "AU", "species": 800, "locations": 4000},
+}
+DAYS_BACK = (1, 7, 30)
+LIFELIST_SPECIES = 700
+SEEN_FRACTION = 0.5
+
+LIFELIST_HEADER = "Row #,Taxon Order,Category,Common Name,Scientific Name,Count,Location,S/P,Date,LocID,SubID,Exotic,Countable\n"
+
+
+class RegionFixture:
+    def __init__(self, name, region_code, days_back, recent, species_obs, lifelist):
+        self.name = name
+        self.region_code = region_code
+        self.days_back = days_back
+        self.recent = recent
+        self.species_obs = species_obs
+        self.lifelist = lifelist
+
+    def responses(self):
+        # Raw response bodies keyed on API path, ready to be replayed
+        bodies = {f"data/obs/{self.region_code}/recent": json.dumps(self.recent)}
+        for species_code, observations in self.species_obs.items():
+            path = f"data/obs/{self.region_code}/recent/{species_code}"
+            bodies[path] = json.dumps(observations)
+        return {path: body.encode() for path, body in bodies.items()}
+
+    def observation_count(self):
+        return sum(len(observations) for observations in self.species_obs.values())
+
+
+def _species_taxonomy():
+    taxonomy_df = taxonomy.get_taxonomy()
+    return taxonomy_df.loc[taxonomy_df["CATEGORY"] == "species"].reset_index(drop=True)
+
+
+def _observation(species, location, obs_dt, rng):
+    return {
+        "speciesCode": species["SPECIES_CODE"],
+        "comName": species["PRIMARY_COM_NAME"],
+        "sciName": species["SCI_NAME"],
+        "locId": location["locId"],
+        "locName": location["locName"],
+        "obsDt": obs_dt,
+        "howMany": int(rng.integers(1, 20)),
+        "lat": location["lat"],
+        "lng": location["lng"],
+        "obsValid": True,
+        "obsReviewed": False,
+        "locationPrivate": bool(location["private"]),
+        "subId": f"S{rng.integers(10**8, 10**9)}",
+    }
+
+
+def _now(now):
+    # Sightings are dated back from now, so the app's observation store, which only
+    # keeps the last days_back days, serves them as it would real ones
+    if now is None:
+        now = pd.Timestamp.now(tz="UTC").tz_localize(None)
+    return pd.Timestamp(now).floor("min")
+
+
+def synthetic_region(scale, days_back, seed=0, now=None):
+    shape = SCALES[scale]
+    rng = np.random.default_rng(seed)
+    species_df = _species_taxonomy()
+
+    # Longer windows turn up more of the region's species at more hotspots
+    species_count = int(shape["species"] * min(1.0, 0.55 + days_back / 60))
+    region_species = species_df.iloc[
+        np.sort(rng.choice(len(species_df), size=species_count, replace=False))
+    ]
+    locations = pd.DataFrame(
+        {
+            "locId": [f"L{i}" for i in range(shape["locations"])],
+            "locName": [f"Hotspot {i}" for i in range(shape["locations"])],
+            "lat": np.round(rng.uniform(-39.0, -34.0, shape["locations"]), 6),
+            "lng": np.round(rng.uniform(141.0, 150.0, shape["locations"]), 6),
+            "private": rng.random(shape["locations"]) < 0.2,
+        }
+    ).to_dict("records")
+    obs_dates = _now(now) - pd.to_timedelta(
+        rng.integers(0, days_back * 24 * 60, 1000), unit="min"
+    )
+    obs_dates = obs_dates.strftime("%Y-%m-%d %H:%M").tolist()
+
+    mean_sightings = max(1.0, shape["locations"] * days_back / 600)
+    recent = []
+    species_obs = {}
+    for species in region_species.to_dict("records"):
+        sightings = min(int(rng.geometric(1 / mean_sightings)), len(locations))
+        location_ids = rng.choice(len(locations), size=sightings, replace=False)
+        observations = [
+            _observation(
+                species, locations[i], obs_dates[rng.integers(len(obs_dates))], rng
+            )
+            for i in location_ids
+        ]
+        species_obs[species["SPECIES_CODE"]] = observations
+        recent.append(observations[0])
+
+    lifelist = synthetic_lifelist(region_species, species_df, rng)
+    return RegionFixture(
+        f"{scale}-{days_back}d",
+        shape["region_code"],
+        days_back,
+        recent,
+        species_obs,
+        lifelist,
+    )
+
+
+def synthetic_lifelist(region_species, species_df, rng, size=LIFELIST_SPECIES):
+    seen = region_species.sample(frac=SEEN_FRACTION, random_state=rng.integers(2**31))
+    others = species_df.loc[~species_df["SPECIES_CODE"].isin(seen["SPECIES_CODE"])]
+    extra = others.sample(
+        n=max(0, min(size - len(seen), len(others))),
+        random_state=rng.integers(2**31),
+    )
+    lifelist_species = pd.concat([seen, extra]).sort_values("TAXON_ORDER")
+
+    out = io.StringIO()
+    out.write(LIFELIST_HEADER)
+    for row, species in enumerate(lifelist_species.to_dict("records"), start=1):
+        out.write(
+            f'{row},{species["TAXON_ORDER"]},species,"{species["PRIMARY_COM_NAME"]}",'
+            f'{species["SCI_NAME"]},1,"Hotspot",AU-VIC,12 Aug 2023,L1,S1,,1\n'
+        )
+    return out.getvalue().encode()
+
+
+def synthetic_lifelists(fixture, count, seed=0):
+    # Lifelists for several birders searching the same region
+    species_df = _species_taxonomy()
+    region_species = species_df.loc[
+        species_df["SPECIES_CODE"].isin(fixture.species_obs)
+    ]
+    rng = np.random.default_rng(seed)
+    return [synthetic_lifelist(region_species, species_df, rng) for _ in range(count)]
+
+
+def synthetic_map_frame(rows=100_000, locations=3_000, species=600, seed=0, now=None):
+    # Stand-in for the per-species observations of a very large region
+    rng = np.random.default_rng(seed)
+    location = rng.integers(0, locations, rows)
+    species_id = rng.integers(0, species, rows).astype(str)
+    lats = rng.uniform(-40, -10, locations)
+    lngs = rng.uniform(115, 153, locations)
+    return pd.DataFrame(
+        {
+            "speciesCode": np.char.add("sp", species_id),
+            "comName": np.char.add("Species ", species_id),
+            "locId": np.char.add("L", location.astype(str)),
+            "locName": np.char.add("Hotspot ", location.astype(str)),
+            "lat": lats[location],
+            "lng": lngs[location],
+            "obsDt": _now(now).strftime("%Y-%m-%d %H:%M"),
+            "howMany": rng.integers(1, 20, rows),
+            "locationPrivate": rng.random(rows) < 0.2,
+        }
+    )
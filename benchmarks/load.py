@@ -0,0 +1,275 @@
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+from lifers import cache, data, ebird_api, pipeline, scheduler, store
+
+try:
+    from . import fake_ebird, fixtures
+except ImportError:
+    import fake_ebird
+    import fixtures
+
+DEFAULT_USERS = 8
+DEFAULT_SEARCHES = 3
+HEADERS = {"X-eBirdApiToken": "load-test"}
+PERCENTILES = (50, 95, 99)
+
+
+@contextlib.contextmanager
+def serving(fake, cold=False, store_dir=None):
+    # Points the API clients at the fake server with a fresh production scheduler.
+    # Cold runs keep nothing between searches, so every search reaches the server.
+    # With store_dir, observations go through a new store there, as in the app.
+    original_base_url = ebird_api.API_BASE_URL
+    original_cache = ebird_api.response_cache
+    original_store = ebird_api.get_observation_store()
+    ebird_api.API_BASE_URL = fake.base_url
+    if cold:
+        ebird_api.response_cache = cache.TTLCache(max_bytes=0)
+    ebird_api.response_cache.clear()
+    ebird_api.set_observation_store(
+        store.ObservationStore(os.path.join(store_dir, "observations.sqlite"))
+        if store_dir
+        else None
+    )
+    pipeline.clear_stages()
+    scheduler.set_scheduler(None)
+    try:
+        yield scheduler.get_scheduler()
+    finally:
+        ebird_api.API_BASE_URL = original_base_url
+        ebird_api.response_cache = original_cache
+        ebird_api.set_observation_store(original_store)
+        pipeline.clear_stages()
+        scheduler.set_scheduler(None)
+
+
+def search(lifelist, fixture, cold=False, top_species=None):
+    # One "Find Species" click: needs, per-species fan-out, then the map layers.
+    # With top_species, only that many species are fetched in full, as in the app.
+    # Cold searches run every stage, nested ones included, without their memos.
+    with pipeline.uncached() if cold else contextlib.nullcontext():
+        needs_df = pipeline.compute_needs(
+            lifelist, fixture.region_code, fixture.days_back, HEADERS
+        )
+        if "speciesCode" not in needs_df.columns or needs_df.empty:
+            return 0, []
+        species_codes = needs_df["speciesCode"].tolist()
+        if top_species is not None:
+            species_codes = pipeline.rank_species(
+                needs_df, fixture.region_code, fixture.days_back, HEADERS
+            )[:top_species]
+        region_needs_df, failed_species = pipeline.fetch_species_obs(
+            fixture.region_code,
+            species_codes,
+            fixture.days_back,
+            HEADERS,
+        )
+        if top_species is not None:
+            region_needs_df = data.combine_species_obs(needs_df, region_needs_df)
+        if not region_needs_df.empty:
+            pipeline.map_layer_data(region_needs_df)
+    return len(needs_df), failed_species
+
+
+def simulate_user(
+    user, region_fixtures, lifelists, searches, seed, cold, samples, top_species=None
+):
+    rng = np.random.default_rng([seed, user])
+    with scheduler.session(f"user-{user}"):
+        for _ in range(searches):
+            index = int(rng.integers(len(region_fixtures)))
+            fixture = region_fixtures[index]
+            start = time.perf_counter()
+            try:
+                needs, failed_species = search(
+                    lifelists[index][user], fixture, cold, top_species
+                )
+                error = None
+            except Exception as e:
+                needs, failed_species, error = 0, [], f"{type(e).__name__}: {e}"
+            samples.append(
+                {
+                    "user": user,
+                    "case": fixture.name,
+                    "seconds": time.perf_counter() - start,
+                    "needs": needs,
+                    "failed_species": len(failed_species),
+                    "error": error,
+                }
+            )
+
+
+def summarise(samples, wall_seconds):
+    seconds = np.array([sample["seconds"] for sample in samples])
+    summary = {
+        "searches": len(samples),
+        "errors": sum(sample["error"] is not None for sample in samples),
+        "failed_species": sum(sample["failed_species"] for sample in samples),
+        "wall_seconds": wall_seconds,
+        "searches_per_second": len(samples) / wall_seconds if wall_seconds else 0.0,
+    }
+    for percentile in PERCENTILES:
+        summary[f"p{percentile}_seconds"] = (
+            float(np.percentile(seconds, percentile)) if len(seconds) else 0.0
+        )
+    return summary
+
+
+def run(
+    users=DEFAULT_USERS,
+    searches=DEFAULT_SEARCHES,
+    scales=("suburb", "state"),
+    days_back=7,
+    latency="lognormal:0.15,0.5",
+    error_rate=0.0,
+    rate_limit=None,
+    cold=False,
+    seed=0,
+    top_species=None,
+    use_store=False,
+):
+    region_fixtures = [
+        fixtures.synthetic_region(scale, days_back, seed) for scale in scales
+    ]
+    lifelists = [
+        fixtures.synthetic_lifelists(fixture, users, seed)
+        for fixture in region_fixtures
+    ]
+    fake = fake_ebird.FakeEBird(
+        fake_ebird.region_bodies(region_fixtures),
+        latency=latency,
+        error_rate=error_rate,
+        rate_limit=rate_limit,
+        seed=seed,
+    )
+
+    samples = []
+    with tempfile.TemporaryDirectory() as store_dir, fake, serving(
+        fake, cold, store_dir if use_store else None
+    ) as request_scheduler:
+        threads = [
+            threading.Thread(
+                target=simulate_user,
+                args=(
+                    user,
+                    region_fixtures,
+                    lifelists,
+                    searches,
+                    seed,
+                    cold,
+                    samples,
+                    top_species,
+                ),
+            )
+            for user in range(users)
+        ]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall_seconds = time.perf_counter() - start
+        scheduler_stats = request_scheduler.stats()
+
+    return {
+        "meta": {
+            "users": users,
+            "searches_per_user": searches,
+            "scales": list(scales),
+            "days_back": days_back,
+            "latency": latency,
+            "error_rate": error_rate,
+            "rate_limit": rate_limit,
+            "cold": cold,
+            "seed": seed,
+            "top_species": top_species,
+            "store": use_store,
+        },
+        "summary": summarise(samples, wall_seconds),
+        "server": dict(fake.stats),
+        "scheduler": scheduler_stats,
+        "samples": samples,
+    }
+
+
+def format_report(report):
+    summary, server = report["summary"], report["server"]
+    return "\n".join(
+        [
+            f"{summary['searches']} searches by {report['meta']['users']} users "
+            f"in {summary['wall_seconds']:.1f}s "
+            f"({summary['searches_per_second']:.2f} searches/s)",
+            "latency "
+            + "  ".join(
+                f"p{percentile} {summary[f'p{percentile}_seconds']:.2f}s"
+                for percentile in PERCENTILES
+            ),
+            f"errors {summary['errors']}  failed species {summary['failed_species']}",
+            f"server requests {server['requests']}  429s {server['throttled']}  "
+            f"5xx {server['errors']}",
+        ]
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.load",
+        description="Simulate concurrent users running the needs pipeline against a fake eBird API.",
+    )
+    parser.add_argument("--users", type=int, default=DEFAULT_USERS)
+    parser.add_argument("--searches", type=int, default=DEFAULT_SEARCHES)
+    parser.add_argument(
+        "--scale", action="append", choices=list(fixtures.SCALES), dest="scales"
+    )
+    parser.add_argument("--days-back", type=int, default=7)
+    parser.add_argument("--latency", default="lognormal:0.15,0.5")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--rate-limit", type=float, help="server requests per second before 429s"
+    )
+    parser.add_argument(
+        "--cold", action="store_true", help="disable caches so every search fetches"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--top-species",
+        type=int,
+        help="fetch only this many species in full per search, as the app does",
+    )
+    parser.add_argument(
+        "--store",
+        action="store_true",
+        help="keep observations in an observation store, as the app does by default",
+    )
+    parser.add_argument("--output", help="write the full report as JSON")
+    args = parser.parse_args(argv)
+
+    report = run(
+        args.users,
+        args.searches,
+        args.scales or ("suburb", "state"),
+        args.days_back,
+        args.latency,
+        args.error_rate,
+        args.rate_limit,
+        args.cold,
+        args.seed,
+        args.top_species,
+        args.store,
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    print(format_report(report))
+    return 1 if report["summary"]["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
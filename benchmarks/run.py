@@ -0,0 +1,301 @@
+import argparse
+import contextlib
+import io
+import json
+import platform
+import re
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from urllib.parse import urlparse
+import pandas as pd
+import requests_mock
+from lifers import data, ebird_api, pipeline, scheduler, taxonomy, visualise
+
+try:
+    from . import fake_ebird, fixtures
+except ImportError:
+    import fake_ebird
+    import fixtures
+
+DEFAULT_REPEAT = 3
+HEADERS = {"X-eBirdApiToken": "benchmark"}
+
+
+@contextlib.contextmanager
+def replay(bodies):
+    # requests-mock answers the requests session; the tornado fan-out cannot be
+    # patched that way, so it is served the same bodies from a loopback server
+    fake = fake_ebird.FakeEBird(bodies).start()
+    base_url = fake.base_url
+
+    def respond(request, context):
+        body = bodies.get(urlparse(request.url).path.split("/v2/", 1)[-1])
+        if body is None:
+            context.status_code = 404
+            return b""
+        return body
+
+    # Stages are timed without the production rate limit in the way
+    original_base_url = ebird_api.API_BASE_URL
+    ebird_api.API_BASE_URL = base_url
+    scheduler.set_scheduler(
+        scheduler.Scheduler(rate=1e9, burst=1e9, initial_concurrency=64)
+    )
+    try:
+        with requests_mock.Mocker() as mocker:
+            mocker.get(re.compile(re.escape(base_url)), content=respond)
+            yield base_url
+    finally:
+        ebird_api.API_BASE_URL = original_base_url
+        scheduler.set_scheduler(None)
+        fake.stop()
+
+
+def measure(func, repeat=DEFAULT_REPEAT, setup=None):
+    # Timings and memory come from separate runs so tracemalloc does not skew times
+    seconds = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        result = func()
+        seconds.append(time.perf_counter() - start)
+
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    try:
+        func()
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return result, {
+        "seconds_min": min(seconds),
+        "seconds_median": statistics.median(seconds),
+        "peak_bytes": peak_bytes,
+    }
+
+
+def _clear_caches():
+    ebird_api.response_cache.clear()
+    pipeline.clear_stages()
+
+
+def _reset_taxonomy():
+    taxonomy._taxonomy = None
+
+
+def bench_taxonomy(repeat):
+    result, stats = measure(data.sciname_speciescodes, repeat, setup=_reset_taxonomy)
+    index, index_stats = measure(taxonomy.build_index, repeat)
+    return [
+        dict(case="taxonomy", stage="sciname_speciescodes", rows=len(result), **stats),
+        dict(case="taxonomy", stage="build_index", rows=len(index), **index_stats),
+    ]
+
+
+def bench_region(fixture, repeat):
+    region_code, days_back = fixture.region_code, fixture.days_back
+    results = []
+
+    def record(stage, func, setup=None, rows=len):
+        result, stats = measure(func, repeat, setup)
+        results.append(dict(case=fixture.name, stage=stage, rows=rows(result), **stats))
+        return result
+
+    with replay(fixture.responses()):
+        record(
+            "load_lifelist_csv",
+            lambda: data.load_lifelist_csv(io.BytesIO(fixture.lifelist)),
+        )
+        record(
+            "fetch_recent",
+            lambda: pipeline.fetch_recent.__wrapped__(region_code, days_back, HEADERS),
+            setup=_clear_caches,
+        )
+
+        def warm_inputs():
+            _clear_caches()
+            pipeline.load_lifelist(fixture.lifelist)
+            pipeline.fetch_recent(region_code, days_back, HEADERS)
+
+        needs_df = record(
+            "compute_needs",
+            lambda: pipeline.compute_needs.__wrapped__(
+                fixture.lifelist, region_code, days_back, HEADERS
+            ),
+            setup=warm_inputs,
+        )
+        region_needs_df, _ = record(
+            "fetch_species_obs",
+            lambda: pipeline.fetch_species_obs(
+                region_code, needs_df["speciesCode"].tolist(), days_back, HEADERS
+            ),
+            setup=_clear_caches,
+            rows=lambda result: len(result[0]),
+        )
+    _clear_caches()
+
+    results.extend(bench_map(fixture.name, region_needs_df, repeat))
+    return results
+
+
+def bench_map(case, region_needs_df, repeat):
+    results = []
+    region_loc_data, stats = measure(
+        lambda: data.format_region_needs_data_for_map(region_needs_df), repeat
+    )
+    results.append(
+        dict(case=case, stage="aggregate_locations", rows=len(region_loc_data), **stats)
+    )
+    map_data, stats = measure(
+        lambda: visualise.map_layer_data(region_needs_df, region_loc_data), repeat
+    )
+    results.append(dict(case=case, stage="map_layer_data", rows=len(map_data), **stats))
+    details, stats = measure(
+        lambda: data.format_location_details(region_needs_df), repeat
+    )
+    results.append(
+        dict(case=case, stage="location_details", rows=len(details[0]), **stats)
+    )
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(
+    scales=tuple(fixtures.SCALES),
+    days=fixtures.DAYS_BACK,
+    repeat=DEFAULT_REPEAT,
+    map_rows=100_000,
+    seed=0,
+):
+    results = bench_taxonomy(repeat)
+    for scale in scales:
+        for days_back in days:
+            fixture = fixtures.synthetic_region(scale, days_back, seed)
+            results.extend(bench_region(fixture, repeat))
+    if map_rows:
+        results.extend(
+            bench_map(
+                f"map-{map_rows}",
+                fixtures.synthetic_map_frame(map_rows, seed=seed),
+                repeat,
+            )
+        )
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "platform": platform.platform(),
+            "repeat": repeat,
+            "seed": seed,
+            "max_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        },
+        "results": results,
+    }
+
+
+def compare(baseline, current):
+    baseline_seconds = {
+        (result["case"], result["stage"]): result["seconds_min"]
+        for result in baseline["results"]
+    }
+    rows = []
+    for result in current["results"]:
+        before = baseline_seconds.get((result["case"], result["stage"]))
+        if before:
+            rows.append(
+                (result["case"], result["stage"], before, result["seconds_min"])
+            )
+    return rows
+
+
+def format_results(report):
+    lines = [
+        f"{'case':<16}{'stage':<24}{'rows':>9}{'min ms':>11}{'median ms':>11}{'peak MiB':>10}"
+    ]
+    for result in report["results"]:
+        lines.append(
+            f"{result['case']:<16}{result['stage']:<24}{result['rows']:>9}"
+            f"{result['seconds_min'] * 1000:>11.1f}"
+            f"{result['seconds_median'] * 1000:>11.1f}"
+            f"{result['peak_bytes'] / 2**20:>10.1f}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.run",
+        description="Time each needs pipeline stage against replayed eBird responses.",
+    )
+    parser.add_argument(
+        "--scale", action="append", choices=list(fixtures.SCALES), dest="scales"
+    )
+    parser.add_argument(
+        "--days-back",
+        action="append",
+        type=int,
+        choices=fixtures.DAYS_BACK,
+        dest="days",
+    )
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--map-rows", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument(
+        "--max-slowdown",
+        type=float,
+        help="exit nonzero when a stage is this many times slower than --compare",
+    )
+    args = parser.parse_args(argv)
+
+    report = run(
+        args.scales or tuple(fixtures.SCALES),
+        args.days or fixtures.DAYS_BACK,
+        args.repeat,
+        args.map_rows,
+        args.seed,
+    )
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(format_results(report))
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        slowest = 0.0
+        print(f"\nagainst {baseline['meta'].get('commit')}:")
+        for case, stage, before, after in compare(baseline, report):
+            ratio = after / before
+            slowest = max(slowest, ratio)
+            print(
+                f"{case:<16}{stage:<24}{before * 1000:>11.1f}{after * 1000:>11.1f}{ratio:>8.2f}x"
+            )
+        if args.max_slowdown and slowest > args.max_slowdown:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
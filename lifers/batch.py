@@ -0,0 +1,211 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from . import data, ebird_api, pipeline, scheduler, store
+except ImportError:
+    import data
+    import ebird_api
+    import pipeline
+    import scheduler
+    import store
+
+DEFAULT_DAYS_BACK = 7
+DEFAULT_WORKERS = 4
+FORMATS = ("parquet", "json")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m lifers.batch",
+        description="Precompute needs reports for lifelists and regions without Streamlit.",
+    )
+    parser.add_argument(
+        "--lifelist",
+        action="append",
+        required=True,
+        help="eBird lifelist CSV export; repeat for several birders",
+    )
+    parser.add_argument(
+        "--region",
+        action="append",
+        required=True,
+        help="eBird region code such as AU-VIC; repeat for several regions",
+    )
+    parser.add_argument("--days-back", type=int, default=DEFAULT_DAYS_BACK)
+    parser.add_argument("--output-dir", default="lifers-reports")
+    parser.add_argument("--format", choices=FORMATS, default="parquet")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument(
+        "--store",
+        default=store.STORE_PATH,
+        help="observation store so daily runs only fetch new observations; '' disables",
+    )
+    args = parser.parse_args(argv)
+    if not 1 <= args.days_back <= 30:
+        parser.error("--days-back must be between 1 and 30")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    return args
+
+
+def write_frame(df, path, output_format):
+    # Unique per thread too, since jobs run side by side in one process
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    if output_format == "parquet":
+        df.to_parquet(tmp_path, index=False)
+    else:
+        df.to_json(tmp_path, orient="records", indent=2)
+    os.replace(tmp_path, path)
+
+
+def job_names(lifelist_paths):
+    # Exports are often all named MyEBirdData.csv, so repeated names are numbered in
+    # the order given instead of sharing one report directory
+    names = {}
+    for lifelist_path in lifelist_paths:
+        name = os.path.splitext(os.path.basename(lifelist_path))[0]
+        unique_name = name
+        suffix = 2
+        while unique_name in names.values():
+            unique_name = f"{name}-{suffix}"
+            suffix += 1
+        names[lifelist_path] = unique_name
+    return names
+
+
+def run_job(
+    lifelist_path,
+    region_code,
+    days_back,
+    headers,
+    output_dir,
+    output_format,
+    job_name=None,
+):
+    started = time.perf_counter()
+    with open(lifelist_path, "rb") as f:
+        lifelist_bytes = f.read()
+
+    # Each job queues separately so small regions are not stuck behind large ones
+    with scheduler.session(f"{lifelist_path}:{region_code}"):
+        needs_df = pipeline.compute_needs(
+            lifelist_bytes, region_code, days_back, headers
+        )
+        if needs_df.empty:
+            region_needs_df, failed_species = needs_df, []
+        else:
+            region_needs_df, failed_species = pipeline.fetch_species_obs(
+                region_code, needs_df["speciesCode"].tolist(), days_back, headers
+            )
+
+    if job_name is None:
+        job_name = os.path.splitext(os.path.basename(lifelist_path))[0]
+    job_dir = os.path.join(output_dir, job_name)
+    os.makedirs(job_dir, exist_ok=True)
+    needs_path = os.path.join(job_dir, f"{region_code}_needs.{output_format}")
+    locations_path = os.path.join(job_dir, f"{region_code}_locations.{output_format}")
+    if needs_df.empty:
+        needs_table = needs_df
+    else:
+        needs_table = data.format_needs_data(needs_df)
+    write_frame(needs_table, needs_path, output_format)
+    if region_needs_df.empty:
+        locations_df = region_needs_df
+    else:
+        locations_df = pipeline.aggregate_locations(region_needs_df)
+    write_frame(locations_df, locations_path, output_format)
+
+    return {
+        "lifelist": lifelist_path,
+        "region": region_code,
+        "needs": len(needs_table),
+        "locations": len(locations_df),
+        "failed_species": failed_species,
+        "outputs": [needs_path, locations_path],
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def run_batch(
+    lifelist_paths,
+    region_codes,
+    days_back,
+    headers,
+    output_dir,
+    output_format="parquet",
+    workers=DEFAULT_WORKERS,
+):
+    # Jobs share the process-wide HTTP client, response cache and stage memos, so a
+    # region fetched for one lifelist is reused by every other lifelist
+    lifelist_paths = list(dict.fromkeys(lifelist_paths))
+    names = job_names(lifelist_paths)
+    jobs = [
+        (lifelist_path, region_code)
+        for lifelist_path in lifelist_paths
+        for region_code in region_codes
+    ]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                run_job,
+                lifelist_path,
+                region_code,
+                days_back,
+                headers,
+                output_dir,
+                output_format,
+                names[lifelist_path],
+            )
+            for lifelist_path, region_code in jobs
+        ]
+
+    results = []
+    for (lifelist_path, region_code), future in zip(jobs, futures):
+        try:
+            results.append(future.result())
+        except Exception as e:
+            results.append(
+                {"lifelist": lifelist_path, "region": region_code, "error": str(e)}
+            )
+    return results
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    api_key = os.environ.get("EBIRD_API_TOKEN")
+    if not api_key:
+        print("Environment variable 'EBIRD_API_TOKEN' is not set.", file=sys.stderr)
+        return 2
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    if args.store:
+        ebird_api.set_observation_store(store.ObservationStore(args.store))
+    results = run_batch(
+        args.lifelist,
+        args.region,
+        args.days_back,
+        {"X-eBirdApiToken": api_key},
+        args.output_dir,
+        args.format,
+        args.workers,
+    )
+    with open(os.path.join(args.output_dir, "summary.json"), "w") as f:
+        json.dump(results, f, indent=2)
+
+    failed = [result for result in results if "error" in result]
+    for result in failed:
+        print(
+            f"{result['lifelist']} {result['region']}: {result['error']}",
+            file=sys.stderr,
+        )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
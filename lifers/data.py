@@ -1,70 +1,436 @@
+import csv
+import functools
+import io
+import json
+import os
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+
+try:
+    from . import metrics, taxonomy
+except ImportError:
+    import metrics
+    import taxonomy
 
 
 def sciname_speciescodes():
-    all_ebird_data = pd.read_excel(
-        "lifers/ebird_taxonomy_v2024.xlsx", usecols=["SCI_NAME", "SPECIES_CODE"]
-    )
+    all_ebird_data = taxonomy.get_taxonomy()
     return dict(zip(all_ebird_data["SCI_NAME"], all_ebird_data["SPECIES_CODE"]))
 
 
-def country_codes():
-    countries_df = pd.read_csv("lifers/country_codes.csv")
-    return dict(zip(countries_df["Country"], countries_df["Alpha-2"]))
+COUNTRY_CODES_CSV = "lifers/country_codes.csv"
+# Prebuilt from the CSV so the first page does not parse it with pandas
+COUNTRY_CODES_JSON = "lifers/country_codes.json"
+
+
+def compile_country_codes(csv_path=COUNTRY_CODES_CSV, json_path=COUNTRY_CODES_JSON):
+    countries_df = pd.read_csv(csv_path, keep_default_na=False)
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(
+            dict(zip(countries_df["Country"], countries_df["Alpha-2"])),
+            f,
+            indent=0,
+            ensure_ascii=False,
+        )
+        f.write("\n")
+    return json_path
+
+
+@functools.lru_cache(maxsize=None)
+def _country_codes(json_path):
+    with open(json_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def country_codes(json_path=COUNTRY_CODES_JSON):
+    return dict(_country_codes(json_path))
+
+
+LIFELIST_COLUMNS = [
+    "Taxon Order",
+    "Category",
+    "Common Name",
+    "Scientific Name",
+    "Count",
+    "Location",
+    "S/P",
+    "Date",
+    "LocID",
+    "SubID",
+    "Exotic",
+    "Countable",
+]
+
+# Categories that can roll up to a species; spuhs, slashes and hybrids never do
+ROLLUP_CATEGORIES = ["species", "issf", "form", "intergrade", "domestic"]
+
+# Low-cardinality columns are dictionary-encoded by Arrow and arrive as categoricals
+_DICTIONARY = pa.dictionary(pa.int32(), pa.string())
+LIFELIST_COLUMN_TYPES = {
+    "Taxon Order": pa.int32(),
+    "Category": pa.string(),
+    "Common Name": pa.string(),
+    "Scientific Name": pa.string(),
+    "Count": _DICTIONARY,
+    "Location": _DICTIONARY,
+    "S/P": _DICTIONARY,
+    "Date": _DICTIONARY,
+    "LocID": _DICTIONARY,
+    "SubID": pa.string(),
+    "Exotic": _DICTIONARY,
+    "Countable": pa.int8(),
+    "Species Code": pa.string(),
+}
+
+
+def _binary_source(filepath):
+    if isinstance(filepath, io.TextIOBase):
+        return io.BytesIO(filepath.read().encode())
+    if hasattr(filepath, "read"):
+        return filepath
+    return os.fspath(filepath)
+
+
+def _read_header(source):
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            line = f.readline()
+    else:
+        position = source.tell()
+        line = source.readline()
+        source.seek(position)
+    return next(csv.reader([line.decode("utf-8-sig")]), [])
+
 
+def _skip_short_rows(row):
+    # Short rows (e.g. trailing whitespace lines) are dropped; long rows are errors
+    return "skip" if row.actual_columns < row.expected_columns else "error"
 
+
+@metrics.timed("load_lifelist")
 def load_lifelist_csv(filepath):
+    source = _binary_source(filepath)
+
     try:
-        df = pd.read_csv(filepath)
-    except pd.errors.ParserError:
+        header = _read_header(source)
+    except (UnicodeDecodeError, csv.Error):
         raise ValueError("Error parsing the CSV file")
 
-    required_columns = [
-        "Taxon Order",
-        "Category",
-        "Common Name",
-        "Scientific Name",
-        "Count",
-        "Location",
-        "S/P",
-        "Date",
-        "LocID",
-        "SubID",
-        "Exotic",
-        "Countable",
-    ]
-    missing_columns = set(required_columns) - set(df.columns)
+    missing_columns = set(LIFELIST_COLUMNS) - set(header)
     if missing_columns:
         raise ValueError(f"Missing required columns: {', '.join(missing_columns)}")
 
-    df = df[df["Category"] == "species"]
+    try:
+        reader = pv.open_csv(
+            source,
+            parse_options=pv.ParseOptions(invalid_row_handler=_skip_short_rows),
+            convert_options=pv.ConvertOptions(
+                include_columns=LIFELIST_COLUMNS + ["Species Code"],
+                include_missing_columns=True,
+                column_types=LIFELIST_COLUMN_TYPES,
+            ),
+        )
+        # Keep only rows that may count as a species, remembering their positions
+        rollup_categories = pa.array(ROLLUP_CATEGORIES)
+        batches = []
+        positions = []
+        offset = 0
+        for batch in reader:
+            species_mask = pc.fill_null(
+                pc.is_in(batch.column("Category"), value_set=rollup_categories), False
+            )
+            batches.append(batch.filter(species_mask))
+            positions.append(np.flatnonzero(species_mask) + offset)
+            offset += batch.num_rows
+    except pa.ArrowInvalid:
+        raise ValueError("Error parsing the CSV file")
+
+    df = pa.Table.from_batches(batches, schema=reader.schema).to_pandas(
+        split_blocks=True, self_destruct=True
+    )
+    df.index = np.concatenate(positions) if positions else np.array([], dtype=int)
+    df["Category"] = df["Category"].astype("category")
+
+    # Resolve by code where the export has one, otherwise by name or former name,
+    # and count subspecies and forms as their species
+    index = taxonomy.get_index()
+    taxon_ids = index.ids_for_codes(df["Species Code"])
+    unresolved = taxon_ids < 0
+    taxon_ids[unresolved] = index.ids_for_names(
+        df["Scientific Name"].to_numpy()[unresolved]
+    )
+    species_codes = index.species_codes(taxon_ids)
+    resolved = pd.notna(species_codes)
+    df["Species Code"] = np.where(resolved, species_codes, df["Species Code"])
 
-    if "Species Code" not in df.columns:
-        df["Species Code"] = df["Scientific Name"].map(sciname_speciescodes())
+    # Unknown species rows are kept as before; known taxa that are not countable
+    # as a species, and repeats of a species already listed, are dropped
+    keep = resolved | (unresolved & (df["Category"] == "species").to_numpy())
+    keep &= ~(df["Species Code"].duplicated() & df["Species Code"].notna()).to_numpy()
+    if not keep.all():
+        df = df.loc[keep]
 
     df["Species Number"] = df.shape[0] - df.index.values
 
     return df
 
 
-def format_needs_data(needs_data):
+def rollup_observations(obs_df, dedupe=False):
+    # Observations of subspecies and forms are counted as their species, and
+    # spuhs, slashes and hybrids dropped; codes the taxonomy lacks pass through
+    if obs_df.empty or "speciesCode" not in obs_df.columns:
+        return obs_df
+    index = taxonomy.get_index()
+    taxon_ids = index.ids_for_codes(obs_df["speciesCode"])
+    species_ids = index.species_ids(taxon_ids)
+    keep = (species_ids >= 0) | (taxon_ids < 0)
+    rolled = keep & (species_ids != taxon_ids) & (taxon_ids >= 0)
+    if keep.all() and not rolled.any() and not dedupe:
+        return obs_df
+
+    obs_df = obs_df.loc[keep].reset_index(drop=True)
+    rolled_ids = species_ids[keep][rolled[keep]]
+    rolled = rolled[keep]
+    for column, values in (
+        ("speciesCode", index.codes),
+        ("comName", index.common_names),
+        ("sciName", index.scientific_names),
+    ):
+        if column in obs_df.columns:
+            obs_df.loc[rolled, column] = values[rolled_ids]
+    if dedupe:
+        # Region-wide lists come newest first, so the latest sighting is kept
+        obs_df = obs_df.drop_duplicates("speciesCode").reset_index(drop=True)
+    return obs_df
+
+
+# The eBird fields the app uses; the rest of each record is dropped. Names and
+# locations repeat across sightings, so they are stored once as categoricals.
+OBSERVATION_DTYPES = {
+    "speciesCode": "category",
+    "comName": "category",
+    "sciName": "category",
+    "locId": "category",
+    "locName": "category",
+    "lat": "float32",
+    "lng": "float32",
+    "obsDt": "datetime64[ns]",
+    "howMany": "Int32",
+    "locationPrivate": "bool",
+}
+
+
+def compact_observations(obs_df):
+    if obs_df.empty and obs_df.columns.empty:
+        return obs_df
+    columns = [column for column in OBSERVATION_DTYPES if column in obs_df.columns]
+    compact = {}
+    for column in columns:
+        values = obs_df[column]
+        dtype = OBSERVATION_DTYPES[column]
+        if column == "obsDt":
+            # Dates without a time of day are reported as midnight
+            values = pd.to_datetime(values, format="ISO8601", errors="coerce")
+        elif column == "howMany":
+            # "X" (present, not counted) becomes missing
+            values = pd.to_numeric(values, errors="coerce").astype(dtype)
+        elif column == "locationPrivate":
+            values = values.astype("boolean").fillna(False).astype(dtype)
+        else:
+            values = values.astype(dtype)
+        compact[column] = values
+    return pd.DataFrame(compact, index=obs_df.index)
+
+
+def merge_observations(frames, keys):
+    # Overlapping areas report the same sightings; the newest row for each key is
+    # kept, e.g. per species for region lists or per species and location otherwise
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame()
+    merged = pd.concat(frames, ignore_index=True)
+    if "obsDt" in merged.columns:
+        merged = merged.sort_values("obsDt", ascending=False, kind="stable")
+    keys = [key for key in keys if key in merged.columns]
+    return merged.drop_duplicates(keys).reset_index(drop=True)
+
+
+LOCATION_COLUMNS = ["locId", "lat", "lng"]
+
+
+def combine_species_obs(needs_df, species_obs_df):
+    # Species fetched in full replace the single latest sighting from the region
+    # list; needs without a reported location are left off the map
+    latest_df = compact_observations(needs_df)
+    if set(LOCATION_COLUMNS) <= set(latest_df.columns):
+        latest_df = latest_df.dropna(subset=LOCATION_COLUMNS)
+    else:
+        latest_df = latest_df.iloc[0:0]
+    if not species_obs_df.empty:
+        latest_df = latest_df.loc[
+            ~latest_df["speciesCode"].isin(species_obs_df["speciesCode"])
+        ]
+    frames = [frame for frame in (latest_df, species_obs_df) if not frame.empty]
+    if not frames:
+        return pd.DataFrame()
+    return compact_observations(pd.concat(frames, ignore_index=True))
+
+
+def format_needs_data(needs_data, person_columns=()):
     needs_data["Species Information"] = (
-        "https://ebird.org/australia/species/" + needs_data["speciesCode"]
+        "https://ebird.org/australia/species/" + needs_data["speciesCode"].astype(str)
     )
     needs_data = needs_data.rename(
         columns={"comName": "Common Name", "sciName": "Scientific Name"}
     )
-    return needs_data[["Common Name", "Scientific Name", "Species Information"]]
+    return needs_data[
+        ["Common Name", "Scientific Name", "Species Information", *person_columns]
+    ]
+
+
+MAX_TOOLTIP_SPECIES = 10
 
 
+def _aggregate_by_location(region_needs_df, location_key, max_tooltip_species=None):
+    species_df = (
+        region_needs_df[["locName", "lat", "lng", "comName"]]
+        .assign(location_key=location_key, location_code=pd.factorize(location_key)[0])
+        .drop_duplicates(["location_code", "comName"])
+        .sort_values(["location_code", "comName"], kind="stable")
+    )
+
+    # Rows are now contiguous per location, so groups are found from boundaries
+    location_codes = species_df["location_code"].to_numpy()
+    is_first = np.ones(len(location_codes), dtype=bool)
+    is_first[1:] = location_codes[1:] != location_codes[:-1]
+    is_last = np.ones(len(location_codes), dtype=bool)
+    is_last[:-1] = is_first[1:]
+    starts = np.flatnonzero(is_first)
+    num_species = np.diff(np.r_[starts, len(species_df)])
+    rank = np.arange(len(species_df)) - np.repeat(starts, num_species)
+
+    shown = np.ones(len(species_df), dtype=bool)
+    suffixes = np.full(len(starts), "", dtype=object)
+    if max_tooltip_species is not None:
+        shown = rank < max_tooltip_species
+        is_last |= rank == max_tooltip_species - 1
+        hidden = num_species - max_tooltip_species
+        suffixes[hidden > 0] = [f"\n... and {n} more" for n in hidden[hidden > 0]]
+
+    rank_prefixes = np.array(
+        [f"{i + 1}. " for i in range(num_species.max(initial=0))], dtype=object
+    )
+    tooltip_lines = (
+        rank_prefixes[rank]
+        + species_df["comName"].to_numpy(dtype=object)
+        + np.where(is_last, "", "\n").astype(object)
+    )[shown]
+
+    region_loc_data = species_df.iloc[starts][["location_key", "locName", "lat", "lng"]]
+    return region_loc_data.assign(
+        tooltip_species=(
+            np.add.reduceat(tooltip_lines, np.flatnonzero(is_first[shown])) + suffixes
+            if len(starts)
+            else np.array([], dtype=object)
+        ),
+        num_species=num_species,
+    )
+
+
+@metrics.timed("aggregate_locations")
 def format_region_needs_data_for_map(region_needs_df):
-    region_loc_data = (
-        region_needs_df.groupby(["locName", "lat", "lng"])
-        .agg({"comName": lambda x: sorted(set(x))})  # Sort the 'comName' values
-        .reset_index()
+    # Hotspots are keyed on locId so float jitter in lat/lng cannot split them
+    if "locId" in region_needs_df.columns:
+        location_key = region_needs_df["locId"].to_numpy()
+    else:
+        location_key = region_needs_df.groupby(
+            ["locName", "lat", "lng"], sort=False, observed=True
+        ).ngroup()
+
+    region_loc_data = _aggregate_by_location(region_needs_df, location_key)
+    region_loc_data = region_loc_data.sort_values("locName", kind="stable")
+    return region_loc_data.reset_index(drop=True)[
+        ["locName", "lng", "lat", "tooltip_species", "num_species"]
+    ]
+
+
+def format_binned_region_needs_data_for_map(region_needs_df, cell_size):
+    # Grid cells of cell_size degrees, placed at the centroid of their hotspots
+    cell_key = np.floor(region_needs_df["lat"].to_numpy() / cell_size).astype(
+        np.int64
+    ) * 1_000_000 + np.floor(region_needs_df["lng"].to_numpy() / cell_size).astype(
+        np.int64
+    )
+    cells = _aggregate_by_location(region_needs_df, cell_key, MAX_TOOLTIP_SPECIES)
+
+    location_column = "locId" if "locId" in region_needs_df.columns else "locName"
+    hotspots = (
+        pd.DataFrame(
+            {
+                "cell": cell_key,
+                "location": region_needs_df[location_column].to_numpy(),
+                "lat": region_needs_df["lat"].to_numpy(),
+                "lng": region_needs_df["lng"].to_numpy(),
+            }
+        )
+        .drop_duplicates(["cell", "location"])
+        .groupby("cell")
+        .agg(
+            lat=("lat", "mean"),
+            lng=("lng", "mean"),
+            num_locations=("location", "size"),
+        )
+    )
+    cells = cells.drop(columns=["lat", "lng"]).join(hotspots, on="location_key")
+    cells["locName"] = cells["num_locations"].astype(str) + " locations"
+    cells = cells.sort_values("num_species", ascending=False, kind="stable")
+    return cells.reset_index(drop=True)[
+        ["locName", "lng", "lat", "tooltip_species", "num_species", "num_locations"]
+    ]
+
+
+LOCATION_DETAIL_COLUMNS = {
+    "comName": "Common Name",
+    "sciName": "Scientific Name",
+    "obsDt": "Date",
+    "howMany": "Count",
+}
+
+
+@metrics.timed("location_details")
+def format_location_details(region_needs_df):
+    details = region_needs_df.rename(columns=LOCATION_DETAIL_COLUMNS).reset_index(
+        drop=True
+    )
+    if "locationPrivate" not in details.columns:
+        details["locationPrivate"] = False
+
+    # One pass over the rows: summary per location plus each location's row positions
+    grouped = details.groupby("locId", sort=False, observed=True)
+    locations = grouped.agg(
+        locName=("locName", "first"),
+        lat=("lat", "first"),
+        lng=("lng", "first"),
+        locationPrivate=("locationPrivate", "first"),
+        num_species=("Common Name", "nunique"),
+    ).sort_values("locName", kind="stable")
+
+    hotspot_links = np.where(
+        locations["locationPrivate"].astype(bool),
+        "",
+        "&emsp;&LongRightArrow; Hotspot Information: https://ebird.org/australia/hotspot/"
+        + locations.index.astype(str)
+        + "<br>",
     )
-    region_loc_data["num_species"] = region_loc_data["comName"].apply(len)
-    region_loc_data["tooltip_species"] = region_loc_data["comName"].apply(
-        lambda x: "\n".join(f"{i+1}. {value}" for i, value in enumerate(x))
+    locations["links_html"] = (
+        hotspot_links
+        + "&emsp;&LongRightArrow; Directions: <a href='https://maps.google.com/?q="
+        + locations["lat"].astype(str)
+        + ","
+        + locations["lng"].astype(str)
+        + "' target='_blank'>Google Maps</a>"
     )
-    return region_loc_data[["locName", "lng", "lat", "tooltip_species", "num_species"]]
+    return locations, details, grouped.indices
@@ -1,48 +1,308 @@
+import contextlib
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
 import requests
 import pandas as pd
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlencode
+from urllib3.util.retry import Retry
 
+try:
+    from . import cache, metrics, scheduler, store
+except ImportError:
+    import cache
+    import metrics
+    import scheduler
+    import store
 
-def get_subnational_codes(parent_code, subnational_level, headers):
-    response = requests.get(
-        f"https://api.ebird.org/v2/ref/region/list/subnational{subnational_level}/{parent_code}",
-        headers=headers,
-    )
+# Point at a local stand-in such as benchmarks.fake_ebird for load testing
+API_BASE_URL = os.environ.get("LIFERS_EBIRD_API_URL", "https://api.ebird.org/v2")
 
-    if response.status_code != 200:
-        raise requests.RequestException(
-            f"API request failed with status code: {response.status_code}"
+# Sized to the per-species fan-out in lifers.main so pooled connections are reused
+POOL_SIZE = 32
+DEFAULT_TIMEOUT = (3.05, 30)  # (connect, read) seconds
+RETRY_STATUSES = (500, 502, 503, 504)
+
+# Areas are region codes or circles around a point, written "geo:<lat>,<lng>,<km>"
+GEO_PREFIX = "geo:"
+MAX_GEO_DISTANCE = 50
+
+# Region lists almost never change; observations go stale within minutes
+REFERENCE_TTL = 7 * 24 * 60 * 60
+OBSERVATION_TTL = 15 * 60
+
+
+class JitteredRetry(Retry):
+    def get_backoff_time(self):
+        backoff = super().get_backoff_time()
+        return random.uniform(0, backoff) if backoff > 0 else 0
+
+
+class EBirdClient:
+    def __init__(
+        self,
+        pool_size=POOL_SIZE,
+        timeout=DEFAULT_TIMEOUT,
+        max_retries=3,
+        backoff_factor=0.5,
+        latency_history=1000,
+    ):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.latencies = deque(maxlen=latency_history)
+
+        retry = JitteredRetry(
+            total=max_retries,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(["GET"]),
+            backoff_factor=backoff_factor,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size, max_retries=retry
         )
+        self.session = requests.Session()
+        self.session.headers.update({"Accept-Encoding": "gzip, deflate"})
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
 
-    return {region["name"]: region["code"] for region in response.json()}
+    def get(self, path, headers=None, params=None):
+        request_scheduler = scheduler.get_scheduler()
+        metrics.increment("scheduler_wait_seconds", request_scheduler.acquire())
+        status_code = None
+        adapt = False
+        start = time.perf_counter()
+        try:
+            response = self.session.get(
+                f"{API_BASE_URL}/{path}",
+                headers=headers,
+                params=params,
+                timeout=self.timeout,
+            )
+            status_code = response.status_code
+            adapt = True
+        except requests.RequestException:
+            # Only failures to reach eBird count towards backing off
+            adapt = True
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            self.latencies.append((path, status_code, seconds))
+            request_scheduler.release(status_code, adapt)
+        if metrics.enabled():
+            retries = getattr(response.raw, "retries", None)
+            metrics.record_request(
+                path,
+                status_code,
+                seconds,
+                len(response.content),
+                len(retries.history) if retries is not None else 0,
+            )
+        return response
 
+    def close(self):
+        self.session.close()
 
-def get_recent_observations(region_code, days_back, headers):
-    response = requests.get(
-        f"https://api.ebird.org/v2/data/obs/{region_code}/recent",
-        params={
-            "back": days_back,
-        },
-        headers=headers,
-    )
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = EBirdClient()
+    return _client
+
+
+def set_client(client):
+    global _client
+    with _client_lock:
+        previous, _client = _client, client
+    if previous is not None and previous is not client:
+        previous.close()
+
+
+_observation_store = None
+
+
+def get_observation_store():
+    return _observation_store
+
+
+def set_observation_store(observation_store):
+    global _observation_store
+    _observation_store = observation_store
+
+
+response_cache = cache.TTLCache(disk_dir=os.environ.get("LIFERS_CACHE_DIR"))
+in_flight = cache.SingleFlight()
+metrics.register_gauge("coalesced_requests", lambda: in_flight.coalesced)
+
+
+# Set while the cache warmer runs, so its requests go upstream and replace entries
+refreshing = contextvars.ContextVar("refreshing", default=False)
+
+
+@contextlib.contextmanager
+def refresh_cache():
+    token = refreshing.set(True)
+    try:
+        yield
+    finally:
+        refreshing.reset(token)
+
+
+def cached_response(key):
+    if refreshing.get():
+        return None
+    content = response_cache.get(key)
+    metrics.increment("cache_hits" if content is not None else "cache_misses")
+    return content
+
+
+def cache_key(path, params=None):
+    if not params:
+        return path
+    return f"{path}?{urlencode(sorted(params.items()))}"
+
+
+def _get_json(path, headers, params=None, ttl=OBSERVATION_TTL):
+    key = cache_key(path, params)
+    content = cached_response(key)
+    if content is None:
+        content = in_flight.do(key, lambda: _fetch(key, path, headers, params, ttl))
+    # Parsed per caller, so callers sharing one upstream call never share objects
+    return json.loads(content)
+
+
+def _fetch(key, path, headers, params, ttl):
+    response = get_client().get(path, headers=headers, params=params)
 
     if response.status_code != 200:
         raise requests.RequestException(
             f"API request failed with status code: {response.status_code}"
         )
 
-    return response.json()
+    response_cache.set(key, response.content, ttl)
+    return response.content
 
 
-def get_recent_species_obs(region_code, species_code, days_back, headers):
-    params = {"back": days_back}
-    response = requests.get(
-        f"https://api.ebird.org/v2/data/obs/{region_code}/recent/{species_code}",
-        headers=headers,
-        params=params,
+def get_subnational_regions(parent_code, subnational_level, headers):
+    return _get_json(
+        f"ref/region/list/subnational{subnational_level}/{parent_code}",
+        headers,
+        ttl=REFERENCE_TTL,
     )
 
-    if response.status_code != 200:
-        raise requests.RequestException(
-            f"API request failed with status code: {response.status_code}"
+
+def get_subnational_codes(parent_code, subnational_level, headers):
+    regions = get_subnational_regions(parent_code, subnational_level, headers)
+    return {region["name"]: region["code"] for region in regions}
+
+
+def geo_area(lat, lng, dist_km):
+    if not -90 <= lat <= 90 or not -180 <= lng <= 180:
+        raise ValueError(f"Invalid coordinates: {lat}, {lng}")
+    if not 0 < dist_km <= MAX_GEO_DISTANCE:
+        raise ValueError(f"Distance must be between 0 and {MAX_GEO_DISTANCE} km")
+    return f"{GEO_PREFIX}{lat:.4f},{lng:.4f},{dist_km:g}"
+
+
+def is_geo_area(area):
+    return area.startswith(GEO_PREFIX)
+
+
+def recent_request(area, days_back, species_code=None):
+    # Path and query string of an area's recent observations, or of one species
+    if is_geo_area(area):
+        lat, lng, dist_km = area[len(GEO_PREFIX) :].split(",")
+        path = "data/obs/geo/recent"
+        params = {"lat": lat, "lng": lng, "dist": dist_km, "back": days_back}
+    else:
+        path = f"data/obs/{area}/recent"
+        params = {"back": days_back}
+    if species_code is not None:
+        path = f"{path}/{species_code}"
+    return path, params
+
+
+def notable_request(area, days_back):
+    # Sightings eBird flags as rare for the area, or unusual there at this time
+    path, params = recent_request(area, days_back)
+    return f"{path}/notable", params
+
+
+def search_areas(region_code):
+    # A search covers one area or a tuple of them
+    if isinstance(region_code, str):
+        return (region_code,)
+    return tuple(region_code)
+
+
+def use_store(area):
+    # The store refreshes by region, and circles have no historic endpoint
+    return _observation_store is not None and not is_geo_area(area)
+
+
+def historic_path(region_code, date):
+    return f"data/obs/{region_code}/historic/{date.year}/{date.month}/{date.day}"
+
+
+def store_fresh_for():
+    # Stored observations are as good as cached ones, except to the cache warmer
+    return 0 if refreshing.get() else OBSERVATION_TTL
+
+
+def stored_observations(region_code, scope, days_back, fetch):
+    # Only the requests the observation store is missing go upstream
+    observation_store = _observation_store
+    now = observation_store.now()
+    requests_needed = observation_store.plan(
+        region_code, scope, days_back, now, store_fresh_for()
+    )
+    metrics.increment("store_requests", len(requests_needed))
+    for kind, value in requests_needed:
+        records = fetch(kind, value)
+        observation_store.merge(region_code, scope, records, kind, value, now)
+    return observation_store.query(region_code, scope, days_back, now)
+
+
+@metrics.timed("fetch_recent")
+def get_recent_observations(region_code, days_back, headers):
+    path, params = recent_request(region_code, days_back)
+    if not use_store(region_code):
+        return _get_json(path, headers, params=params)
+
+    def fetch(kind, value):
+        if kind == "recent":
+            return _get_json(path, headers, params={"back": value})
+        return _get_json(historic_path(region_code, value), headers)
+
+    return stored_observations(region_code, store.REGION_SCOPE, days_back, fetch)
+
+
+def get_notable_observations(region_code, days_back, headers):
+    path, params = notable_request(region_code, days_back)
+    return _get_json(path, headers, params=params)
+
+
+def get_recent_species_obs(region_code, species_code, days_back, headers):
+    path, params = recent_request(region_code, days_back, species_code)
+    if not use_store(region_code):
+        observations = _get_json(path, headers, params=params)
+    else:
+        observations = stored_observations(
+            region_code,
+            species_code,
+            days_back,
+            lambda kind, back: _get_json(path, headers, params={"back": back}),
         )
-    return pd.DataFrame(response.json())
+    return pd.DataFrame(observations)
@@ -0,0 +1,336 @@
+import asyncio
+import json
+import random
+import time
+from urllib.parse import urlencode
+import requests
+import pandas as pd
+
+try:
+    from . import cache, data, ebird_api, metrics, scheduler, store
+except ImportError:
+    import cache
+    import data
+    import ebird_api
+    import metrics
+    import scheduler
+    import store
+
+# Upper bound on in-flight requests for one fan-out, independent of thread count
+MAX_CONCURRENCY = 16
+# Rate limited requests are retried too, as urllib3 does for the sync client
+RETRY_STATUSES = ebird_api.RETRY_STATUSES + (429,)
+
+
+def _new_client(max_concurrency):
+    # tornado is only needed once a search fans out, not to draw the first page
+    from tornado.httpclient import AsyncHTTPClient
+
+    return AsyncHTTPClient(force_instance=True, max_clients=max_concurrency)
+
+
+async def _get(
+    client,
+    path,
+    headers,
+    params=None,
+    ttl=ebird_api.OBSERVATION_TTL,
+    max_retries=3,
+    backoff_factor=0.5,
+):
+    key = ebird_api.cache_key(path, params)
+    content = ebird_api.cached_response(key)
+    if content is not None:
+        return json.loads(content)
+
+    # Share an identical request already in flight in any session or thread
+    while True:
+        future, leader = ebird_api.in_flight.begin(key)
+        if leader:
+            break
+        try:
+            return json.loads(await asyncio.shield(asyncio.wrap_future(future)))
+        except cache.Abandoned:
+            continue
+
+    try:
+        content = await _fetch(
+            client, key, path, headers, params, ttl, max_retries, backoff_factor
+        )
+    except BaseException as error:
+        ebird_api.in_flight.finish(key, future, error=error)
+        raise
+    ebird_api.in_flight.finish(key, future, content)
+    return json.loads(content)
+
+
+def _retry_after(response):
+    # Only the delay-seconds form is honoured; an HTTP date falls back to backoff
+    try:
+        return max(0.0, float(response.headers.get("Retry-After")))
+    except (TypeError, ValueError):
+        return None
+
+
+async def _fetch(client, key, path, headers, params, ttl, max_retries, backoff_factor):
+    from tornado.httpclient import HTTPClientError, HTTPRequest
+
+    url = f"{ebird_api.API_BASE_URL}/{path}"
+    if params:
+        url = f"{url}?{urlencode(params)}"
+    connect_timeout, request_timeout = ebird_api.DEFAULT_TIMEOUT
+    request = HTTPRequest(
+        url,
+        headers=headers,
+        connect_timeout=connect_timeout,
+        request_timeout=request_timeout,
+        decompress_response=True,
+    )
+
+    # Each attempt takes its own slot from the process-wide scheduler
+    request_scheduler = scheduler.get_scheduler()
+    start = time.perf_counter()
+    waited = 0.0
+    for attempt in range(max_retries + 1):
+        final_attempt = attempt == max_retries
+        waited += await request_scheduler.acquire_async()
+        status_code = None
+        adapt = True
+        try:
+            response = await client.fetch(request, raise_error=False)
+            status_code = response.code
+        except asyncio.CancelledError:
+            # Abandoned by the caller, e.g. a rerun closing the stream, not refused
+            adapt = False
+            raise
+        except (OSError, HTTPClientError) as error:
+            if final_attempt:
+                raise requests.ConnectionError(str(error))
+        else:
+            if response.code not in RETRY_STATUSES or final_attempt:
+                break
+        finally:
+            request_scheduler.release(status_code, adapt)
+        delay = None if status_code is None else _retry_after(response)
+        if delay is None:
+            delay = random.uniform(0, backoff_factor * 2**attempt)
+        await asyncio.sleep(delay)
+
+    metrics.increment("scheduler_wait_seconds", waited)
+    metrics.record_request(
+        path,
+        response.code,
+        time.perf_counter() - start - waited,
+        len(response.body),
+        attempt,
+    )
+    if response.code != 200:
+        raise requests.RequestException(
+            f"API request failed with status code: {response.code}"
+        )
+    ebird_api.response_cache.set(key, response.body, ttl)
+    return response.body
+
+
+async def get_subnational_codes(client, parent_code, subnational_level, headers):
+    regions = await _get(
+        client,
+        f"ref/region/list/subnational{subnational_level}/{parent_code}",
+        headers,
+        ttl=ebird_api.REFERENCE_TTL,
+    )
+    return {region["name"]: region["code"] for region in regions}
+
+
+async def _stored_observations(region_code, scope, days_back, fetch):
+    observation_store = ebird_api.get_observation_store()
+    now = observation_store.now()
+    requests_needed = observation_store.plan(
+        region_code, scope, days_back, now, ebird_api.store_fresh_for()
+    )
+    metrics.increment("store_requests", len(requests_needed))
+    for kind, value in requests_needed:
+        records = await fetch(kind, value)
+        observation_store.merge(region_code, scope, records, kind, value, now)
+    return observation_store.query(region_code, scope, days_back, now)
+
+
+async def get_recent_observations(client, region_code, days_back, headers):
+    path, params = ebird_api.recent_request(region_code, days_back)
+    if not ebird_api.use_store(region_code):
+        return await _get(client, path, headers, params)
+
+    async def fetch(kind, value):
+        if kind == "recent":
+            return await _get(client, path, headers, {"back": value})
+        return await _get(client, ebird_api.historic_path(region_code, value), headers)
+
+    return await _stored_observations(region_code, store.REGION_SCOPE, days_back, fetch)
+
+
+async def get_recent_species_obs(client, region_code, species_code, days_back, headers):
+    path, params = ebird_api.recent_request(region_code, days_back, species_code)
+    if not ebird_api.use_store(region_code):
+        observations = await _get(client, path, headers, params)
+    else:
+
+        async def fetch(kind, back):
+            return await _get(client, path, headers, {"back": back})
+
+        observations = await _stored_observations(
+            region_code, species_code, days_back, fetch
+        )
+    return pd.DataFrame(observations)
+
+
+async def get_species_obs(client, areas, species_code, days_back, headers):
+    # One species across every area it was reported in, merged by location
+    if len(areas) == 1:
+        return await get_recent_species_obs(
+            client, areas[0], species_code, days_back, headers
+        )
+    frames = await asyncio.gather(
+        *(
+            get_recent_species_obs(client, area, species_code, days_back, headers)
+            for area in areas
+        )
+    )
+    return data.merge_observations(frames, ["speciesCode", "locId"])
+
+
+async def gather_recent_observations(
+    areas, days_back, headers, max_concurrency=MAX_CONCURRENCY
+):
+    client = _new_client(max_concurrency)
+    try:
+        return await asyncio.gather(
+            *(
+                get_recent_observations(client, area, days_back, headers)
+                for area in areas
+            )
+        )
+    finally:
+        client.close()
+
+
+def fetch_recent_observations(
+    areas, days_back, headers, max_concurrency=MAX_CONCURRENCY
+):
+    return asyncio.run(
+        gather_recent_observations(areas, days_back, headers, max_concurrency)
+    )
+
+
+async def gather_species_obs(
+    region_code,
+    species_codes,
+    days_back,
+    headers,
+    max_concurrency=MAX_CONCURRENCY,
+    species_areas=None,
+):
+    semaphore = asyncio.Semaphore(max_concurrency)
+    client = _new_client(max_concurrency)
+    areas = ebird_api.search_areas(region_code)
+    species_areas = species_areas or {}
+
+    async def bounded(species_code):
+        async with semaphore:
+            return await get_species_obs(
+                client,
+                species_areas.get(species_code, areas),
+                species_code,
+                days_back,
+                headers,
+            )
+
+    try:
+        return await asyncio.gather(
+            *(bounded(species_code) for species_code in species_codes)
+        )
+    finally:
+        client.close()
+
+
+def fetch_species_obs(
+    region_code,
+    species_codes,
+    days_back,
+    headers,
+    max_concurrency=MAX_CONCURRENCY,
+    species_areas=None,
+):
+    return asyncio.run(
+        gather_species_obs(
+            region_code,
+            species_codes,
+            days_back,
+            headers,
+            max_concurrency,
+            species_areas,
+        )
+    )
+
+
+async def stream_species_obs_async(
+    region_code,
+    species_codes,
+    days_back,
+    headers,
+    max_concurrency=MAX_CONCURRENCY,
+    species_areas=None,
+):
+    semaphore = asyncio.Semaphore(max_concurrency)
+    client = _new_client(max_concurrency)
+    areas = ebird_api.search_areas(region_code)
+    species_areas = species_areas or {}
+
+    # A failing species, e.g. one whose body is not JSON, is yielded with its error
+    # instead of aborting the stream. Cancellation is not an Exception, so closing
+    # the stream still cancels every pending species.
+    async def bounded(species_code):
+        async with semaphore:
+            try:
+                result = await get_species_obs(
+                    client,
+                    species_areas.get(species_code, areas),
+                    species_code,
+                    days_back,
+                    headers,
+                )
+            except Exception as error:
+                return species_code, None, error
+            return species_code, result, None
+
+    tasks = [asyncio.ensure_future(bounded(code)) for code in species_codes]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        client.close()
+
+
+def stream_species_obs(
+    region_code,
+    species_codes,
+    days_back,
+    headers,
+    max_concurrency=MAX_CONCURRENCY,
+    species_areas=None,
+):
+    loop = asyncio.new_event_loop()
+    stream = stream_species_obs_async(
+        region_code, species_codes, days_back, headers, max_concurrency, species_areas
+    )
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(stream.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        loop.run_until_complete(stream.aclose())
+        loop.close()
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+
+try:
+    from . import taxonomy
+except ImportError:
+    import taxonomy
+
+NEEDED_BY_COLUMN = "Needed By"
+
+
+def species_index():
+    return taxonomy.get_index().code_index
+
+
+def lifelist_matrix(lifelists):
+    # Boolean (taxonomy species x birders) matrix of who has seen what
+    index = species_index()
+    matrix = np.zeros((len(index), len(lifelists)), dtype=bool)
+    for column, lifelist_df in enumerate(lifelists.values()):
+        positions = index.get_indexer(lifelist_df["Species Code"].dropna())
+        matrix[positions[positions >= 0], column] = True
+    return matrix
+
+
+def needed_matrix(species_codes, lifelists):
+    positions = species_index().get_indexer(species_codes)
+    seen = lifelist_matrix(lifelists)[positions]
+    # Codes missing from the taxonomy cannot be on anyone's lifelist
+    seen[positions < 0] = False
+    return ~seen
+
+
+def group_needs(recent_obs_df, lifelists, min_needed=1):
+    names = list(lifelists)
+    if recent_obs_df.empty:
+        columns = {name: pd.Series(dtype=bool) for name in names}
+        columns[NEEDED_BY_COLUMN] = pd.Series(dtype=int)
+        return recent_obs_df.assign(**columns)
+
+    needed = needed_matrix(recent_obs_df["speciesCode"], lifelists)
+    needed_count = needed.sum(axis=1)
+    mask = needed_count >= min_needed
+
+    needs_df = recent_obs_df.loc[mask].reset_index(drop=True)
+    for column, name in enumerate(names):
+        needs_df[name] = needed[mask, column]
+    needs_df[NEEDED_BY_COLUMN] = needed_count[mask]
+    return needs_df
+
+
+def needed_by_labels(needs_df, names):
+    species_needs_df = needs_df.drop_duplicates("speciesCode")
+    flags = species_needs_df[names].to_numpy()
+    labels = [", ".join(np.array(names)[row]) for row in flags]
+    return pd.Series(labels, index=species_needs_df["speciesCode"].to_numpy())
+
+
+def label_needed_by(region_needs_df, needs_df, names):
+    labels = needed_by_labels(needs_df, names)
+    labelled_df = region_needs_df.copy()
+    labelled_df["comName"] = (
+        labelled_df["comName"].astype(str)
+        + " ("
+        + labelled_df["speciesCode"].astype(str).map(labels).fillna("")
+        + ")"
+    )
+    return labelled_df
@@ -1,10 +1,378 @@
 import os
+import time
+import startup
 import streamlit as st
 import pandas as pd
-import concurrent.futures
-import ebird_api
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 import data
+import ebird_api
+import group
+import memory
+import metrics
+import pipeline
+import regions
+import scheduler
+import store
 import visualise
+import warmer
+
+metrics.register_gauge(
+    "first_paint_seconds", lambda: startup.marks().get("first_paint", 0.0)
+)
+
+# Minimum seconds between map redraws while species results stream in
+RENDER_INTERVAL = 0.5
+LOCATIONS_PER_PAGE = 20
+RANKING_LABELS = {"recency": "Most recently seen", "rarity": "Rarity (eBird notable)"}
+
+
+@metrics.timed("render_locations")
+def render_locations(region_loc_data, map_data, map_placeholder, summary_placeholder):
+    map_placeholder.pydeck_chart(visualise.map_deck(map_data))
+    summary_placeholder.dataframe(
+        region_loc_data.sort_values("num_species", ascending=False)[
+            ["locName", "num_species"]
+        ].rename(columns={"locName": "Location", "num_species": "Needed Species"}),
+        use_container_width=True,
+        hide_index=True,
+    )
+
+
+def render_diagnostics():
+    # Only shown when the app is started with LIFERS_METRICS=1
+    if not metrics.enabled():
+        return
+
+    current = metrics.snapshot()
+    with st.sidebar.expander("Diagnostics"):
+        st.dataframe(
+            pd.DataFrame.from_dict(current["spans"], orient="index").rename_axis(
+                "Stage"
+            ),
+            use_container_width=True,
+        )
+        st.dataframe(
+            pd.Series(current["counters"], name="Count").rename_axis("Counter"),
+            use_container_width=True,
+        )
+        latencies = pd.DataFrame(
+            metrics.species_latencies(), columns=["Species", "Status", "Seconds"]
+        )
+        if not latencies.empty:
+            st.caption("Slowest species requests")
+            st.dataframe(
+                latencies.nlargest(10, "Seconds"),
+                use_container_width=True,
+                hide_index=True,
+            )
+        st.caption("Startup milestones (seconds)")
+        st.dataframe(
+            pd.Series(startup.marks(), name="Seconds").rename_axis("Milestone"),
+            use_container_width=True,
+        )
+        st.caption("Request scheduler")
+        st.dataframe(
+            pd.Series(scheduler.get_scheduler().stats(), name="Value").rename_axis(
+                "Statistic"
+            ),
+            use_container_width=True,
+        )
+        st.caption(
+            f"Response cache hit ratio: {ebird_api.response_cache.stats()['hit_ratio']:.0%}"
+        )
+        st.caption("Memory held per session (MB)")
+        st.dataframe(
+            pd.DataFrame.from_dict(memory.get_accountant().usage(), orient="index")
+            .div(memory.MB)
+            .rename_axis("Session"),
+            use_container_width=True,
+        )
+        if warmer.get_warmer() is not None:
+            st.caption("Cache warmer")
+            st.dataframe(
+                pd.Series(warmer.get_warmer().stats(), name="Value").rename_axis(
+                    "Statistic"
+                ),
+                use_container_width=True,
+            )
+        st.download_button(
+            "Download Prometheus metrics",
+            metrics.to_prometheus(),
+            file_name="lifers.prom",
+            mime="text/plain",
+        )
+
+    metrics_file = os.environ.get("LIFERS_METRICS_FILE")
+    if metrics_file:
+        # A metrics export must never take the page down with it
+        try:
+            metrics.write_prometheus(metrics_file)
+        except OSError as e:
+            metrics.logger.warning(f"Could not write {metrics_file}: {e}")
+
+
+def lifelist_names(csv_files):
+    names = []
+    for csv_file in csv_files:
+        name = os.path.splitext(csv_file.name)[0]
+        suffix = 2
+        while name in names:
+            name = f"{os.path.splitext(csv_file.name)[0]} ({suffix})"
+            suffix += 1
+        names.append(name)
+    return names
+
+
+def find_needs(csv_files, group_names, min_needed, region_code, days_back, headers):
+    # Load lifelist CSVs; each pipeline stage is memoized on its inputs' content
+    lifelists_bytes = tuple(csv_file.getvalue() for csv_file in csv_files)
+    lifelist_dfs = [
+        pipeline.load_lifelist(lifelist_bytes) for lifelist_bytes in lifelists_bytes
+    ]
+
+    if any(lifelist_df.empty for lifelist_df in lifelist_dfs):
+        return None
+
+    if group_names:
+        st.subheader("Species in your group's lifelists:")
+        st.dataframe(
+            pd.DataFrame(
+                {
+                    "Birder": group_names,
+                    "Species": [len(lifelist_df) for lifelist_df in lifelist_dfs],
+                }
+            ),
+            use_container_width=True,
+            hide_index=True,
+        )
+        return pipeline.compute_group_needs(
+            lifelists_bytes,
+            tuple(group_names),
+            region_code,
+            days_back,
+            headers,
+            min_needed,
+        )
+
+    st.subheader("Species in your lifelist:")
+    st.dataframe(
+        lifelist_dfs[0][
+            [
+                "Species Number",
+                "Common Name",
+                "Scientific Name",
+                "Species Code",
+                "Category",
+            ]
+        ],
+        use_container_width=True,
+        hide_index=True,
+    )
+
+    # Get needed species from recent observations for the region
+    return pipeline.compute_needs(lifelists_bytes[0], region_code, days_back, headers)
+
+
+def show_every_sighting(species_codes):
+    chosen = st.session_state.get("chosen_species", [])
+    st.session_state["chosen_species"] = chosen + [
+        species_code for species_code in species_codes if species_code not in chosen
+    ]
+
+
+def show_needs(
+    csv_files,
+    group_names,
+    min_needed,
+    region_code,
+    days_back,
+    headers,
+    top_species=pipeline.TOP_SPECIES,
+    ranking="recency",
+):
+    with metrics.span("find_needs"):
+        needs_df = find_needs(
+            csv_files, group_names, min_needed, region_code, days_back, headers
+        )
+
+    if needs_df is not None:
+        memory.get_accountant().track("needed species", needs_df)
+
+    if needs_df is None:
+        st.warning("No species found in the lifelist CSV.")
+    elif needs_df.shape[0] > 0:
+        st.subheader(f"Needed species observed in the past {days_back} days:")
+        st.dataframe(
+            data.format_needs_data(needs_df, group_names),
+            column_config={
+                "Species Information": st.column_config.LinkColumn(
+                    "Species Information",
+                    help="eBird species information link",
+                )
+            },
+            hide_index=True,
+            use_container_width=True,
+        )
+
+        # The map starts from each need's latest sighting in the region list. Every
+        # recent sighting is fetched for the top species and for those chosen
+        # below, streamed in as each species completes.
+        st.subheader("Locations of all needed species observed:")
+        ranked_codes = pipeline.rank_species(
+            needs_df, region_code, days_back, headers, ranking
+        )
+        species_names = dict(
+            zip(needs_df["speciesCode"].astype(str), needs_df["comName"].astype(str))
+        )
+        # Species chosen before the top count was raised are no longer options
+        options = ranked_codes[top_species:]
+        st.session_state["chosen_species"] = [
+            species_code
+            for species_code in st.session_state.get("chosen_species", [])
+            if species_code in options
+        ]
+        chosen = st.multiselect(
+            "Show every recent sighting of",
+            options,
+            format_func=lambda species_code: species_names.get(
+                species_code, species_code
+            ),
+            key="chosen_species",
+        )
+        species_codes = ranked_codes[:top_species] + chosen
+        progress_bar = st.progress(0.0, text="Fetching needed species observations...")
+        map_placeholder = st.empty()
+        summary_placeholder = st.empty()
+
+        progress = {"completed": 0, "rendered": 0, "time": 0.0, "bytes": 0}
+
+        def label_needed_by(region_needs_df):
+            if not group_names:
+                return region_needs_df
+            return group.label_needed_by(region_needs_df, needs_df, group_names)
+
+        latest_needs_df = data.combine_species_obs(needs_df, pd.DataFrame())
+        if not latest_needs_df.empty:
+            latest_needs_df = label_needed_by(latest_needs_df)
+            latest_loc_data = data.format_region_needs_data_for_map(latest_needs_df)
+            render_locations(
+                latest_loc_data,
+                visualise.map_layer_data(latest_needs_df, latest_loc_data),
+                map_placeholder,
+                summary_placeholder,
+            )
+
+        def on_result(species_code, result, error, results):
+            progress["completed"] += 1
+            completed = progress["completed"]
+            # A search too large for the session is stopped while it streams in
+            if error is None:
+                progress["bytes"] += memory.value_bytes(result)
+                memory.get_accountant().track_bytes(
+                    "species observations", progress["bytes"]
+                )
+            progress_bar.progress(
+                completed / len(species_codes),
+                text=f"Fetched {completed} of {len(species_codes)} needed species",
+            )
+            if (
+                len(results) > progress["rendered"]
+                and time.monotonic() - progress["time"] > RENDER_INTERVAL
+            ):
+                partial_needs_df = label_needed_by(
+                    data.combine_species_obs(
+                        needs_df, pd.concat(results, ignore_index=True)
+                    )
+                )
+                partial_loc_data = data.format_region_needs_data_for_map(
+                    partial_needs_df
+                )
+                render_locations(
+                    partial_loc_data,
+                    visualise.map_layer_data(partial_needs_df, partial_loc_data),
+                    map_placeholder,
+                    summary_placeholder,
+                )
+                progress.update(rendered=len(results), time=time.monotonic())
+
+        try:
+            region_needs_df, failed_species = pipeline.lazy_species_obs(
+                region_code,
+                needs_df,
+                species_codes,
+                days_back,
+                headers,
+                on_result=on_result,
+            )
+        finally:
+            progress_bar.empty()
+        if len(species_codes) < len(ranked_codes):
+            st.caption(
+                f"Every recent sighting is shown for {len(species_codes)} of "
+                f"{len(ranked_codes)} needed species; the others are shown where "
+                "they were last seen."
+            )
+
+        if failed_species:
+            st.warning(
+                f"Could not fetch observations for {len(failed_species)} "
+                f"species: {', '.join(failed_species)}"
+            )
+        if region_needs_df.empty:
+            st.info("No location data found for unseen species.")
+            return
+        region_needs_df = label_needed_by(region_needs_df)
+        memory.get_accountant().track("species observations", region_needs_df)
+
+        render_locations(
+            pipeline.aggregate_locations(region_needs_df),
+            pipeline.map_layer_data(region_needs_df),
+            map_placeholder,
+            summary_placeholder,
+        )
+
+        # Per-location details, built only for the page being viewed
+        locations, location_details, location_rows = pipeline.location_details(
+            region_needs_df
+        )
+        st.subheader("Needed species by location:")
+        page_count = -(-len(locations) // LOCATIONS_PER_PAGE)
+        page = 1
+        if page_count > 1:
+            page = st.number_input(
+                f"Page (of {page_count})",
+                min_value=1,
+                max_value=page_count,
+                step=1,
+            )
+        start = (page - 1) * LOCATIONS_PER_PAGE
+        page_locations = locations.iloc[start : start + LOCATIONS_PER_PAGE]
+
+        for location_id, location in page_locations.iterrows():
+            with st.expander(
+                f"{location['locName']} ({location['num_species']} needed species)"
+            ):
+                st.markdown(location["links_html"], unsafe_allow_html=True)
+                rows = location_details.iloc[location_rows[location_id]]
+                st.dataframe(
+                    rows[["Common Name", "Scientific Name", "Date", "Count"]],
+                    use_container_width=True,
+                    hide_index=True,
+                )
+                latest_only = [
+                    species_code
+                    for species_code in rows["speciesCode"].astype(str).unique()
+                    if species_code not in species_codes
+                ]
+                if latest_only:
+                    st.button(
+                        "Show every recent sighting of these species",
+                        key=f"show-every-sighting-{location_id}",
+                        on_click=show_every_sighting,
+                        args=(latest_only,),
+                    )
+    else:
+        st.info("No recent observations found for unseen species.")
 
 
 def main():
@@ -19,6 +387,15 @@ def main():
 
     headers = {"X-eBirdApiToken": api_key}
 
+    # Repeat searches of a region only fetch what changed since the last one
+    store_path = os.environ.get("LIFERS_OBSERVATION_STORE", store.STORE_PATH)
+    if store_path and ebird_api.get_observation_store() is None:
+        ebird_api.set_observation_store(store.ObservationStore(store_path))
+
+    # Popular searches are refreshed in the background when LIFERS_WARMER=1
+    if os.environ.get("LIFERS_WARMER") == "1" and warmer.get_warmer() is None:
+        warmer.set_warmer(warmer.Warmer(headers).start())
+
     st.set_page_config(layout="wide")
     st.title("Lifers: An eBird Needs Finder")
 
@@ -38,23 +415,69 @@ def main():
         index=country_list.index("Australia"),
     )
 
-    # Subnational region selection
-    subnational1_codes = ebird_api.get_subnational_codes(
-        country_codes[selected_country], subnational_level=1, headers=headers
+    # Region selectors are filled in once the rest of the sidebar has been drawn,
+    # since the region index may need to be fetched
+    region_selectors = st.sidebar.container()
+
+    st.sidebar.divider()
+
+    # Select the number of days back to collect observations
+    days_back = st.sidebar.number_input(
+        "How many days of observations do you want to retrieve?", min_value=1, step=1
+    )
+    st.sidebar.divider()
+
+    # Only the top species are fetched in full up front; the rest on request
+    top_species = st.sidebar.number_input(
+        "For how many needed species should every recent sighting be shown?",
+        min_value=0,
+        value=pipeline.TOP_SPECIES,
+        step=1,
+    )
+    ranking = st.sidebar.selectbox(
+        "Choose those species by",
+        pipeline.SPECIES_RANKINGS,
+        format_func=RANKING_LABELS.get,
     )
+    st.sidebar.divider()
+
+    # File uploader for lifelist CSVs; several files plan needs for a group of birders
+    csv_files = st.sidebar.file_uploader(
+        "Upload your lifelist CSV file (or one per birder for a group)",
+        type=["csv"],
+        accept_multiple_files=True,
+    )
+    group_names = lifelist_names(csv_files) if len(csv_files) > 1 else []
+    min_needed = 1
+    if group_names:
+        min_needed = st.sidebar.slider(
+            "Needed by at least how many birders?",
+            min_value=1,
+            max_value=len(group_names),
+            value=1,
+        )
+
+    find_button_pressed = st.sidebar.button(
+        "Find Species", type="primary", use_container_width=True
+    )
+    startup.mark("first_paint")
+
+    # Subnational region selection, answered from the locally persisted region index
+    region_index = regions.get_region_index(
+        country_codes[selected_country], headers=headers
+    )
+    subnational1_codes = region_index.subnational1_codes
     subnational1_names = sorted(list(subnational1_codes.keys()))
-    selected_subnational1 = st.sidebar.selectbox(
+    selected_subnational1 = region_selectors.selectbox(
         "Select a region", [""] + subnational1_names
     )
 
     # Sub-subnational region selection for level 2 subregions
     if selected_subnational1 != "":
         region_code = subnational1_codes[selected_subnational1]
-        subnational2_codes = ebird_api.get_subnational_codes(
-            region_code, subnational_level=2, headers=headers
-        )
+        subnational2_codes = region_index.subnational2_codes(region_code)
         subnational2_names = sorted(list(subnational2_codes.keys()))
-        selected_subnational2 = st.sidebar.selectbox(
+        selected_subnational2 = region_selectors.selectbox(
             "Select a sub-region", [""] + subnational2_names
         )
         if selected_subnational2 != "":
@@ -62,135 +485,64 @@ def main():
     else:
         region_code = country_codes[selected_country]
 
-    st.sidebar.divider()
-
-    # Select the number of days back to collect observations
-    days_back = st.sidebar.number_input(
-        "How many days of observations do you want to retrieve?", min_value=1, step=1
+    # Further regions, e.g. across a state border, are searched as one
+    extra_regions = region_selectors.multiselect(
+        "Also search these regions",
+        [name for name in subnational1_names if name != selected_subnational1],
     )
-    st.sidebar.divider()
+    areas = [region_code] + [subnational1_codes[name] for name in extra_regions]
 
-    # File uploader for lifelist CSV
-    csv_file = st.sidebar.file_uploader("Upload your lifelist CSV file", type=["csv"])
-
-    find_button_pressed = st.sidebar.button(
-        "Find Species", type="primary", use_container_width=True
-    )
-
-    if find_button_pressed and csv_file is not None:
-        # Load lifelist CSV
-        lifelist_df = data.load_lifelist_csv(csv_file)
+    # A circle around a point replaces the whole country when no region is chosen
+    if region_selectors.checkbox("Search near a location"):
+        latitude = region_selectors.number_input(
+            "Latitude", min_value=-90.0, max_value=90.0, value=-37.8136, format="%.4f"
+        )
+        longitude = region_selectors.number_input(
+            "Longitude",
+            min_value=-180.0,
+            max_value=180.0,
+            value=144.9631,
+            format="%.4f",
+        )
+        radius = region_selectors.slider(
+            "Radius (km)", min_value=1, max_value=ebird_api.MAX_GEO_DISTANCE, value=25
+        )
+        geo_area = ebird_api.geo_area(latitude, longitude, radius)
+        if selected_subnational1 == "" and not extra_regions:
+            areas = [geo_area]
+        else:
+            areas.append(geo_area)
+    region_code = areas[0] if len(areas) == 1 else tuple(areas)
+    startup.mark("regions_ready")
 
-        # Extract unique species from lifelist
-        unique_species = lifelist_df["Species Code"].unique()
+    # Keep showing the last search while its results are paged or explored
+    if find_button_pressed:
+        st.session_state["search"] = (region_code, days_back, min_needed)
+        st.session_state["chosen_species"] = []
+        if warmer.get_warmer() is not None:
+            warmer.get_warmer().record_query(region_code, days_back)
 
-        if len(unique_species) == 0:
-            st.warning("No species found in the lifelist CSV.")
-        else:
-            st.subheader("Species in your lifelist:")
-            st.dataframe(
-                lifelist_df[
-                    [
-                        "Species Number",
-                        "Common Name",
-                        "Scientific Name",
-                        "Species Code",
-                        "Category",
-                    ]
-                ],
-                use_container_width=True,
-                hide_index=True,
+    if "search" in st.session_state and csv_files:
+        region_code, days_back, min_needed = st.session_state["search"]
+        # Each run replaces the frames the session held for the previous one
+        memory.get_accountant().release()
+        try:
+            show_needs(
+                csv_files,
+                group_names,
+                min_needed,
+                region_code,
+                days_back,
+                headers,
+                top_species,
+                ranking,
             )
-
-            # Get recent observations for the region
-            recent_observations = ebird_api.get_recent_observations(
-                region_code, days_back, headers=headers
+        except memory.MemoryBudgetExceeded as e:
+            memory.get_accountant().release()
+            st.error(
+                f"This search is too large to show: {e}. "
+                "Try a smaller region or fewer days."
             )
-
-            if recent_observations is not None:
-                recent_obs_df = pd.DataFrame(recent_observations)
-                needs_df = recent_obs_df.loc[
-                    ~recent_obs_df["speciesCode"].isin(unique_species)
-                ]
-                needs_df.reset_index(drop=True, inplace=True)
-
-                if needs_df.shape[0] > 0:
-                    st.subheader(
-                        f"Needed species observed in the past {days_back} days:"
-                    )
-                    st.dataframe(
-                        data.format_needs_data(needs_df),
-                        column_config={
-                            "Species Information": st.column_config.LinkColumn(
-                                "Species Information",
-                                help="eBird species information link",
-                            )
-                        },
-                        hide_index=True,
-                        use_container_width=True,
-                    )
-
-                    # Recent needs by location
-                    with concurrent.futures.ThreadPoolExecutor() as executor:
-                        # Submit API call tasks and retrieve futures
-                        futures = [
-                            executor.submit(
-                                ebird_api.get_recent_species_obs,
-                                region_code,
-                                species_code,
-                                days_back,
-                                headers=headers,
-                            )
-                            for species_code in needs_df["speciesCode"].unique()
-                        ]
-                        # Retrieve results from futures
-                        results = [future.result() for future in futures]
-
-                    region_needs_df = pd.concat(results, ignore_index=True)
-                    region_loc_data = data.format_region_needs_data_for_map(
-                        region_needs_df
-                    )
-
-                    st.subheader("Locations of all needed species observed:")
-                    chart = visualise.map_deck(region_loc_data)
-                    st.pydeck_chart(chart)
-
-                    for location in sorted(region_needs_df["locName"].unique()):
-                        location_data = region_needs_df.loc[
-                            region_needs_df["locName"] == location
-                        ]
-                        location_data.reset_index(drop=True, inplace=True)
-                        location_data = location_data.rename(
-                            columns={
-                                "comName": "Common Name",
-                                "sciName": "Scientific Name",
-                                "obsDt": "Date",
-                                "howMany": "Count",
-                            }
-                        )
-
-                        location_id = location_data["locId"][0]
-
-                        location_link = ""
-                        if not location_data["locationPrivate"][0]:
-                            location_link = f"&emsp;&LongRightArrow; Hotspot Information: https://ebird.org/australia/hotspot/{location_id}<br>"
-
-                        st.markdown(
-                            f"<br>{location}:<br>"
-                            + location_link
-                            + f"&emsp;&LongRightArrow; Directions: <a href='https://maps.google.com/?q={location_data['lat'][0]},{location_data['lng'][0]}' target='_blank'>Google Maps</a>",
-                            unsafe_allow_html=True,
-                        )
-
-                        st.dataframe(
-                            location_data[
-                                ["Common Name", "Scientific Name", "Date", "Count"]
-                            ],
-                            use_container_width=True,
-                            hide_index=True,
-                        )
-                else:
-                    st.info("No recent observations found for unseen species.")
     else:
         st.info(
             "Please select your preferences from the sidebar and upload a lifelist CSV file."
@@ -198,4 +550,9 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    # Requests are queued fairly per browser session in the shared scheduler
+    ctx = get_script_run_ctx()
+    with scheduler.session(ctx.session_id if ctx else "default"):
+        with metrics.span("run"):
+            main()
+    render_diagnostics()
@@ -0,0 +1,135 @@
+import os
+import threading
+import time
+import numpy as np
+import pandas as pd
+
+try:
+    from . import metrics, scheduler
+except ImportError:
+    import metrics
+    import scheduler
+
+MB = 2**20
+# Frames one browser session may hold for a search, e.g. a country-wide fan-out
+SESSION_BUDGET = int(float(os.environ.get("LIFERS_SESSION_MEMORY_MB", 256)) * MB)
+# Sessions end without telling the server, so untouched ones are forgotten
+IDLE_TTL = 60 * 60
+
+_accountant = None
+_accountant_lock = threading.Lock()
+
+
+def value_bytes(value):
+    if isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+        usage = value.memory_usage(index=True, deep=True)
+        return int(usage.sum() if isinstance(usage, pd.Series) else usage)
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(value_bytes(item) for item in value)
+    if isinstance(value, dict):
+        return sum(value_bytes(item) for item in value.values())
+    return 0
+
+
+class MemoryBudgetExceeded(Exception):
+    def __init__(self, name, needed, budget):
+        self.name = name
+        self.needed = needed
+        self.budget = budget
+        super().__init__(
+            f"{name} would take the session to {needed / MB:.1f} MB, "
+            f"over its {budget / MB:.1f} MB budget"
+        )
+
+
+# Bytes of the frames each session is holding, by name. A frame tracked under an
+# existing name replaces it, and a frame that would take the session over its
+# budget is refused, so the caller can drop the query instead of the server
+# running out of memory.
+class MemoryAccountant:
+    def __init__(self, budget=SESSION_BUDGET, idle_ttl=IDLE_TTL, clock=time.monotonic):
+        self.budget = budget
+        self.idle_ttl = idle_ttl
+        self._clock = clock
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self.refused = 0
+        self.evicted = 0
+
+    def _evict_idle(self, now):
+        idle = [
+            session
+            for session, entry in self._sessions.items()
+            if now - entry["used_at"] > self.idle_ttl
+        ]
+        for session in idle:
+            del self._sessions[session]
+        self.evicted += len(idle)
+
+    def track(self, name, value, session=None):
+        return self.track_bytes(name, value_bytes(value), session)
+
+    def track_bytes(self, name, size, session=None):
+        session = scheduler.current_session.get() if session is None else session
+        now = self._clock()
+        with self._lock:
+            self._evict_idle(now)
+            entry = self._sessions.setdefault(session, {"frames": {}, "used_at": now})
+            entry["used_at"] = now
+            needed = size + sum(
+                held for frame, held in entry["frames"].items() if frame != name
+            )
+            refused = needed > self.budget
+            if refused:
+                self.refused += 1
+            else:
+                entry["frames"][name] = size
+        if refused:
+            metrics.increment("memory_refusals")
+            raise MemoryBudgetExceeded(name, needed, self.budget)
+        return size
+
+    def release(self, session=None):
+        session = scheduler.current_session.get() if session is None else session
+        with self._lock:
+            self._sessions.pop(session, None)
+
+    def usage(self):
+        with self._lock:
+            self._evict_idle(self._clock())
+            return {
+                session: dict(entry["frames"])
+                for session, entry in self._sessions.items()
+            }
+
+    def stats(self):
+        totals = [sum(frames.values()) for frames in self.usage().values()]
+        return {
+            "sessions": len(totals),
+            "bytes": sum(totals),
+            "largest_session_bytes": max(totals, default=0),
+            "budget_bytes": self.budget,
+            "refused": self.refused,
+            "evicted_sessions": self.evicted,
+        }
+
+
+def get_accountant():
+    global _accountant
+    with _accountant_lock:
+        if _accountant is None:
+            _accountant = MemoryAccountant()
+        return _accountant
+
+
+def set_accountant(accountant):
+    global _accountant
+    with _accountant_lock:
+        _accountant = accountant
+
+
+metrics.register_gauge(
+    "session_memory_bytes", lambda: get_accountant().stats()["bytes"]
+)
@@ -0,0 +1,182 @@
+import contextlib
+import functools
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+
+# Collection is off unless asked for; every hook checks this flag before doing work
+_enabled = os.environ.get("LIFERS_METRICS", "") not in ("", "0")
+_lock = threading.Lock()
+_spans = {}
+_counters = {}
+_requests = deque(maxlen=1000)
+_gauges = {}
+
+logger = logging.getLogger("lifers.metrics")
+
+COUNTERS = ("api_calls", "bytes_received", "retries", "cache_hits", "cache_misses")
+
+
+def enabled():
+    return _enabled
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def reset():
+    with _lock:
+        _spans.clear()
+        _counters.clear()
+        _requests.clear()
+
+
+def increment(name, value=1):
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def register_gauge(name, func):
+    # Gauges are read on export rather than recorded, so they cost nothing otherwise
+    _gauges[name] = func
+
+
+def gauges():
+    return {name: func() for name, func in _gauges.items()}
+
+
+def _record_span(name, seconds):
+    with _lock:
+        stats = _spans.get(name)
+        if stats is None:
+            stats = _spans[name] = {"count": 0, "total": 0.0, "max": 0.0, "last": 0.0}
+        stats["count"] += 1
+        stats["total"] += seconds
+        stats["max"] = max(stats["max"], seconds)
+        stats["last"] = seconds
+    logger.debug(json.dumps({"event": "span", "span": name, "seconds": seconds}))
+
+
+@contextlib.contextmanager
+def _timed_span(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record_span(name, time.perf_counter() - start)
+
+
+_NO_SPAN = contextlib.nullcontext()
+
+
+def span(name):
+    if not _enabled:
+        return _NO_SPAN
+    return _timed_span(name)
+
+
+def timed(name):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _timed_span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def record_request(path, status_code, seconds, num_bytes, retries=0):
+    if not _enabled:
+        return
+    with _lock:
+        _requests.append((path, status_code, seconds))
+        for name, value in (
+            ("api_calls", 1),
+            ("bytes_received", num_bytes),
+            ("retries", retries),
+        ):
+            _counters[name] = _counters.get(name, 0) + value
+    logger.debug(
+        json.dumps(
+            {
+                "event": "request",
+                "path": path,
+                "status": status_code,
+                "seconds": seconds,
+                "bytes": num_bytes,
+                "retries": retries,
+            }
+        )
+    )
+
+
+def species_latencies():
+    # Per-species fan-out requests end in .../recent/<speciesCode>; the notable
+    # list shares that shape but is one request per area, not a species
+    with _lock:
+        requests = list(_requests)
+    return [
+        (path.rsplit("/", 1)[-1], status_code, seconds)
+        for path, status_code, seconds in requests
+        if "/recent/" in path and not path.endswith("/recent/notable")
+    ]
+
+
+def snapshot():
+    with _lock:
+        return {
+            "spans": {name: dict(stats) for name, stats in _spans.items()},
+            "counters": dict.fromkeys(COUNTERS, 0) | _counters,
+            "requests": len(_requests),
+        }
+
+
+def to_prometheus(prefix="lifers"):
+    current = snapshot()
+    lines = [f"# TYPE {prefix}_span_seconds summary"]
+    for name, stats in sorted(current["spans"].items()):
+        lines.append(f'{prefix}_span_seconds_count{{span="{name}"}} {stats["count"]}')
+        lines.append(f'{prefix}_span_seconds_sum{{span="{name}"}} {stats["total"]}')
+    for name, value in sorted(current["counters"].items()):
+        lines.append(f"# TYPE {prefix}_{name}_total counter")
+        lines.append(f"{prefix}_{name}_total {value}")
+    for name, value in sorted(gauges().items()):
+        lines.append(f"# TYPE {prefix}_{name} gauge")
+        lines.append(f"{prefix}_{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path):
+    # Every session writes the file, so each write gets its own temporary name
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(to_prometheus())
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+
+
+def log_snapshot(level=logging.INFO):
+    logger.log(level, json.dumps({"event": "snapshot", **snapshot()}))
@@ -0,0 +1,400 @@
+import contextlib
+import contextvars
+import functools
+import hashlib
+import io
+import os
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+try:
+    from . import data, ebird_api, ebird_async, group, memory, metrics, visualise
+except ImportError:
+    import data
+    import ebird_api
+    import ebird_async
+    import group
+    import memory
+    import metrics
+    import visualise
+
+MAX_ENTRIES = 32
+# Species whose every sighting is fetched up front; the rest show their latest one
+TOP_SPECIES = int(os.environ.get("LIFERS_TOP_SPECIES", 20))
+# Sessions expected to search at once, which sizes the per-species memo
+SESSIONS = int(os.environ.get("LIFERS_SESSIONS", 16))
+SPECIES_RANKINGS = ("recency", "rarity")
+# Bytes of results each stage keeps, shared by every session
+MAX_BYTES = int(float(os.environ.get("LIFERS_STAGE_MEMORY_MB", 256)) * memory.MB)
+
+
+def _update_hash(digest, value):
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        digest.update(b"bytes:")
+        digest.update(value)
+    elif isinstance(value, pd.DataFrame):
+        digest.update(b"frame:")
+        digest.update(repr(list(value.columns)).encode())
+        digest.update(pd.util.hash_pandas_object(value, index=True).values.tobytes())
+    elif isinstance(value, np.ndarray) and value.dtype != object:
+        digest.update(f"array:{value.dtype}:{value.shape}:".encode())
+        digest.update(value.tobytes())
+    elif isinstance(value, (list, tuple, np.ndarray)):
+        digest.update(f"seq:{len(value)}:".encode())
+        for item in value:
+            _update_hash(digest, item)
+    elif isinstance(value, dict):
+        digest.update(f"dict:{len(value)}:".encode())
+        for key in sorted(value, key=repr):
+            _update_hash(digest, key)
+            _update_hash(digest, value[key])
+    else:
+        digest.update(f"{type(value).__name__}:{value!r};".encode())
+
+
+def content_hash(*values):
+    digest = hashlib.sha256()
+    for value in values:
+        _update_hash(digest, value)
+    return digest.hexdigest()
+
+
+def _copy(value):
+    if isinstance(value, pd.DataFrame):
+        return value.copy()
+    if isinstance(value, tuple):
+        return tuple(_copy(item) for item in value)
+    if isinstance(value, list):
+        return [_copy(item) for item in value]
+    return value
+
+
+# Set inside uncached(), where every stage recomputes and nothing is kept
+_uncached = contextvars.ContextVar("uncached", default=False)
+
+
+@contextlib.contextmanager
+def uncached():
+    token = _uncached.set(True)
+    try:
+        yield
+    finally:
+        _uncached.reset(token)
+
+
+# Results keyed on a content hash and evicted LRU, by count and by size; a result
+# larger than max_bytes is never kept. Callers always receive copies, so mutating
+# a result never alters the memo. A get returns None on a miss.
+class Memo:
+    def __init__(
+        self, max_entries=MAX_ENTRIES, ttl=None, cache_if=None, max_bytes=MAX_BYTES
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.cache_if = cache_if
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0}
+        self._bytes = 0
+
+    def cache_get(self, key, now=None):
+        if _uncached.get():
+            return None
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (self.ttl is None or now - entry[0] < self.ttl):
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return _copy(entry[1])
+            self._stats["misses"] += 1
+        return None
+
+    def cache_set(self, key, result, now=None):
+        if _uncached.get():
+            return
+        now = time.monotonic() if now is None else now
+        size = memory.value_bytes(result) if self.max_bytes is not None else 0
+        if self.cache_if is not None and not self.cache_if(result):
+            return
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries[key][2]
+            self._entries[key] = (now, result, size)
+            self._entries.move_to_end(key)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or (
+                self.max_bytes is not None and self._bytes > self.max_bytes
+            ):
+                self._bytes -= self._entries.popitem(last=False)[1][2]
+
+    def cache_clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._stats.update(hits=0, misses=0)
+            self._bytes = 0
+
+    def cache_stats(self):
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries))
+
+
+def memoize(
+    max_entries=MAX_ENTRIES, ttl=None, ignore=(), cache_if=None, max_bytes=MAX_BYTES
+):
+    # Stage results are memoized on their inputs, leaving out the ignored keywords
+    def decorator(func):
+        memo = Memo(max_entries, ttl, cache_if, max_bytes)
+
+        def key_of(args, kwargs):
+            keyed_kwargs = {k: v for k, v in kwargs.items() if k not in ignore}
+            return content_hash(args, keyed_kwargs)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = key_of(args, kwargs)
+            now = time.monotonic()
+            cached = memo.cache_get(key, now)
+            if cached is not None:
+                return cached
+            result = func(*args, **kwargs)
+            memo.cache_set(key, result, now)
+            return _copy(result)
+
+        # Results computed elsewhere, e.g. many at once, are read and kept under
+        # the key a call with the same arguments would use
+        wrapper.cache_get = lambda *args, **kwargs: memo.cache_get(key_of(args, kwargs))
+        wrapper.cache_set = lambda result, *args, **kwargs: memo.cache_set(
+            key_of(args, kwargs), result
+        )
+        wrapper.cache_clear = memo.cache_clear
+        wrapper.cache_stats = memo.cache_stats
+        return wrapper
+
+    return decorator
+
+
+@memoize()
+def load_lifelist(lifelist_bytes):
+    return data.load_lifelist_csv(io.BytesIO(lifelist_bytes))
+
+
+def _recent_frame(observations):
+    return data.compact_observations(
+        data.rollup_observations(pd.DataFrame(observations), dedupe=True)
+    )
+
+
+@memoize(ttl=ebird_api.OBSERVATION_TTL)
+def fetch_recent(region_code, days_back, headers):
+    areas = ebird_api.search_areas(region_code)
+    if len(areas) > 1:
+        # Areas are fetched together and memoized as if each was searched alone; a
+        # cache refresh fetches every area again
+        area_frames = {
+            area: (
+                None
+                if ebird_api.refreshing.get()
+                else fetch_recent.cache_get(area, days_back, headers)
+            )
+            for area in areas
+        }
+        missing_areas = [area for area, frame in area_frames.items() if frame is None]
+        if missing_areas:
+            for area, observations in zip(
+                missing_areas,
+                ebird_async.fetch_recent_observations(
+                    missing_areas, days_back, headers
+                ),
+            ):
+                area_frames[area] = _recent_frame(observations)
+                fetch_recent.cache_set(area_frames[area], area, days_back, headers)
+        return data.compact_observations(
+            data.merge_observations(list(area_frames.values()), ["speciesCode"])
+        )
+    return _recent_frame(
+        ebird_api.get_recent_observations(areas[0], days_back, headers=headers)
+    )
+
+
+@memoize(ttl=ebird_api.OBSERVATION_TTL)
+def compute_needs(lifelist_bytes, region_code, days_back, headers):
+    lifelist_df = load_lifelist(lifelist_bytes)
+    recent_obs_df = fetch_recent(region_code, days_back, headers)
+    if "speciesCode" not in recent_obs_df.columns:
+        return recent_obs_df
+    needs_df = recent_obs_df.loc[
+        ~recent_obs_df["speciesCode"].isin(lifelist_df["Species Code"].unique())
+    ]
+    return needs_df.reset_index(drop=True)
+
+
+# The region is fetched once however many birders are in the group
+@memoize(ttl=ebird_api.OBSERVATION_TTL)
+def compute_group_needs(
+    lifelists_bytes, names, region_code, days_back, headers, min_needed=1
+):
+    lifelists = {
+        name: load_lifelist(lifelist_bytes)
+        for name, lifelist_bytes in zip(names, lifelists_bytes)
+    }
+    recent_obs_df = fetch_recent(region_code, days_back, headers)
+    return group.group_needs(recent_obs_df, lifelists, min_needed)
+
+
+@memoize(ttl=ebird_api.OBSERVATION_TTL)
+def fetch_notable(region_code, days_back, headers):
+    return data.compact_observations(
+        data.merge_observations(
+            [
+                data.rollup_observations(
+                    pd.DataFrame(
+                        ebird_api.get_notable_observations(area, days_back, headers)
+                    )
+                )
+                for area in ebird_api.search_areas(region_code)
+            ],
+            ["speciesCode"],
+        )
+    )
+
+
+def rank_species(needs_df, region_code, days_back, headers, ranking="recency"):
+    # Most recently seen first; ranked by rarity, species eBird flags as notable in
+    # the region lead, costing one request per area
+    if "speciesCode" not in needs_df.columns or needs_df.empty:
+        return []
+    ranked_df = needs_df
+    if "obsDt" in ranked_df.columns:
+        ranked_df = ranked_df.sort_values("obsDt", ascending=False, kind="stable")
+    species_codes = list(dict.fromkeys(ranked_df["speciesCode"].astype(str)))
+    if ranking == "rarity":
+        notable_df = fetch_notable(region_code, days_back, headers)
+        notable = set(notable_df.get("speciesCode", ()))
+        species_codes = [code for code in species_codes if code in notable] + [
+            code for code in species_codes if code not in notable
+        ]
+    elif ranking != "recency":
+        raise ValueError(f"Unknown species ranking: {ranking}")
+    return species_codes
+
+
+def species_areas(region_code, days_back, headers):
+    # Each species is only fetched from the areas whose recent lists reported it
+    areas = ebird_api.search_areas(region_code)
+    if len(areas) == 1:
+        return None
+    reported = {}
+    for area in areas:
+        recent_obs_df = fetch_recent(area, days_back, headers)
+        for species_code in recent_obs_df.get("speciesCode", ()):
+            reported.setdefault(species_code, []).append(area)
+    return reported
+
+
+# Every species fetched in full is kept on its own, enough for the top species of
+# each session searching at once
+species_memo = Memo(max_entries=TOP_SPECIES * SESSIONS, ttl=ebird_api.OBSERVATION_TTL)
+
+
+# Each species is memoized on its own, so choosing one more species fetches only
+# that one. Failed species are not memoized, so they are retried on the next run,
+# and a cache refresh fetches every species again.
+def fetch_species_obs(region_code, species_codes, days_back, headers, on_result=None):
+    results = []
+    failed_species = []
+    missing_codes = []
+    with metrics.span("fetch_species_obs"):
+        for species_code in map(str, species_codes):
+            key = content_hash(region_code, species_code, days_back, headers)
+            result = None if ebird_api.refreshing.get() else species_memo.cache_get(key)
+            if result is None:
+                missing_codes.append(species_code)
+                continue
+            if not result.empty:
+                results.append(result)
+            if on_result is not None:
+                on_result(species_code, result, None, results)
+
+        if missing_codes:
+            for species_code, result, error in ebird_async.stream_species_obs(
+                region_code,
+                missing_codes,
+                days_back,
+                headers=headers,
+                species_areas=species_areas(region_code, days_back, headers),
+            ):
+                if error is not None:
+                    failed_species.append(species_code)
+                else:
+                    result = data.rollup_observations(result)
+                    species_memo.cache_set(
+                        content_hash(region_code, species_code, days_back, headers),
+                        result,
+                    )
+                    if not result.empty:
+                        results.append(result)
+                if on_result is not None:
+                    on_result(species_code, result, error, results)
+
+    region_needs_df = (
+        data.compact_observations(pd.concat(results, ignore_index=True))
+        if results
+        else pd.DataFrame()
+    )
+    return region_needs_df, sorted(failed_species)
+
+
+def lazy_species_obs(
+    region_code, needs_df, species_codes, days_back, headers, on_result=None
+):
+    # Only the given species are fetched in full; every other need is placed at the
+    # latest sighting the region list already reported
+    if species_codes:
+        region_needs_df, failed_species = fetch_species_obs(
+            region_code, species_codes, days_back, headers, on_result=on_result
+        )
+    else:
+        region_needs_df, failed_species = pd.DataFrame(), []
+    return data.combine_species_obs(needs_df, region_needs_df), failed_species
+
+
+@memoize()
+def aggregate_locations(region_needs_df):
+    return data.format_region_needs_data_for_map(region_needs_df)
+
+
+@memoize()
+def map_layer_data(region_needs_df):
+    return visualise.map_layer_data(
+        region_needs_df, aggregate_locations(region_needs_df)
+    )
+
+
+@memoize()
+def location_details(region_needs_df):
+    return data.format_location_details(region_needs_df)
+
+
+STAGES = [
+    load_lifelist,
+    fetch_recent,
+    fetch_notable,
+    compute_needs,
+    compute_group_needs,
+    species_memo,
+    aggregate_locations,
+    map_layer_data,
+    location_details,
+]
+
+
+def clear_stages():
+    for stage in STAGES:
+        stage.cache_clear()
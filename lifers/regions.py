@@ -0,0 +1,97 @@
+import json
+import os
+import threading
+import time
+
+try:
+    from . import data, ebird_api
+except ImportError:
+    import data
+    import ebird_api
+
+REGIONS_DIR = "lifers/.cache/regions"
+MAX_AGE = 30 * 24 * 60 * 60
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def parent_code(region_code):
+    return region_code.rsplit("-", 1)[0]
+
+
+class RegionIndex:
+    def __init__(self, country_code, subnational1, subnational2):
+        self.country_code = country_code
+        self.subnational1 = subnational1
+        self.subnational2 = subnational2
+        self.subnational1_codes = {
+            region["name"]: region["code"] for region in subnational1
+        }
+        self.names = {
+            region["code"]: region["name"] for region in subnational1 + subnational2
+        }
+        self.children = {code: {} for code in self.subnational1_codes.values()}
+        for region in subnational2:
+            self.children.setdefault(parent_code(region["code"]), {})[
+                region["name"]
+            ] = region["code"]
+
+    def subnational2_codes(self, subnational1_code):
+        return self.children.get(subnational1_code, {})
+
+    def to_dict(self):
+        return {
+            "country_code": self.country_code,
+            "subnational1": self.subnational1,
+            "subnational2": self.subnational2,
+        }
+
+
+def _index_path(country_code, regions_dir):
+    return os.path.join(regions_dir, f"{country_code}.json")
+
+
+def fetch_region_index(country_code, headers):
+    return RegionIndex(
+        country_code,
+        ebird_api.get_subnational_regions(country_code, 1, headers),
+        ebird_api.get_subnational_regions(country_code, 2, headers),
+    )
+
+
+def load_region_index(country_code, headers, regions_dir=REGIONS_DIR, max_age=MAX_AGE):
+    path = _index_path(country_code, regions_dir)
+    try:
+        if time.time() - os.path.getmtime(path) < max_age:
+            with open(path) as f:
+                stored = json.load(f)
+            return RegionIndex(
+                stored["country_code"], stored["subnational1"], stored["subnational2"]
+            )
+    except (OSError, ValueError, KeyError):
+        pass
+
+    index = fetch_region_index(country_code, headers)
+    os.makedirs(regions_dir, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(index.to_dict(), f)
+    os.replace(tmp_path, path)
+    return index
+
+
+def get_region_index(country_code, headers):
+    index = _indexes.get(country_code)
+    if index is None:
+        with _indexes_lock:
+            index = _indexes.get(country_code)
+            if index is None:
+                index = _indexes[country_code] = load_region_index(
+                    country_code, headers
+                )
+    return index
+
+
+def get_country_region_index(country_name, headers):
+    return get_region_index(data.country_codes()[country_name], headers)
@@ -0,0 +1,287 @@
+import asyncio
+import contextlib
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+
+try:
+    from . import metrics
+except ImportError:
+    import metrics
+
+# Every session shares one eBird token, so these bound the whole process
+RATE = float(os.environ.get("LIFERS_RATE_LIMIT", 25))  # requests per second
+MIN_RATE = 1.0
+BURST = 50
+MIN_CONCURRENCY = 1
+MAX_CONCURRENCY = 32
+INITIAL_CONCURRENCY = 16
+THROTTLE_STATUSES = (429, 500, 502, 503, 504)
+# A burst of failures from one overloaded moment halves the limit only once
+BACKOFF_WINDOW = 1.0
+
+current_session = contextvars.ContextVar("current_session", default="default")
+# Requests granted inside counting() are added to its tally
+_tally = contextvars.ContextVar("tally", default=None)
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def session(session_id):
+    token = current_session.set(session_id)
+    try:
+        yield
+    finally:
+        current_session.reset(token)
+
+
+@contextlib.contextmanager
+def counting():
+    # Tallies the upstream requests made by one caller, retries included, across
+    # the sync client and the async fan-out alike
+    tally = {"requests": 0}
+    token = _tally.set(tally)
+    try:
+        yield tally
+    finally:
+        _tally.reset(token)
+
+
+class Ticket:
+    __slots__ = ("session", "callback", "enqueued_at", "granted", "wait", "tally")
+
+    def __init__(self, session, callback, enqueued_at, tally=None):
+        self.session = session
+        self.callback = callback
+        self.enqueued_at = enqueued_at
+        self.granted = False
+        self.wait = None
+        self.tally = tally
+
+
+# Requests queue per session and are granted round-robin across sessions, so a
+# country-wide fan-out cannot starve a small query. Grants are limited by a token
+# bucket and by a concurrency limit that halves on throttling and grows on success.
+# A 429 also halves the bucket's rate, which grows back towards `rate` on success,
+# since a server rate limit below ours is not helped by fewer requests in flight.
+class Scheduler:
+    def __init__(
+        self,
+        rate=RATE,
+        burst=BURST,
+        min_concurrency=MIN_CONCURRENCY,
+        max_concurrency=MAX_CONCURRENCY,
+        initial_concurrency=INITIAL_CONCURRENCY,
+        clock=time.monotonic,
+        wait_history=1000,
+        backoff_window=BACKOFF_WINDOW,
+    ):
+        self.rate = rate
+        self.max_rate = rate
+        self.min_rate = min(MIN_RATE, rate)
+        self.backoff_window = backoff_window
+        self.burst = burst
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.limit = float(
+            min(max(initial_concurrency, min_concurrency), max_concurrency)
+        )
+        self._clock = clock
+        self._tokens = float(burst)
+        self._refilled_at = clock()
+        self._queues = {}
+        self._sessions = deque()
+        self._in_flight = 0
+        self._waits = deque(maxlen=wait_history)
+        self._granted = 0
+        self._throttled = 0
+        self._backed_off_at = None
+        self._rate_backed_off_at = None
+        self._closed = False
+        self._cond = threading.Condition()
+        self._dispatcher = None
+
+    def submit(self, callback, session_id=None):
+        session_id = session_id or current_session.get()
+        with self._cond:
+            ticket = Ticket(session_id, callback, self._clock(), _tally.get())
+            queue = self._queues.get(session_id)
+            if queue is None:
+                queue = self._queues[session_id] = deque()
+                self._sessions.append(session_id)
+            queue.append(ticket)
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(
+                    target=self._dispatch, name="lifers-scheduler", daemon=True
+                )
+                self._dispatcher.start()
+            self._cond.notify_all()
+        return ticket
+
+    def cancel(self, ticket):
+        # A granted slot is handed back without counting towards adaptation
+        with self._cond:
+            if ticket.granted:
+                self._in_flight -= 1
+                self._cond.notify_all()
+            else:
+                self._dequeue(ticket)
+
+    def acquire(self, session_id=None, timeout=None):
+        granted = threading.Event()
+        ticket = self.submit(granted.set, session_id)
+        if not granted.wait(timeout):
+            with self._cond:
+                if not ticket.granted:
+                    self._dequeue(ticket)
+                    raise TimeoutError("Timed out waiting for an eBird request slot")
+        return ticket.wait
+
+    async def acquire_async(self, session_id=None):
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def grant():
+            loop.call_soon_threadsafe(
+                lambda: granted.done() or granted.set_result(None)
+            )
+
+        ticket = self.submit(grant, session_id)
+        try:
+            await granted
+        except asyncio.CancelledError:
+            self.cancel(ticket)
+            raise
+        return ticket.wait
+
+    def release(self, status_code=None, adapt=True):
+        # A status of None is a connection failure. Requests abandoned by their
+        # caller pass adapt=False and hand the slot back without counting.
+        with self._cond:
+            self._in_flight -= 1
+            if not adapt:
+                pass
+            elif status_code is None or status_code in THROTTLE_STATUSES:
+                self._throttled += 1
+                now = self._clock()
+                if (
+                    self._backed_off_at is None
+                    or now - self._backed_off_at >= self.backoff_window
+                ):
+                    self.limit = max(self.min_concurrency, self.limit / 2)
+                    self._backed_off_at = now
+                if status_code == 429:
+                    self._tokens = 0.0
+                    if (
+                        self._rate_backed_off_at is None
+                        or now - self._rate_backed_off_at >= self.backoff_window
+                    ):
+                        self.rate = max(self.min_rate, self.rate / 2)
+                        self._rate_backed_off_at = now
+            else:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+                self.rate = min(self.max_rate, self.rate + 1 / self.rate)
+            self._cond.notify_all()
+        if adapt and status_code == 429:
+            metrics.increment("throttled")
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            waits = sorted(self._waits)
+            return {
+                "queue_depth": sum(len(queue) for queue in self._queues.values()),
+                "sessions_waiting": len(self._queues),
+                "in_flight": self._in_flight,
+                "concurrency_limit": int(self.limit),
+                "tokens": round(self._tokens, 2),
+                "rate": round(self.rate, 2),
+                "granted": self._granted,
+                "throttled": self._throttled,
+                "mean_wait": sum(waits) / len(waits) if waits else 0.0,
+                "p95_wait": waits[int(0.95 * (len(waits) - 1))] if waits else 0.0,
+                "max_wait": waits[-1] if waits else 0.0,
+            }
+
+    def _dequeue(self, ticket):
+        queue = self._queues.get(ticket.session)
+        if queue is not None and ticket in queue:
+            queue.remove(ticket)
+            if not queue:
+                del self._queues[ticket.session]
+                self._sessions.remove(ticket.session)
+
+    def _refill(self, now):
+        self._tokens = min(
+            self.burst, self._tokens + (now - self._refilled_at) * self.rate
+        )
+        self._refilled_at = now
+
+    def _dispatch(self):
+        with self._cond:
+            while not self._closed:
+                if not self._sessions or self._in_flight >= max(
+                    int(self.limit), self.min_concurrency
+                ):
+                    self._cond.wait()
+                    continue
+                now = self._clock()
+                self._refill(now)
+                if self._tokens < 1:
+                    self._cond.wait((1 - self._tokens) / self.rate)
+                    continue
+
+                session_id = self._sessions.popleft()
+                queue = self._queues[session_id]
+                ticket = queue.popleft()
+                if queue:
+                    self._sessions.append(session_id)
+                else:
+                    del self._queues[session_id]
+
+                self._tokens -= 1
+                self._in_flight += 1
+                self._granted += 1
+                if ticket.tally is not None:
+                    ticket.tally["requests"] += 1
+                ticket.granted = True
+                ticket.wait = now - ticket.enqueued_at
+                self._waits.append(ticket.wait)
+                try:
+                    ticket.callback()
+                except RuntimeError:
+                    # The waiting event loop has gone away; hand the slot back
+                    self._in_flight -= 1
+
+
+def get_scheduler():
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = Scheduler()
+    return _scheduler
+
+
+def _stat(name):
+    return lambda: get_scheduler().stats()[name]
+
+
+for _name in ("queue_depth", "in_flight", "concurrency_limit", "rate", "p95_wait"):
+    metrics.register_gauge(f"scheduler_{_name}", _stat(_name))
+
+
+def set_scheduler(scheduler):
+    global _scheduler
+    with _scheduler_lock:
+        previous, _scheduler = _scheduler, scheduler
+    if previous is not None and previous is not scheduler:
+        previous.close()
@@ -0,0 +1,105 @@
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+
+# Imported first by the app, so milestones are measured from the first script run
+STARTED = time.perf_counter()
+
+APP_MODULES = (
+    "streamlit",
+    "data",
+    "ebird_api",
+    "group",
+    "memory",
+    "metrics",
+    "pipeline",
+    "regions",
+    "scheduler",
+    "store",
+    "visualise",
+)
+
+IMPORT_TIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+_marks = {}
+
+
+def mark(name):
+    # Only the first occurrence counts; later reruns of the script are warm
+    return _marks.setdefault(name, time.perf_counter() - STARTED)
+
+
+def marks():
+    return dict(_marks)
+
+
+def parse_import_times(stderr):
+    rows = []
+    for line in stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            rows.append(
+                {
+                    "module": module,
+                    "depth": (len(indent) - 1) // 2,
+                    "self_seconds": int(self_us) / 1e6,
+                    "cumulative_seconds": int(cumulative_us) / 1e6,
+                }
+            )
+    return rows
+
+
+def import_times(modules=APP_MODULES, python=sys.executable):
+    # Cold import cost of each module in a fresh interpreter, in import order, so a
+    # module only pays for what the ones before it did not already import
+    code = "; ".join(f"import {module}" for module in modules)
+    env = dict(os.environ)
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    env["PYTHONPATH"] = os.pathsep.join(
+        path for path in (app_dir, env.get("PYTHONPATH")) if path
+    )
+    result = subprocess.run(
+        [python, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=True,
+    )
+    # A module pulled in by an earlier one is reported where it was first imported
+    return [
+        row for row in parse_import_times(result.stderr) if row["module"] in modules
+    ]
+
+
+def format_import_times(rows):
+    lines = [f"{'module':<24}{'self ms':>10}{'cumulative ms':>15}"]
+    for row in rows:
+        lines.append(
+            f"{'  ' * row['depth'] + row['module']:<24}"
+            f"{row['self_seconds'] * 1000:>10.1f}"
+            f"{row['cumulative_seconds'] * 1000:>15.1f}"
+        )
+    total = sum(row["cumulative_seconds"] for row in rows if row["depth"] == 0)
+    lines.append(f"{'total':<24}{'':>10}{total * 1000:>15.1f}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m lifers.startup",
+        description="Report how long each of the app's modules takes to import.",
+    )
+    parser.add_argument(
+        "modules", nargs="*", help="modules to import, in order (default: the app's)"
+    )
+    args = parser.parse_args(argv)
+    print(format_import_times(import_times(tuple(args.modules) or APP_MODULES)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+import contextlib
+import datetime
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+
+STORE_PATH = "lifers/.cache/observations.sqlite"
+DAY = 24 * 60 * 60
+# The recent endpoints look back at most 30 days, so nothing older is ever queried
+MAX_BACK = 30
+# Beyond this many older days, one wider request costs less than a call per day
+MAX_HISTORIC_DAYS = 2
+
+# Region-wide lists are scoped to "", per-species lists to their species code
+REGION_SCOPE = ""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS observations (
+    region TEXT NOT NULL,
+    scope TEXT NOT NULL,
+    key TEXT NOT NULL,
+    obs_dt TEXT NOT NULL,
+    sub_id TEXT,
+    body TEXT NOT NULL,
+    PRIMARY KEY (region, scope, key)
+);
+CREATE TABLE IF NOT EXISTS coverage (
+    region TEXT NOT NULL,
+    scope TEXT NOT NULL,
+    covered_from TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (region, scope)
+);
+"""
+
+# A newer sighting of the same species (or at the same location) replaces the older
+UPSERT = """
+INSERT INTO observations (region, scope, key, obs_dt, sub_id, body)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (region, scope, key) DO UPDATE SET
+    obs_dt = excluded.obs_dt, sub_id = excluded.sub_id, body = excluded.body
+WHERE excluded.obs_dt >= observations.obs_dt
+"""
+
+
+def _date(timestamp, days_ago=0):
+    moment = datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc)
+    return moment.date() - datetime.timedelta(days=days_ago)
+
+
+# eBird's recent endpoints return the latest observation per species for a region,
+# and per location for a species. Stored that way, a region fetched earlier only
+# needs the days since its last fetch, and a slightly longer window only the older
+# days. Coverage fetched within fresh_for seconds is served without any request.
+class ObservationStore:
+    def __init__(self, path=STORE_PATH, clock=time.time):
+        self.path = path
+        self._clock = clock
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as connection:
+            connection.executescript(SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def now(self):
+        return self._clock()
+
+    def coverage(self, region_code, scope):
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT covered_from, fetched_at FROM coverage WHERE region = ? AND scope = ?",
+                (region_code, scope),
+            ).fetchone()
+        if row is None:
+            return None
+        return datetime.date.fromisoformat(row[0]), row[1]
+
+    def plan(self, region_code, scope, days_back, now, fresh_for=0):
+        # Returns the ("recent", back) and ("historic", date) requests still needed
+        coverage = self.coverage(region_code, scope)
+        if coverage is None:
+            return [("recent", days_back)]
+        covered_from, fetched_at = coverage
+        delta_back = max(1, math.ceil((now - fetched_at) / DAY))
+        if delta_back >= days_back:
+            return [("recent", days_back)]
+        delta = [] if now - fetched_at < fresh_for else [("recent", delta_back)]
+
+        missing_from = _date(now, days_back)
+        if missing_from >= covered_from:
+            return delta
+        missing_days = (covered_from - missing_from).days
+        if scope != REGION_SCOPE or missing_days > MAX_HISTORIC_DAYS:
+            # There is no per-species historic endpoint, and many older days cost
+            # more requests than widening the one request
+            return [("recent", days_back)]
+        return delta + [
+            ("historic", covered_from - datetime.timedelta(days=day))
+            for day in range(1, missing_days + 1)
+        ]
+
+    def merge(self, region_code, scope, records, kind, value, now):
+        key_field = "speciesCode" if scope == REGION_SCOPE else "locId"
+        rows = [
+            (
+                region_code,
+                scope,
+                record[key_field],
+                record["obsDt"],
+                record.get("subId"),
+                json.dumps(record),
+            )
+            for record in records
+            if record.get(key_field) and record.get("obsDt")
+        ]
+        with self._lock, self._connect() as connection:
+            connection.executemany(UPSERT, rows)
+            previous = connection.execute(
+                "SELECT covered_from, fetched_at FROM coverage WHERE region = ? AND scope = ?",
+                (region_code, scope),
+            ).fetchone()
+            if kind == "recent":
+                covered_from = _date(now, value)
+                fetched_at = now
+                if previous is not None and now - previous[1] <= value * DAY:
+                    covered_from = min(
+                        covered_from, datetime.date.fromisoformat(previous[0])
+                    )
+            else:
+                # Older days extend the coverage only when they join on to it
+                if previous is None:
+                    return
+                covered_from = datetime.date.fromisoformat(previous[0])
+                fetched_at = previous[1]
+                if value == covered_from - datetime.timedelta(days=1):
+                    covered_from = value
+            connection.execute(
+                "INSERT OR REPLACE INTO coverage VALUES (?, ?, ?, ?)",
+                (region_code, scope, covered_from.isoformat(), fetched_at),
+            )
+            connection.execute(
+                "DELETE FROM observations WHERE region = ? AND scope = ? AND obs_dt < ?",
+                (region_code, scope, _date(now, MAX_BACK + 1).isoformat()),
+            )
+
+    def query(self, region_code, scope, days_back, now):
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT body FROM observations "
+                "WHERE region = ? AND scope = ? AND obs_dt >= ? "
+                "ORDER BY obs_dt DESC, key",
+                (region_code, scope, _date(now, days_back).isoformat()),
+            ).fetchall()
+        return [json.loads(body) for (body,) in rows]
+
+    def clear(self):
+        with self._lock, self._connect() as connection:
+            connection.execute("DELETE FROM observations")
+            connection.execute("DELETE FROM coverage")
@@ -0,0 +1,157 @@
+import glob
+import hashlib
+import os
+import re
+import threading
+import numpy as np
+import pandas as pd
+
+try:
+    from . import metrics
+except ImportError:
+    import metrics
+
+TAXONOMY_XLSX = "lifers/eBird_taxonomy_v2024.xlsx"
+# Former scientific names of taxa renamed in recent taxonomy updates, so lifelists
+# exported before an update still resolve
+SYNONYMS_CSV = "lifers/taxonomy_synonyms.csv"
+CACHE_DIR = "lifers/.cache"
+TAXONOMY_COLUMNS = [
+    "TAXON_ORDER",
+    "CATEGORY",
+    "SPECIES_CODE",
+    "PRIMARY_COM_NAME",
+    "SCI_NAME",
+    "REPORT_AS",
+]
+
+_taxonomy = None
+_taxonomy_lock = threading.Lock()
+_index = None
+_index_lock = threading.Lock()
+
+
+def taxonomy_version(xlsx_path):
+    match = re.search(r"_v(\d+)", os.path.basename(xlsx_path))
+    return match.group(1) if match else "unknown"
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def artifact_path(xlsx_path=TAXONOMY_XLSX, cache_dir=CACHE_DIR):
+    version = taxonomy_version(xlsx_path)
+    return os.path.join(
+        cache_dir, f"taxonomy_v{version}_{file_hash(xlsx_path)}.parquet"
+    )
+
+
+def compile_taxonomy(xlsx_path=TAXONOMY_XLSX, cache_dir=CACHE_DIR):
+    path = artifact_path(xlsx_path, cache_dir)
+    if os.path.exists(path):
+        return path
+
+    taxonomy_df = pd.read_excel(xlsx_path, usecols=TAXONOMY_COLUMNS)
+    taxonomy_df["CATEGORY"] = taxonomy_df["CATEGORY"].astype("category")
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    taxonomy_df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+    # Drop artifacts compiled from older versions of the source file
+    version = taxonomy_version(xlsx_path)
+    for stale in glob.glob(os.path.join(cache_dir, f"taxonomy_v{version}_*.parquet")):
+        if stale != path:
+            os.remove(stale)
+
+    return path
+
+
+@metrics.timed("load_taxonomy")
+def load_taxonomy(xlsx_path=TAXONOMY_XLSX, cache_dir=CACHE_DIR):
+    return pd.read_parquet(compile_taxonomy(xlsx_path, cache_dir))
+
+
+def get_taxonomy():
+    global _taxonomy
+    if _taxonomy is None:
+        with _taxonomy_lock:
+            if _taxonomy is None:
+                _taxonomy = load_taxonomy()
+    return _taxonomy
+
+
+def load_synonyms(csv_path=SYNONYMS_CSV):
+    synonyms_df = pd.read_csv(csv_path)
+    return dict(zip(synonyms_df["SCI_NAME"], synonyms_df["SPECIES_CODE"]))
+
+
+# Taxon ids are row positions in the taxonomy. Each taxon links to the id of the
+# species it is counted as (itself for species, REPORT_AS for subspecies, forms and
+# domestics), or -1 for spuhs, slashes and hybrids, which never count as a species.
+class TaxonomyIndex:
+    def __init__(self, taxonomy_df, synonyms=None):
+        self.codes = taxonomy_df["SPECIES_CODE"].to_numpy()
+        self.common_names = taxonomy_df["PRIMARY_COM_NAME"].to_numpy()
+        self.scientific_names = taxonomy_df["SCI_NAME"].to_numpy()
+        self.categories = taxonomy_df["CATEGORY"].to_numpy()
+        self.code_index = pd.Index(self.codes)
+
+        parent_codes = taxonomy_df["REPORT_AS"].where(
+            taxonomy_df["REPORT_AS"].notna(),
+            taxonomy_df["SPECIES_CODE"].where(taxonomy_df["CATEGORY"] == "species"),
+        )
+        self.parent_ids = self.code_index.get_indexer(parent_codes).astype(np.int32)
+
+        names = pd.Series(self.scientific_names)
+        name_ids = np.arange(len(names), dtype=np.int32)
+        if synonyms:
+            synonym_names = pd.Series(list(synonyms))
+            synonym_ids = self.code_index.get_indexer(list(synonyms.values()))
+            # Current names win over a synonym that has since been reused
+            keep = (synonym_ids >= 0) & ~synonym_names.isin(names).to_numpy()
+            names = pd.concat([names, synonym_names[keep]], ignore_index=True)
+            name_ids = np.concatenate([name_ids, synonym_ids[keep].astype(np.int32)])
+        self.name_index = pd.Index(names)
+        self._name_ids = name_ids
+
+    def __len__(self):
+        return len(self.codes)
+
+    def ids_for_codes(self, codes):
+        return self.code_index.get_indexer(codes).astype(np.int32)
+
+    def ids_for_names(self, names):
+        positions = self.name_index.get_indexer(names)
+        return np.where(positions >= 0, self._name_ids[positions], -1).astype(np.int32)
+
+    def species_ids(self, taxon_ids):
+        taxon_ids = np.asarray(taxon_ids)
+        return np.where(taxon_ids >= 0, self.parent_ids[taxon_ids], -1)
+
+    def species_codes(self, taxon_ids):
+        species_ids = self.species_ids(taxon_ids)
+        return np.where(species_ids >= 0, self.codes[species_ids], None)
+
+
+@metrics.timed("build_taxonomy_index")
+def build_index(taxonomy_df=None, synonyms_csv=SYNONYMS_CSV):
+    if taxonomy_df is None:
+        taxonomy_df = get_taxonomy()
+    synonyms = load_synonyms(synonyms_csv) if synonyms_csv else None
+    return TaxonomyIndex(taxonomy_df, synonyms)
+
+
+def get_index():
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = build_index()
+    return _index
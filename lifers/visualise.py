@@ -1,8 +1,75 @@
-import pydeck as pdk
+import math
 import pandas as pd
 
+try:
+    from . import data, metrics
+except ImportError:
+    import data
+    import metrics
+
+# Keeps the serialised map payload roughly constant however large the region is
+MAX_MAP_POINTS = 500
+TARGET_CELL_PIXELS = 48
+MAP_WIDTH_PIXELS = 1000
+MAP_HEIGHT_PIXELS = 500
+MIN_SPAN_DEGREES = 0.05
+MAX_ZOOM = 12
+
+
+def _mercator_y(lat):
+    lat = max(min(lat, 85.0), -85.0)
+    return math.degrees(math.log(math.tan(math.pi / 4 + math.radians(lat) / 2)))
+
+
+def fit_zoom(map_data, padding=0.1):
+    lng_span = max(map_data["lng"].max() - map_data["lng"].min(), MIN_SPAN_DEGREES)
+    lat_span = max(
+        _mercator_y(map_data["lat"].max()) - _mercator_y(map_data["lat"].min()),
+        MIN_SPAN_DEGREES,
+    )
+    zoom = min(
+        math.log2(MAP_WIDTH_PIXELS * 360 / (256 * lng_span * (1 + padding))),
+        math.log2(MAP_HEIGHT_PIXELS * 360 / (256 * lat_span * (1 + padding))),
+    )
+    return max(min(zoom, MAX_ZOOM), 0)
+
+
+def fit_view_state(map_data):
+    # pydeck is imported on first use so it stays off the app's cold start path
+    import pydeck as pdk
+
+    return pdk.ViewState(
+        latitude=(map_data["lat"].min() + map_data["lat"].max()) / 2,
+        longitude=(map_data["lng"].min() + map_data["lng"].max()) / 2,
+        zoom=fit_zoom(map_data),
+        bearing=0,
+        pitch=0,
+    )
+
+
+def cell_size_for_zoom(zoom):
+    return TARGET_CELL_PIXELS * 360 / (256 * 2**zoom)
+
+
+@metrics.timed("map_layer_data")
+def map_layer_data(region_needs_df, region_loc_data, max_points=MAX_MAP_POINTS):
+    # Raw hotspots when they fit the budget, otherwise grid cells sized to the view
+    if len(region_loc_data) <= max_points:
+        return region_loc_data
+
+    cell_size = cell_size_for_zoom(fit_zoom(region_loc_data))
+    binned = data.format_binned_region_needs_data_for_map(region_needs_df, cell_size)
+    while len(binned) > max_points:
+        cell_size *= 2
+        binned = data.format_binned_region_needs_data_for_map(
+            region_needs_df, cell_size
+        )
+    return binned
+
 
 def map_deck(map_data):
+    import pydeck as pdk
+
     layer = pdk.Layer(
         "ScatterplotLayer",
         map_data,
@@ -16,13 +83,7 @@ def map_deck(map_data):
         radius_max_pixels=50,
     )
 
-    view_state = pdk.ViewState(
-        latitude=map_data["lat"].mean(),
-        longitude=map_data["lng"].mean(),
-        zoom=5.5,
-        bearing=0,
-        pitch=0,
-    )
+    view_state = fit_view_state(map_data)
 
     chart = pdk.Deck(
         layers=[layer],
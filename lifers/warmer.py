@@ -0,0 +1,240 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+try:
+    from . import ebird_api, metrics, pipeline, scheduler, store
+except ImportError:
+    import ebird_api
+    import metrics
+    import pipeline
+    import scheduler
+    import store
+
+# Entries are refreshed a little before the cached observations would expire
+INTERVAL = ebird_api.OBSERVATION_TTL * 0.8
+BUDGET = int(os.environ.get("LIFERS_WARM_BUDGET", 500))  # API requests per cycle
+TOP_SEARCHES = 20
+MIN_QUERIES = 2
+HALF_LIFE = 24 * 60 * 60
+SESSION = "warmer"
+
+logger = logging.getLogger("lifers.warmer")
+
+_warmer = None
+_warmer_lock = threading.Lock()
+
+
+# Counts searches per (region_code, days_back), decaying so yesterday's crowd fades,
+# and on a schedule refreshes the hottest ones into the shared response cache and
+# observation store within a request budget. Its requests queue as their own
+# scheduler session, so they only take a fair share from interactive users.
+class Warmer:
+    def __init__(
+        self,
+        headers,
+        budget=BUDGET,
+        interval=INTERVAL,
+        top_searches=TOP_SEARCHES,
+        min_queries=MIN_QUERIES,
+        pinned=(),
+        clock=time.monotonic,
+    ):
+        self.headers = headers
+        self.pinned = list(pinned)
+        self.budget = budget
+        self.interval = interval
+        self.top_searches = top_searches
+        self.min_queries = min_queries
+        self._clock = clock
+        self._counts = {}
+        self._warmed_at = {}
+        self._decayed_at = clock()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.queries = 0
+        self.warm_hits = 0
+        self.refreshes = 0
+        self.requests = 0
+        self.errors = 0
+
+    def record_query(self, region_code, days_back):
+        key = (region_code, days_back)
+        now = self._clock()
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0.0) + 1
+            warmed_at = self._warmed_at.get(key)
+            hit = warmed_at is not None and now - warmed_at < ebird_api.OBSERVATION_TTL
+            self.queries += 1
+            self.warm_hits += hit
+        metrics.increment("warm_hits" if hit else "warm_misses")
+        return hit
+
+    def hottest(self):
+        now = self._clock()
+        with self._lock:
+            factor = 0.5 ** ((now - self._decayed_at) / HALF_LIFE)
+            self._counts = {
+                key: count * factor
+                for key, count in self._counts.items()
+                if count * factor >= 0.01
+            }
+            self._decayed_at = now
+            ranked = sorted(self._counts.items(), key=lambda item: -item[1])
+        hottest = [
+            key
+            for key, count in ranked
+            if count >= self.min_queries and key not in self.pinned
+        ]
+        return self.pinned + hottest[: self.top_searches]
+
+    def refresh(self, region_code, days_back, budget):
+        # Every species in the region lists is warmed, since any lifelist may need
+        # it; the newest sightings come first when the budget runs short. A species
+        # costs one request per area that reported it, and what is spent is the
+        # requests actually made, store deltas and retries included.
+        areas = ebird_api.search_areas(region_code)
+        with ebird_api.refresh_cache(), scheduler.session(
+            SESSION
+        ), scheduler.counting() as tally:
+            recent_obs_df = pipeline.fetch_recent.__wrapped__(
+                region_code, days_back, self.headers
+            )
+            reported = pipeline.species_areas(region_code, days_back, self.headers)
+            remaining = budget - tally["requests"]
+            species_codes = []
+            for species_code in recent_obs_df.get("speciesCode", ()):
+                cost = len((reported or {}).get(species_code, areas))
+                if cost > remaining:
+                    break
+                species_codes.append(species_code)
+                remaining -= cost
+            if species_codes:
+                pipeline.fetch_species_obs(
+                    region_code, tuple(species_codes), days_back, self.headers
+                )
+        spent = tally["requests"]
+
+        with self._lock:
+            self._warmed_at[(region_code, days_back)] = self._clock()
+            self.refreshes += 1
+            self.requests += spent
+        return spent
+
+    def run_once(self):
+        remaining = self.budget
+        for region_code, days_back in self.hottest():
+            if remaining <= 0:
+                break
+            try:
+                remaining -= self.refresh(region_code, days_back, remaining)
+            except Exception:
+                # One failing region must not stop the others being warmed
+                logger.exception(
+                    "Could not warm %s over %s days", region_code, days_back
+                )
+                with self._lock:
+                    self.errors += 1
+        return self.budget - remaining
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.run_once()
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="lifers-warmer", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queries": self.queries,
+                "warm_hits": self.warm_hits,
+                "warm_hit_ratio": (
+                    self.warm_hits / self.queries if self.queries else 0.0
+                ),
+                "refreshes": self.refreshes,
+                "requests": self.requests,
+                "errors": self.errors,
+                "tracked_searches": len(self._counts),
+            }
+
+
+def get_warmer():
+    return _warmer
+
+
+def set_warmer(warmer):
+    global _warmer
+    with _warmer_lock:
+        previous, _warmer = _warmer, warmer
+    if previous is not None and previous is not warmer:
+        previous.stop()
+
+
+def _stat(name):
+    return lambda: _warmer.stats()[name] if _warmer is not None else 0
+
+
+for _name in ("warm_hit_ratio", "refreshes", "requests"):
+    metrics.register_gauge(f"warmer_{_name}", _stat(_name))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m lifers.warmer",
+        description="Keep the response cache and observation store warm for regions.",
+    )
+    parser.add_argument(
+        "--region", action="append", required=True, help="repeat for several regions"
+    )
+    parser.add_argument(
+        "--days-back", action="append", type=int, dest="days", help="default: 7"
+    )
+    parser.add_argument("--budget", type=int, default=BUDGET)
+    parser.add_argument("--interval", type=float, default=INTERVAL)
+    parser.add_argument("--store", default=store.STORE_PATH)
+    parser.add_argument("--once", action="store_true", help="warm once and exit")
+    args = parser.parse_args(argv)
+
+    api_key = os.environ.get("EBIRD_API_TOKEN")
+    if not api_key:
+        print("Environment variable 'EBIRD_API_TOKEN' is not set.", file=sys.stderr)
+        return 2
+    if args.store:
+        ebird_api.set_observation_store(store.ObservationStore(args.store))
+
+    # Regions named here are always warmed, however rarely they are searched
+    warmer = Warmer(
+        {"X-eBirdApiToken": api_key},
+        budget=args.budget,
+        interval=args.interval,
+        pinned=[
+            (region_code, days_back)
+            for region_code in args.region
+            for days_back in args.days or [7]
+        ],
+    )
+    while True:
+        warmer.run_once()
+        print(json.dumps(warmer.stats()), file=sys.stderr)
+        if args.once:
+            return 1 if warmer.errors else 0
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
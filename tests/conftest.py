@@ -0,0 +1,86 @@
+import json
+import time
+import pytest
+from benchmarks import fake_ebird
+from lifers import ebird_api, scheduler
+
+RECENT_SPECIES = ["auonig1", "emu1", "ostric2"]
+
+
+@pytest.fixture(autouse=True)
+def clear_response_cache():
+    ebird_api.response_cache.clear()
+    yield
+    ebird_api.response_cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def no_observation_store():
+    yield
+    ebird_api.set_observation_store(None)
+
+
+@pytest.fixture(autouse=True)
+def fresh_scheduler():
+    # Adaptive limits learned in one test must not throttle the next
+    scheduler.set_scheduler(None)
+    yield
+    scheduler.set_scheduler(None)
+
+
+# The benchmark server, answering any region with sightings dated now so they fall
+# in every window. Regions in region_species report those species, the rest
+# RECENT_SPECIES, and a species named "missing" is not found.
+class FakeEBirdApi(fake_ebird.FakeEBird):
+    def __init__(self):
+        super().__init__({}, latency=lambda rng: self.delay)
+        self.delay = 0.02
+        self.region_species = {}
+
+    def body(self, path):
+        if path.endswith("/missing"):
+            return None
+        obs_dt = time.strftime("%Y-%m-%d %H:%M", time.gmtime())
+        if "/subnational1/" in path:
+            body = [{"name": "Victoria", "code": "AU-VIC"}]
+        elif path.endswith("/recent"):
+            body = [
+                {
+                    "speciesCode": species_code,
+                    "comName": species_code.title(),
+                    "sciName": f"Genus {species_code}",
+                    "obsDt": obs_dt,
+                }
+                for species_code in self.region_species.get(
+                    path.split("/")[-2], RECENT_SPECIES
+                )
+            ]
+        else:
+            species_code = path.rsplit("/", 1)[-1]
+            body = [
+                {
+                    "speciesCode": species_code,
+                    "comName": species_code.title(),
+                    "sciName": f"Genus {species_code}",
+                    "locId": "L1",
+                    "locName": "Hotspot",
+                    "lat": -37.8,
+                    "lng": 144.9,
+                    "obsDt": obs_dt,
+                    "howMany": 1,
+                    "locationPrivate": False,
+                }
+            ]
+        return json.dumps(body).encode()
+
+
+@pytest.fixture
+def recent_species():
+    return list(RECENT_SPECIES)
+
+
+@pytest.fixture
+def fake_server(monkeypatch):
+    with FakeEBirdApi() as fake:
+        monkeypatch.setattr(ebird_api, "API_BASE_URL", fake.base_url)
+        yield fake
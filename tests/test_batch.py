@@ -0,0 +1,123 @@
+import json
+import pytest
+import pandas as pd
+from lifers import batch, pipeline
+
+LIFELIST_CSV = b"""Row #,Taxon Order,Category,Common Name,Scientific Name,Count,Location,S/P,Date,LocID,SubID,Exotic,Countable
+1,3764,species,Australian Owlet-nightjar,Aegotheles cristatus,1,"Finland Road, Paradise Waters",AU-QLD,12 Aug 2023,L3862700,S147015015,,1
+"""
+
+
+@pytest.fixture(autouse=True)
+def clear_stages():
+    pipeline.clear_stages()
+    yield
+    pipeline.clear_stages()
+
+
+@pytest.fixture
+def lifelist_path(tmp_path):
+    path = tmp_path / "alice.csv"
+    path.write_bytes(LIFELIST_CSV)
+    return str(path)
+
+
+class TestParseArgs:
+    def test_when_options_repeated_then_collects_lists(self):
+        args = batch.parse_args(
+            ["--lifelist", "a.csv", "--lifelist", "b.csv", "--region", "AU-VIC"]
+        )
+        assert args.lifelist == ["a.csv", "b.csv"]
+        assert args.region == ["AU-VIC"]
+        assert args.days_back == batch.DEFAULT_DAYS_BACK
+
+    def test_when_days_back_out_of_range_then_exits(self):
+        with pytest.raises(SystemExit):
+            batch.parse_args(
+                ["--lifelist", "a.csv", "--region", "AU-VIC", "--days-back", "31"]
+            )
+
+
+class TestRunBatch:
+    def test_when_run_then_writes_needs_and_locations(
+        self, fake_server, lifelist_path, tmp_path
+    ):
+        output_dir = tmp_path / "out"
+        results = batch.run_batch(
+            [lifelist_path], ["AU-VIC", "AU-NSW"], 7, {}, str(output_dir), workers=2
+        )
+
+        assert [result["region"] for result in results] == ["AU-VIC", "AU-NSW"]
+        needs_df = pd.read_parquet(output_dir / "alice" / "AU-VIC_needs.parquet")
+        assert needs_df["Common Name"].tolist() == ["Emu1", "Ostric2"]
+        locations_df = pd.read_parquet(
+            output_dir / "alice" / "AU-NSW_locations.parquet"
+        )
+        assert locations_df["num_species"].tolist() == [2]
+
+    def test_when_json_format_then_writes_records(
+        self, fake_server, lifelist_path, tmp_path
+    ):
+        results = batch.run_batch(
+            [lifelist_path], ["AU-VIC"], 7, {}, str(tmp_path), output_format="json"
+        )
+
+        with open(results[0]["outputs"][0]) as f:
+            records = json.load(f)
+        assert [record["Common Name"] for record in records] == ["Emu1", "Ostric2"]
+
+    def test_when_exports_share_a_name_then_each_gets_its_own_dir(
+        self, fake_server, tmp_path
+    ):
+        lifelist_paths = []
+        for birder in ("alice", "bob"):
+            (tmp_path / birder).mkdir()
+            path = tmp_path / birder / "MyEBirdData.csv"
+            path.write_bytes(LIFELIST_CSV)
+            lifelist_paths.append(str(path))
+        output_dir = tmp_path / "out"
+        results = batch.run_batch(
+            lifelist_paths + lifelist_paths[:1], ["AU-VIC"], 7, {}, str(output_dir)
+        )
+
+        assert [result["lifelist"] for result in results] == lifelist_paths
+        assert sorted(path.name for path in output_dir.iterdir()) == [
+            "MyEBirdData",
+            "MyEBirdData-2",
+        ]
+
+    def test_when_job_fails_then_error_is_reported(self, fake_server, tmp_path):
+        results = batch.run_batch(
+            [str(tmp_path / "absent.csv")], ["AU-VIC"], 7, {}, str(tmp_path)
+        )
+        assert "error" in results[0]
+
+
+class TestMain:
+    def test_when_token_missing_then_returns_error_code(
+        self, monkeypatch, lifelist_path
+    ):
+        monkeypatch.delenv("EBIRD_API_TOKEN", raising=False)
+        assert batch.main(["--lifelist", lifelist_path, "--region", "AU-VIC"]) == 2
+
+    def test_when_run_then_writes_summary(
+        self, fake_server, monkeypatch, lifelist_path, tmp_path
+    ):
+        monkeypatch.setenv("EBIRD_API_TOKEN", "token")
+        exit_code = batch.main(
+            [
+                "--lifelist",
+                lifelist_path,
+                "--region",
+                "AU-VIC",
+                "--output-dir",
+                str(tmp_path),
+                "--store",
+                str(tmp_path / "observations.sqlite"),
+            ]
+        )
+
+        assert exit_code == 0
+        with open(tmp_path / "summary.json") as f:
+            summary = json.load(f)
+        assert summary[0]["needs"] == 2
@@ -0,0 +1,143 @@
+import json
+import pytest
+import requests
+from benchmarks import fake_ebird, fixtures, load, run
+from lifers import ebird_api
+
+
+class TestSyntheticRegion:
+    def test_when_seeded_then_fixture_is_reproducible(self):
+        first = fixtures.synthetic_region("suburb", 1, seed=3, now="2024-05-31 18:00")
+        second = fixtures.synthetic_region("suburb", 1, seed=3, now="2024-05-31 18:00")
+        assert first.responses() == second.responses()
+        assert first.lifelist == second.lifelist
+
+    def test_when_days_back_longer_then_more_observations(self):
+        short = fixtures.synthetic_region("suburb", 1)
+        long = fixtures.synthetic_region("suburb", 30)
+        assert long.observation_count() > short.observation_count()
+
+
+class TestRun:
+    def test_when_run_then_every_stage_is_recorded(self):
+        report = run.run(scales=["suburb"], days=[1], repeat=1, map_rows=1_000)
+
+        stages = {(result["case"], result["stage"]) for result in report["results"]}
+        assert ("suburb-1d", "fetch_species_obs") in stages
+        assert ("map-1000", "aggregate_locations") in stages
+        assert all(
+            result["seconds_min"] <= result["seconds_median"]
+            for result in report["results"]
+        )
+        json.dumps(report)
+
+    def test_when_compared_then_pairs_matching_stages(self):
+        baseline = {
+            "results": [{"case": "a", "stage": "s", "seconds_min": 2.0}],
+        }
+        current = {
+            "results": [
+                {"case": "a", "stage": "s", "seconds_min": 1.0},
+                {"case": "b", "stage": "s", "seconds_min": 1.0},
+            ],
+        }
+        assert run.compare(baseline, current) == [("a", "s", 2.0, 1.0)]
+
+
+class TestFakeEBird:
+    def test_when_path_known_then_serves_body(self):
+        with fake_ebird.FakeEBird({"data/obs/AU/recent": b'[{"a": 1}]'}) as fake:
+            response = requests.get(f"{fake.base_url}/data/obs/AU/recent")
+            missing_species = requests.get(f"{fake.base_url}/data/obs/AU/recent/emu1")
+            missing = requests.get(f"{fake.base_url}/ref/region/list/subnational1/NZ")
+
+        assert response.json() == [{"a": 1}]
+        assert missing_species.json() == []
+        assert missing.status_code == 404
+
+    def test_when_requests_served_then_paths_and_peak_are_recorded(self):
+        with fake_ebird.FakeEBird({}) as fake:
+            requests.get(f"{fake.base_url}/data/obs/AU/recent/emu1?back=7")
+
+        assert fake.paths == ["/v2/data/obs/AU/recent/emu1?back=7"]
+        assert (fake.stats["max_in_flight"], fake.in_flight) == (1, 0)
+
+    def test_when_rate_limit_exceeded_then_answers_429(self):
+        fake = fake_ebird.FakeEBird({}, rate_limit=1, burst=2, clock=lambda: 0.0)
+        statuses = [fake.respond("/v2/data/obs/AU/recent/emu1")[0] for _ in range(3)]
+        assert statuses == [200, 200, 429]
+        assert fake.stats["throttled"] == 1
+
+    def test_when_error_rate_is_one_then_every_request_fails(self):
+        fake = fake_ebird.FakeEBird({}, error_rate=1.0)
+        assert fake.respond("/v2/data/obs/AU/recent/emu1")[0] == 503
+
+    def test_when_latency_spec_unknown_then_raises(self):
+        assert fake_ebird.parse_latency("fixed:0.5")(None) == 0.5
+        with pytest.raises(ValueError):
+            fake_ebird.parse_latency("gamma:1")
+
+    def test_when_recorded_then_round_trips(self, tmp_path):
+        bodies = fake_ebird.region_bodies([fixtures.synthetic_region("suburb", 1)])
+        fake_ebird.save_recorded(bodies, str(tmp_path))
+        assert fake_ebird.load_recorded(str(tmp_path)) == bodies
+        assert json.loads(bodies["ref/region/list/subnational2/AU"]) == [
+            {"code": "AU-VIC-MEL", "name": "AU-VIC-MEL"}
+        ]
+
+
+class TestLoad:
+    def test_when_run_then_reports_latency_percentiles(self):
+        report = load.run(
+            users=2, searches=1, scales=["suburb"], days_back=1, latency="fixed:0"
+        )
+
+        summary = report["summary"]
+        assert summary["searches"] == 2
+        assert summary["errors"] == 0
+        assert 0 < summary["p50_seconds"] <= summary["p95_seconds"]
+        assert report["server"]["requests"] > 0
+        json.dumps(report)
+
+    def test_when_store_used_then_searches_find_needs(self):
+        report = load.run(
+            users=2,
+            searches=1,
+            scales=["suburb"],
+            days_back=1,
+            latency="fixed:0",
+            use_store=True,
+        )
+
+        assert report["summary"]["errors"] == 0
+        assert all(sample["needs"] > 0 for sample in report["samples"])
+        assert ebird_api.get_observation_store() is None
+
+    def test_when_top_species_limited_then_fewer_requests_are_made(self):
+        def requests(top_species):
+            return load.run(
+                users=1,
+                searches=1,
+                scales=["suburb"],
+                days_back=1,
+                latency="fixed:0",
+                cold=True,
+                top_species=top_species,
+            )["server"]["requests"]
+
+        # One region list plus the two species fetched in full
+        assert requests(2) == 3 < requests(None)
+
+    def test_when_cold_then_every_search_fetches_its_region(self):
+        report = load.run(
+            users=1,
+            searches=3,
+            scales=["suburb"],
+            days_back=1,
+            latency="fixed:0",
+            cold=True,
+            top_species=2,
+        )
+
+        # Each search fetches the region list and its two top species again
+        assert report["server"]["requests"] == 3 * 3
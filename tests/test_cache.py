@@ -0,0 +1,130 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from lifers import cache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTTLCache:
+    @pytest.fixture
+    def clock(self):
+        return FakeClock()
+
+    def test_when_key_set_then_get_returns_value_and_counts_hit(self, clock):
+        response_cache = cache.TTLCache(clock=clock)
+        response_cache.set("key", b"value", ttl=60)
+        assert response_cache.get("key") == b"value"
+        assert response_cache.stats()["hits"] == 1
+
+    def test_when_key_missing_then_get_returns_none_and_counts_miss(self, clock):
+        response_cache = cache.TTLCache(clock=clock)
+        assert response_cache.get("key") is None
+        assert response_cache.stats()["misses"] == 1
+
+    def test_when_ttl_elapsed_then_entry_expires(self, clock):
+        response_cache = cache.TTLCache(clock=clock)
+        response_cache.set("key", b"value", ttl=60)
+        clock.now += 61
+        assert response_cache.get("key") is None
+        assert response_cache.stats()["entries"] == 0
+
+    def test_when_over_memory_bound_then_least_recently_used_is_evicted(self, clock):
+        response_cache = cache.TTLCache(max_bytes=10, clock=clock)
+        response_cache.set("a", b"aaaa", ttl=60)
+        response_cache.set("b", b"bbbb", ttl=60)
+        response_cache.get("a")
+        response_cache.set("c", b"cccc", ttl=60)
+        assert response_cache.get("b") is None
+        assert response_cache.get("a") == b"aaaa"
+        assert response_cache.stats()["evictions"] == 1
+        assert response_cache.stats()["bytes"] <= 10
+
+    def test_when_disk_tier_enabled_then_entries_survive_new_instance(
+        self, clock, tmp_path
+    ):
+        cache.TTLCache(disk_dir=tmp_path, clock=clock).set("key", b"value", ttl=60)
+        response_cache = cache.TTLCache(disk_dir=tmp_path, clock=clock)
+        assert response_cache.get("key") == b"value"
+        assert response_cache.stats()["disk_hits"] == 1
+        assert response_cache.get("key") == b"value"
+        assert response_cache.stats()["hits"] == 1
+
+    def test_when_writers_race_then_disk_entry_is_whole(self, clock, tmp_path):
+        response_cache = cache.TTLCache(disk_dir=tmp_path, clock=clock)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(
+                executor.map(
+                    lambda i: response_cache.set("key", b"value", ttl=60), range(200)
+                )
+            )
+
+        assert cache.TTLCache(disk_dir=tmp_path, clock=clock).get("key") == b"value"
+        assert [path.suffix for path in tmp_path.iterdir()] == [".cache"]
+
+    def test_when_disk_entry_expired_then_returns_none(self, clock, tmp_path):
+        cache.TTLCache(disk_dir=tmp_path, clock=clock).set("key", b"value", ttl=60)
+        clock.now += 61
+        assert cache.TTLCache(disk_dir=tmp_path, clock=clock).get("key") is None
+
+    def test_when_cleared_then_memory_and_disk_are_empty(self, clock, tmp_path):
+        response_cache = cache.TTLCache(disk_dir=tmp_path, clock=clock)
+        response_cache.set("key", b"value", ttl=60)
+        response_cache.clear()
+        assert response_cache.get("key") is None
+        assert list(tmp_path.iterdir()) == []
+
+
+class TestSingleFlight:
+    def test_when_calls_overlap_then_func_runs_once(self):
+        single_flight = cache.SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def slow():
+            calls.append(1)
+            started.set()
+            release.wait()
+            return b"body"
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            leader = executor.submit(single_flight.do, "key", slow)
+            started.wait()
+            followers = [
+                executor.submit(single_flight.do, "key", slow) for _ in range(3)
+            ]
+            while single_flight.coalesced < 3:
+                time.sleep(0.001)
+            release.set()
+            results = [leader.result()] + [f.result() for f in followers]
+
+        assert calls == [1]
+        assert results == [b"body"] * 4
+        assert single_flight.in_flight() == 0
+
+    def test_when_leader_fails_then_followers_share_the_error(self):
+        single_flight = cache.SingleFlight()
+        future, leader = single_flight.begin("key")
+        follower, follower_leads = single_flight.begin("key")
+        single_flight.finish("key", future, error=ValueError("boom"))
+
+        assert leader and not follower_leads
+        with pytest.raises(ValueError):
+            follower.result()
+
+    def test_when_leader_interrupted_then_follower_runs_its_own_call(self):
+        single_flight = cache.SingleFlight()
+        future, _ = single_flight.begin("key")
+        single_flight.finish("key", future, error=KeyboardInterrupt())
+
+        with pytest.raises(cache.Abandoned):
+            future.result()
+        assert single_flight.do("key", lambda: b"retried") == b"retried"
@@ -1,3 +1,4 @@
+import io
 import pytest
 import pandas as pd
 from pandas.testing import assert_frame_equal
@@ -23,6 +24,11 @@ class TestCountryCodes:
         result = data.country_codes()
         assert len(result) > 0
 
+    def test_when_artifact_rebuilt_then_matches_shipped_artifact(self, tmp_path):
+        json_path = data.compile_country_codes(json_path=str(tmp_path / "codes.json"))
+        assert data.country_codes(json_path) == data.country_codes()
+        assert data.country_codes()["Namibia"] == "NA"
+
 
 class TestLoadLifelistCSV:
     @pytest.fixture
@@ -75,6 +81,242 @@ class TestLoadLifelistCSV:
         df = data.load_lifelist_csv(sample_csv)
         assert all(df["Species Number"] == df.shape[0] - df.index.values)
 
+    def test_when_called_with_valid_csv_then_maps_species_code_from_taxonomy(
+        self, sample_csv
+    ):
+        df = data.load_lifelist_csv(sample_csv)
+        assert df["Species Code"].iloc[0] == "auonig1"
+
+    def test_when_called_with_valid_csv_then_uses_compact_dtypes(self, sample_csv):
+        df = data.load_lifelist_csv(sample_csv)
+        assert isinstance(df["Category"].dtype, pd.CategoricalDtype)
+        assert isinstance(df["LocID"].dtype, pd.CategoricalDtype)
+        assert df["Taxon Order"].dtype == "int32"
+
+    def test_when_csv_has_non_species_rows_then_keeps_original_row_positions(
+        self, tmp_path
+    ):
+        csv_path = tmp_path / "mixed.csv"
+        csv_path.write_text(
+            "Taxon Order,Category,Common Name,Scientific Name,Count,Location,S/P,"
+            "Date,LocID,SubID,Exotic,Countable\n"
+            "1,species,Emu,Dromaius novaehollandiae,1,A,AU-VIC,1 Jan 2024,L1,S1,,1\n"
+            "2,spuh,duck sp.,Anatidae sp.,1,A,AU-VIC,1 Jan 2024,L1,S1,,0\n"
+            "3,species,Common Ostrich,Struthio camelus,1,A,AU-VIC,1 Jan 2024,L1,S1,,1\n"
+        )
+        df = data.load_lifelist_csv(csv_path)
+        assert df.index.tolist() == [0, 2]
+        assert df["Species Code"].tolist() == ["emu1", "ostric2"]
+
+    def test_when_csv_has_renamed_taxon_then_maps_current_species_code(
+        self, sample_csv
+    ):
+        df = data.load_lifelist_csv(sample_csv)
+        assert df["Species Code"].tolist() == ["auonig1", "dobplo1"]
+
+    def test_when_csv_has_subspecies_rows_then_rolls_up_to_species(self, tmp_path):
+        csv_path = tmp_path / "subspecies.csv"
+        csv_path.write_text(
+            "Taxon Order,Category,Common Name,Scientific Name,Count,Location,S/P,"
+            "Date,LocID,SubID,Exotic,Countable\n"
+            "1,issf,Masked Lapwing (Black-shouldered),Vanellus miles novaehollandiae,"
+            "1,A,AU-VIC,1 Jan 2024,L1,S1,,1\n"
+            "2,species,Masked Lapwing,Vanellus miles,1,A,AU-VIC,1 Jan 2024,L1,S1,,1\n"
+            "3,slash,Snowy/Kentish Plover,Anarhynchus nivosus/alexandrinus,1,A,AU-VIC,"
+            "1 Jan 2024,L1,S1,,0\n"
+            "4,form,Emu/Cassowary,Made-up form,1,A,AU-VIC,1 Jan 2024,L1,S1,,0\n"
+        )
+        df = data.load_lifelist_csv(csv_path)
+        assert df.index.tolist() == [0]
+        assert df["Species Code"].tolist() == ["maslap1"]
+
+    def test_when_species_unknown_then_row_is_kept_unresolved(self, tmp_path):
+        csv_path = tmp_path / "unknown.csv"
+        csv_path.write_text(
+            "Taxon Order,Category,Common Name,Scientific Name,Count,Location,S/P,"
+            "Date,LocID,SubID,Exotic,Countable\n"
+            "1,species,Emu,Dromaius novaehollandiae,1,A,AU-VIC,1 Jan 2024,L1,S1,,1\n"
+            "2,species,Made-up Bird,Avis inventa,1,A,AU-VIC,1 Jan 2024,L1,S1,,1\n"
+        )
+        df = data.load_lifelist_csv(csv_path)
+        assert df.index.tolist() == [0, 1]
+        assert df["Species Code"].isna().tolist() == [False, True]
+
+    def test_when_called_with_uploaded_bytes_then_returns_dataframe(self, sample_csv):
+        df = data.load_lifelist_csv(io.BytesIO(sample_csv.read_bytes()))
+        assert len(df) == 2
+
+
+class TestRollupObservations:
+    def test_when_subspecies_observed_then_reported_as_species(self):
+        obs_df = pd.DataFrame(
+            {
+                "speciesCode": ["maslap3", "lapwin1", "maslap1", "newsp1"],
+                "comName": [
+                    "Masked Lapwing (Black-shouldered)",
+                    "lapwing sp.",
+                    "Masked Lapwing",
+                    "New Species",
+                ],
+                "locId": ["L1", "L2", "L3", "L4"],
+            }
+        )
+        result = data.rollup_observations(obs_df)
+        assert result["speciesCode"].tolist() == ["maslap1", "maslap1", "newsp1"]
+        assert result["comName"].tolist()[0] == "Masked Lapwing"
+        assert result["locId"].tolist() == ["L1", "L3", "L4"]
+
+    def test_when_deduplicated_then_keeps_first_sighting_per_species(self):
+        obs_df = pd.DataFrame(
+            {"speciesCode": ["maslap3", "maslap2", "emu1"], "locId": ["L1", "L2", "L3"]}
+        )
+        result = data.rollup_observations(obs_df, dedupe=True)
+        assert result["speciesCode"].tolist() == ["maslap1", "emu1"]
+        assert result["locId"].tolist() == ["L1", "L3"]
+
+    def test_when_only_species_then_returns_frame_unchanged(self):
+        obs_df = pd.DataFrame({"speciesCode": ["emu1", "ostric2"]})
+        assert data.rollup_observations(obs_df) is obs_df
+
+
+class TestMergeObservations:
+    def test_when_areas_overlap_then_newest_row_per_key_is_kept(self):
+        first = pd.DataFrame(
+            {
+                "speciesCode": ["emu1", "ostric2"],
+                "locId": ["L1", "L1"],
+                "obsDt": ["2024-05-30 07:00", "2024-05-30 08:00"],
+            }
+        )
+        second = pd.DataFrame(
+            {
+                "speciesCode": ["emu1", "emu1"],
+                "locId": ["L1", "L2"],
+                "obsDt": ["2024-05-31 07:00", "2024-05-29 07:00"],
+            }
+        )
+        result = data.merge_observations(
+            [first, pd.DataFrame(), second], ["speciesCode", "locId"]
+        )
+        assert list(zip(result["speciesCode"], result["locId"], result["obsDt"])) == [
+            ("emu1", "L1", "2024-05-31 07:00"),
+            ("ostric2", "L1", "2024-05-30 08:00"),
+            ("emu1", "L2", "2024-05-29 07:00"),
+        ]
+
+    def test_when_all_frames_empty_then_returns_empty_frame(self):
+        assert data.merge_observations([pd.DataFrame()], ["speciesCode"]).empty
+
+
+class TestCompactObservations:
+    @pytest.fixture
+    def obs_df(self):
+        return pd.DataFrame(
+            [
+                {
+                    "speciesCode": "emu1",
+                    "comName": "Emu",
+                    "sciName": "Dromaius novaehollandiae",
+                    "locId": "L1",
+                    "locName": "Beach",
+                    "lat": -37.8,
+                    "lng": 144.9,
+                    "obsDt": "2024-05-31 07:00",
+                    "howMany": "X",
+                    "obsValid": True,
+                    "subId": "S1",
+                },
+                {
+                    "speciesCode": "emu1",
+                    "comName": "Emu",
+                    "sciName": "Dromaius novaehollandiae",
+                    "locId": "L2",
+                    "locName": "Backyard",
+                    "lat": -37.9,
+                    "lng": 145.0,
+                    "obsDt": "2024-05-30",
+                    "howMany": 3,
+                    "locationPrivate": True,
+                    "subId": "S2",
+                },
+            ]
+        )
+
+    def test_when_compacted_then_only_used_columns_are_kept(self, obs_df):
+        compact = data.compact_observations(obs_df)
+        assert list(compact.columns) == list(data.OBSERVATION_DTYPES)
+        assert compact.dtypes.astype(str).to_dict() == data.OBSERVATION_DTYPES
+
+    def test_when_compacted_then_values_are_parsed(self, obs_df):
+        compact = data.compact_observations(obs_df)
+        assert compact["obsDt"].tolist() == [
+            pd.Timestamp("2024-05-31 07:00"),
+            pd.Timestamp("2024-05-30"),
+        ]
+        assert compact["howMany"].isna().tolist() == [True, False]
+        assert compact["locationPrivate"].tolist() == [False, True]
+
+    def test_when_compacted_then_frame_is_smaller(self, obs_df):
+        obs_df = pd.concat([obs_df] * 500, ignore_index=True)
+        assert (
+            data.compact_observations(obs_df).memory_usage(deep=True).sum()
+            < 0.5 * obs_df.memory_usage(deep=True).sum()
+        )
+
+    def test_when_compacted_then_frame_can_be_formatted(self, obs_df):
+        compact = data.compact_observations(obs_df)
+        needs = data.format_needs_data(compact)
+        locations, _, location_rows = data.format_location_details(compact)
+        assert needs["Species Information"].iloc[0].endswith("/emu1")
+        assert locations.index.tolist() == ["L2", "L1"]
+        assert "hotspot/L1" in locations.loc["L1", "links_html"]
+        assert sorted(location_rows) == ["L1", "L2"]
+
+    def test_when_frame_has_no_columns_then_returns_it(self):
+        obs_df = pd.DataFrame()
+        assert data.compact_observations(obs_df) is obs_df
+
+
+class TestCombineSpeciesObs:
+    @pytest.fixture
+    def needs_df(self):
+        return pd.DataFrame(
+            {
+                "speciesCode": ["emu1", "ostric2", "auonig1"],
+                "comName": ["Emu", "Common Ostrich", "Australian Owlet-nightjar"],
+                "locId": ["L1", "L2", None],
+                "lat": [-37.8, -37.9, None],
+                "lng": [144.9, 145.0, None],
+                "Needed By": [1, 2, 1],
+            }
+        )
+
+    def test_when_species_fetched_then_they_replace_latest_sighting(self, needs_df):
+        species_obs_df = pd.DataFrame(
+            {
+                "speciesCode": ["emu1", "emu1"],
+                "comName": ["Emu", "Emu"],
+                "locId": ["L3", "L4"],
+                "lat": [-38.0, -38.1],
+                "lng": [145.1, 145.2],
+            }
+        )
+        result = data.combine_species_obs(needs_df, species_obs_df)
+        assert list(zip(result["speciesCode"], result["locId"])) == [
+            ("ostric2", "L2"),
+            ("emu1", "L3"),
+            ("emu1", "L4"),
+        ]
+        assert "Needed By" not in result.columns
+
+    def test_when_nothing_fetched_then_needs_with_locations_are_kept(self, needs_df):
+        result = data.combine_species_obs(needs_df, pd.DataFrame())
+        assert result["locId"].tolist() == ["L1", "L2"]
+
+    def test_when_needs_have_no_locations_then_returns_empty_frame(self):
+        needs_df = pd.DataFrame({"speciesCode": ["emu1"]})
+        assert data.combine_species_obs(needs_df, pd.DataFrame()).empty
+
 
 class TestFormatNeedsData:
     @pytest.fixture
@@ -138,3 +380,59 @@ class TestFormatRegionNeedsDataForMap:
             }
         )
         pd.testing.assert_frame_equal(formatted_data, expected_data)
+
+    def test_when_hotspot_coordinates_jitter_then_keyed_on_location_id(self):
+        jittered = pd.DataFrame(
+            {
+                "locId": ["L1", "L1", "L2"],
+                "locName": ["Location1", "Location1", "Location2"],
+                "lat": [42.0, 42.0000001, 43.0],
+                "lng": [-71.0, -71.0, -72.0],
+                "comName": ["Sparrow", "Pigeon", "Pigeon"],
+            }
+        )
+        formatted_data = data.format_region_needs_data_for_map(jittered)
+        assert formatted_data["locName"].tolist() == ["Location1", "Location2"]
+        assert formatted_data["num_species"].tolist() == [2, 1]
+        assert formatted_data["tooltip_species"][0] == "1. Pigeon\n2. Sparrow"
+
+    def test_when_species_repeated_at_location_then_counted_once(self, sample_data):
+        repeated = pd.concat([sample_data, sample_data], ignore_index=True)
+        formatted_data = data.format_region_needs_data_for_map(repeated)
+        assert formatted_data["num_species"].tolist() == [2, 1]
+
+
+class TestFormatLocationDetails:
+    @pytest.fixture
+    def sample_data(self):
+        data = {
+            "locId": ["L2", "L1", "L2", "L3"],
+            "locName": ["Beach", "Arboretum", "Beach", "Backyard"],
+            "lat": [42.0, 43.0, 42.0000001, 44.0],
+            "lng": [-71.0, -72.0, -71.0, -73.0],
+            "locationPrivate": [False, False, False, True],
+            "comName": ["Sparrow", "Pigeon", "Pigeon", "Sparrow"],
+            "sciName": ["Passer domesticus", "Columba livia"] * 2,
+            "obsDt": ["2023-08-01"] * 4,
+            "howMany": [1, 2, 3, 4],
+        }
+        return pd.DataFrame(data)
+
+    def test_when_called_then_returns_one_row_per_location_sorted_by_name(
+        self, sample_data
+    ):
+        locations, _, _ = data.format_location_details(sample_data)
+        assert locations.index.tolist() == ["L1", "L3", "L2"]
+        assert locations["num_species"].tolist() == [1, 1, 2]
+
+    def test_when_called_then_rows_for_each_location_are_indexed(self, sample_data):
+        _, details, location_rows = data.format_location_details(sample_data)
+        beach = details.iloc[location_rows["L2"]]
+        assert beach["Common Name"].tolist() == ["Sparrow", "Pigeon"]
+        assert beach["Count"].tolist() == [1, 3]
+
+    def test_when_location_private_then_omits_hotspot_link(self, sample_data):
+        locations, _, _ = data.format_location_details(sample_data)
+        assert "hotspot/L1" in locations.loc["L1", "links_html"]
+        assert "Hotspot Information" not in locations.loc["L3", "links_html"]
+        assert "maps.google.com/?q=44.0,-73.0" in locations.loc["L3", "links_html"]
@@ -1,7 +1,8 @@
+from concurrent.futures import ThreadPoolExecutor
 import pytest
 import requests
 import pandas as pd
-from lifers import ebird_api
+from lifers import ebird_api, ebird_async, store
 
 
 class TestGetSubnationalCodes:
@@ -113,6 +114,50 @@ class TestGetRecentObservations:
             ebird_api.get_recent_observations(region_code, days_back, headers)
 
 
+class TestGeoArea:
+    def test_when_built_then_encodes_point_and_radius(self):
+        area = ebird_api.geo_area(-37.81362, 144.96305, 25)
+        assert area == "geo:-37.8136,144.9631,25"
+        assert ebird_api.recent_request(area, 7, "emu1") == (
+            "data/obs/geo/recent/emu1",
+            {"lat": "-37.8136", "lng": "144.9631", "dist": "25", "back": 7},
+        )
+
+    def test_when_notable_requested_then_uses_notable_endpoint(self):
+        area = ebird_api.geo_area(-37.8, 144.9, 10)
+        assert ebird_api.notable_request("AU-VIC", 7) == (
+            "data/obs/AU-VIC/recent/notable",
+            {"back": 7},
+        )
+        assert ebird_api.notable_request(area, 7)[0] == "data/obs/geo/recent/notable"
+
+    def test_when_radius_too_large_then_raises(self):
+        with pytest.raises(ValueError):
+            ebird_api.geo_area(-37.8, 144.9, 51)
+
+    def test_when_geo_area_queried_then_uses_geo_endpoint_without_store(
+        self, requests_mock, tmp_path
+    ):
+        observation_store = store.ObservationStore(str(tmp_path / "obs.sqlite"))
+        ebird_api.set_observation_store(observation_store)
+        requests_mock.get(
+            "https://api.ebird.org/v2/data/obs/geo/recent",
+            json=[{"speciesCode": "emu1"}],
+        )
+        area = ebird_api.geo_area(-37.8, 144.9, 10)
+
+        result = ebird_api.get_recent_observations(area, 3, {})
+
+        assert result == [{"speciesCode": "emu1"}]
+        assert requests_mock.last_request.qs == {
+            "back": ["3"],
+            "dist": ["10"],
+            "lat": ["-37.8000"],
+            "lng": ["144.9000"],
+        }
+        assert observation_store.coverage(area, store.REGION_SCOPE) is None
+
+
 class TestGetRecentSpeciesObs:
     mock_url = "https://api.ebird.org/v2/data/obs/AU-VIC-MEL/recent/SPECIES1"
 
@@ -180,3 +225,102 @@ class TestGetRecentSpeciesObs:
             ebird_api.get_recent_species_obs(
                 region_code, species_code, days_back, headers
             )
+
+
+class TestEBirdClient:
+    mock_url = "https://api.ebird.org/v2/data/obs/AU-VIC-MEL/recent"
+
+    def test_when_called_twice_then_returns_shared_client(self):
+        assert ebird_api.get_client() is ebird_api.get_client()
+
+    def test_when_created_then_pool_is_sized_to_fan_out(self):
+        client = ebird_api.EBirdClient(pool_size=8)
+        adapter = client.session.get_adapter("https://api.ebird.org")
+        assert adapter._pool_maxsize == 8
+        assert adapter.max_retries.status_forcelist == ebird_api.RETRY_STATUSES
+
+    def test_when_request_made_then_latency_is_recorded(self, requests_mock):
+        requests_mock.get(self.mock_url, json=[])
+        client = ebird_api.EBirdClient()
+        client.get("data/obs/AU-VIC-MEL/recent", params={"back": 1})
+        path, status_code, seconds = client.latencies[-1]
+        assert path == "data/obs/AU-VIC-MEL/recent"
+        assert status_code == 200
+        assert seconds >= 0
+
+    def test_when_client_replaced_then_wrappers_use_new_client(self, requests_mock):
+        requests_mock.get(self.mock_url, json=[{"speciesCode": "SPECIES1"}])
+        client = ebird_api.EBirdClient()
+        previous = ebird_api.get_client()
+        ebird_api.set_client(client)
+        try:
+            ebird_api.get_recent_observations("AU-VIC-MEL", 1, headers={})
+            assert len(client.latencies) == 1
+        finally:
+            ebird_api.set_client(previous)
+
+    def test_when_backing_off_then_delay_is_jittered_within_bound(self):
+        retry = ebird_api.JitteredRetry(total=5, backoff_factor=1).increment(
+            method="GET", url="/"
+        )
+        retry = retry.increment(method="GET", url="/")
+        for _ in range(20):
+            assert 0 <= retry.get_backoff_time() <= 2
+
+
+class TestResponseCache:
+    mock_url = "https://api.ebird.org/v2/data/obs/AU-VIC-MEL/recent"
+
+    def test_when_same_query_repeated_then_served_from_cache(self, requests_mock):
+        requests_mock.get(self.mock_url, json=[{"speciesCode": "SPECIES1"}])
+        headers = {"Authorization": "your_api_key_here"}
+        first = ebird_api.get_recent_observations("AU-VIC-MEL", 3, headers)
+        second = ebird_api.get_recent_observations("AU-VIC-MEL", 3, headers)
+        assert first == second
+        assert requests_mock.call_count == 1
+
+    def test_when_params_differ_then_cached_separately(self, requests_mock):
+        requests_mock.get(self.mock_url, json=[])
+        headers = {"Authorization": "your_api_key_here"}
+        ebird_api.get_recent_observations("AU-VIC-MEL", 3, headers)
+        ebird_api.get_recent_observations("AU-VIC-MEL", 7, headers)
+        assert requests_mock.call_count == 2
+
+    def test_when_request_fails_then_error_is_not_cached(self, requests_mock):
+        requests_mock.get(self.mock_url, [{"status_code": 404}, {"json": []}])
+        headers = {"Authorization": "your_api_key_here"}
+        with pytest.raises(requests.RequestException):
+            ebird_api.get_recent_observations("AU-VIC-MEL", 3, headers)
+        assert ebird_api.get_recent_observations("AU-VIC-MEL", 3, headers) == []
+
+
+class TestSingleFlight:
+    def test_when_identical_requests_overlap_then_one_goes_upstream(self, fake_server):
+        fake_server.delay = 0.2
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(
+                executor.map(
+                    lambda _: ebird_api.get_recent_species_obs("AU-VIC", "emu1", 7, {}),
+                    range(4),
+                )
+            )
+
+        assert fake_server.stats["requests"] == 1
+        assert all(result.equals(results[0]) for result in results)
+        results[0].loc[0, "comName"] = "Changed"
+        assert results[1].loc[0, "comName"] == "Emu1"
+
+    def test_when_async_and_sync_callers_overlap_then_one_goes_upstream(
+        self, fake_server
+    ):
+        fake_server.delay = 0.2
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            sync_result = executor.submit(
+                ebird_api.get_recent_species_obs, "AU-VIC", "emu1", 7, {}
+            )
+            async_results = ebird_async.fetch_species_obs(
+                "AU-VIC", ["emu1", "emu1"], 7, {}
+            )
+
+        assert fake_server.stats["requests"] == 1
+        assert all(result.equals(sync_result.result()) for result in async_results)
@@ -0,0 +1,83 @@
+import pytest
+import requests
+import pandas as pd
+from lifers import ebird_async
+
+
+class TestFetchSpeciesObs:
+    def test_when_called_then_returns_dataframe_per_species_in_order(self, fake_server):
+        species_codes = [f"SPECIES{i}" for i in range(5)]
+        results = ebird_async.fetch_species_obs("AU-VIC", species_codes, 7, {})
+        assert all(isinstance(result, pd.DataFrame) for result in results)
+        assert [result["speciesCode"][0] for result in results] == species_codes
+
+    def test_when_called_then_concurrency_is_bounded(self, fake_server):
+        species_codes = [f"SPECIES{i}" for i in range(12)]
+        ebird_async.fetch_species_obs("AU-VIC", species_codes, 7, {}, max_concurrency=3)
+        assert 1 < fake_server.stats["max_in_flight"] <= 3
+
+    def test_when_non_200_response_then_raises_request_exception(self, fake_server):
+        with pytest.raises(requests.RequestException):
+            ebird_async.fetch_species_obs("AU-VIC", ["missing"], 7, {})
+
+
+class TestGetSubnationalCodes:
+    def test_when_request_successful_then_returns_name_code_dict(self, fake_server):
+        async def run():
+            client = ebird_async._new_client(1)
+            try:
+                return await ebird_async.get_subnational_codes(client, "AU", 1, {})
+            finally:
+                client.close()
+
+        assert ebird_async.asyncio.run(run()) == {"Victoria": "AU-VIC"}
+
+
+class TestStreamSpeciesObs:
+    def test_when_streamed_then_yields_every_species(self, fake_server):
+        species_codes = [f"SPECIES{i}" for i in range(6)]
+        results = list(ebird_async.stream_species_obs("AU-VIC", species_codes, 7, {}))
+        assert sorted(code for code, _, _ in results) == sorted(species_codes)
+        assert all(error is None for _, _, error in results)
+        assert all(result["speciesCode"][0] == code for code, result, _ in results)
+
+    def test_when_one_species_fails_then_others_still_yield(self, fake_server):
+        results = dict(
+            (code, (result, error))
+            for code, result, error in ebird_async.stream_species_obs(
+                "AU-VIC", ["SPECIES1", "missing", "SPECIES2"], 7, {}
+            )
+        )
+        assert isinstance(results["missing"][1], requests.RequestException)
+        assert results["SPECIES1"][0]["speciesCode"][0] == "SPECIES1"
+        assert results["SPECIES2"][1] is None
+
+    def test_when_one_species_is_not_json_then_others_still_yield(
+        self, fake_server, monkeypatch
+    ):
+        get_species_obs = ebird_async.get_species_obs
+
+        async def garbled(client, areas, species_code, days_back, headers):
+            if species_code == "SPECIES1":
+                raise ValueError("Expecting value: line 1 column 1 (char 0)")
+            return await get_species_obs(
+                client, areas, species_code, days_back, headers
+            )
+
+        monkeypatch.setattr(ebird_async, "get_species_obs", garbled)
+        results = dict(
+            (code, (result, error))
+            for code, result, error in ebird_async.stream_species_obs(
+                "AU-VIC", ["SPECIES1", "SPECIES2", "SPECIES3"], 7, {}
+            )
+        )
+        assert isinstance(results["SPECIES1"][1], ValueError)
+        assert results["SPECIES2"][0]["speciesCode"][0] == "SPECIES2"
+        assert results["SPECIES3"][1] is None
+
+    def test_when_stream_closed_early_then_stops_cleanly(self, fake_server):
+        stream = ebird_async.stream_species_obs(
+            "AU-VIC", [f"SPECIES{i}" for i in range(10)], 7, {}, max_concurrency=2
+        )
+        next(stream)
+        stream.close()
@@ -0,0 +1,76 @@
+import pytest
+import pandas as pd
+from lifers import group
+
+
+@pytest.fixture
+def lifelists():
+    return {
+        "Ann": pd.DataFrame({"Species Code": ["emu1", "ostric2"]}),
+        "Bob": pd.DataFrame({"Species Code": ["emu1"]}),
+        "Cat": pd.DataFrame({"Species Code": ["soucas1"]}),
+    }
+
+
+@pytest.fixture
+def recent_obs_df():
+    return pd.DataFrame(
+        {
+            "speciesCode": ["emu1", "ostric2", "soucas1", "notataxon"],
+            "comName": ["Emu", "Common Ostrich", "Southern Cassowary", "Mystery"],
+        }
+    )
+
+
+class TestLifelistMatrix:
+    def test_when_built_then_has_one_column_per_birder(self, lifelists):
+        matrix = group.lifelist_matrix(lifelists)
+        assert matrix.shape == (len(group.species_index()), 3)
+        assert matrix.sum(axis=0).tolist() == [2, 1, 1]
+
+
+class TestGroupNeeds:
+    def test_when_needed_by_anyone_then_returns_species_any_birder_lacks(
+        self, lifelists, recent_obs_df
+    ):
+        needs_df = group.group_needs(recent_obs_df, lifelists, min_needed=1)
+        assert needs_df["speciesCode"].tolist() == [
+            "emu1",
+            "ostric2",
+            "soucas1",
+            "notataxon",
+        ]
+        assert needs_df["Needed By"].tolist() == [1, 2, 2, 3]
+
+    def test_when_needed_by_everyone_then_returns_species_nobody_has_seen(
+        self, lifelists, recent_obs_df
+    ):
+        needs_df = group.group_needs(recent_obs_df, lifelists, min_needed=3)
+        assert needs_df["speciesCode"].tolist() == ["notataxon"]
+
+    def test_when_needed_by_k_of_n_then_includes_per_birder_columns(
+        self, lifelists, recent_obs_df
+    ):
+        needs_df = group.group_needs(recent_obs_df, lifelists, min_needed=2)
+        assert needs_df["speciesCode"].tolist() == ["ostric2", "soucas1", "notataxon"]
+        assert needs_df["Ann"].tolist() == [False, True, True]
+        assert needs_df["Bob"].tolist() == [True, True, True]
+        assert needs_df["Cat"].tolist() == [True, False, True]
+
+    def test_when_no_recent_observations_then_returns_empty_frame(self, lifelists):
+        needs_df = group.group_needs(pd.DataFrame(), lifelists)
+        assert needs_df.empty
+        assert "Needed By" in needs_df.columns
+
+
+class TestLabelNeededBy:
+    def test_when_labelled_then_common_names_list_birders(
+        self, lifelists, recent_obs_df
+    ):
+        needs_df = group.group_needs(recent_obs_df, lifelists, min_needed=2)
+        region_needs_df = pd.DataFrame(
+            {"speciesCode": ["ostric2", "ostric2"], "comName": ["Common Ostrich"] * 2}
+        )
+        labelled_df = group.label_needed_by(region_needs_df, needs_df, list(lifelists))
+        assert labelled_df["comName"].tolist() == ["Common Ostrich (Bob, Cat)"] * 2
+        assert region_needs_df["comName"][0] == "Common Ostrich"
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+from lifers import memory, scheduler
+
+
+class FakeClock:
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def frame(rows):
+    return pd.DataFrame({"a": np.zeros(rows, dtype=np.int64)})
+
+
+class TestValueBytes:
+    def test_when_nested_then_frames_and_arrays_are_summed(self):
+        df = frame(100)
+        size = memory.value_bytes(df)
+        assert size >= 800
+        assert memory.value_bytes((df, [df], {"rows": np.zeros(10)}, "x")) == (
+            2 * size + 80
+        )
+
+
+class TestMemoryAccountant:
+    def test_when_frames_tracked_then_usage_is_per_session(self):
+        accountant = memory.MemoryAccountant(budget=10**6)
+        with scheduler.session("alice"):
+            accountant.track("needs", frame(10))
+        accountant.track("needs", frame(100), session="bob")
+        accountant.track("needs", frame(200), session="bob")
+
+        usage = accountant.usage()
+        assert sorted(usage) == ["alice", "bob"]
+        assert usage["bob"] == {"needs": memory.value_bytes(frame(200))}
+        assert accountant.stats()["bytes"] == sum(
+            sum(frames.values()) for frames in usage.values()
+        )
+
+    def test_when_over_budget_then_frame_is_refused(self):
+        accountant = memory.MemoryAccountant(budget=2000)
+        accountant.track("needs", frame(100), session="alice")
+        with pytest.raises(memory.MemoryBudgetExceeded, match="over its"):
+            accountant.track("observations", frame(200), session="alice")
+
+        assert accountant.usage()["alice"] == {"needs": memory.value_bytes(frame(100))}
+        assert accountant.stats()["refused"] == 1
+        # Other sessions have budgets of their own
+        accountant.track("observations", frame(200), session="bob")
+
+    def test_when_released_then_session_is_forgotten(self):
+        accountant = memory.MemoryAccountant()
+        accountant.track("needs", frame(10), session="alice")
+        accountant.release("alice")
+        assert accountant.usage() == {}
+
+    def test_when_session_idle_then_it_is_evicted(self, clock):
+        accountant = memory.MemoryAccountant(idle_ttl=60, clock=clock)
+        accountant.track("needs", frame(10), session="alice")
+        clock.now += 30
+        accountant.track("needs", frame(10), session="bob")
+        clock.now += 45
+
+        assert list(accountant.usage()) == ["bob"]
+        assert accountant.stats()["evicted_sessions"] == 1
@@ -0,0 +1,100 @@
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from lifers import ebird_api, ebird_async, metrics
+
+
+@pytest.fixture
+def collecting():
+    metrics.reset()
+    metrics.enable()
+    yield
+    metrics.disable()
+    metrics.reset()
+
+
+class TestSpan:
+    def test_when_disabled_then_nothing_is_recorded(self):
+        metrics.disable()
+        with metrics.span("stage"):
+            pass
+        metrics.increment("api_calls")
+        assert metrics.snapshot()["spans"] == {}
+        assert metrics.snapshot()["counters"]["api_calls"] == 0
+
+    def test_when_enabled_then_span_is_timed(self, collecting):
+        with metrics.span("stage"):
+            pass
+        with metrics.span("stage"):
+            pass
+        stats = metrics.snapshot()["spans"]["stage"]
+        assert stats["count"] == 2
+        assert stats["max"] >= stats["last"] >= 0
+
+    def test_when_timed_function_raises_then_span_still_recorded(self, collecting):
+        @metrics.timed("failing")
+        def failing():
+            raise ValueError
+
+        with pytest.raises(ValueError):
+            failing()
+        assert metrics.snapshot()["spans"]["failing"]["count"] == 1
+
+
+class TestRecordRequest:
+    def test_when_species_fetched_then_counters_and_latencies_recorded(
+        self, fake_server, collecting
+    ):
+        ebird_async.fetch_species_obs("AU-VIC", ["emu1", "ostric2"], 7, {})
+        ebird_async.fetch_species_obs("AU-VIC", ["emu1"], 7, {})
+
+        counters = metrics.snapshot()["counters"]
+        assert counters["api_calls"] == 2
+        assert counters["cache_hits"] == 1
+        assert counters["cache_misses"] == 2
+        assert counters["bytes_received"] > 0
+        assert sorted(code for code, _, _ in metrics.species_latencies()) == [
+            "emu1",
+            "ostric2",
+        ]
+
+    def test_when_notable_fetched_then_not_listed_as_species(
+        self, fake_server, collecting
+    ):
+        ebird_api.get_notable_observations("AU-VIC", 7, {})
+        ebird_async.fetch_species_obs("AU-VIC", ["emu1"], 7, {})
+
+        assert metrics.snapshot()["counters"]["api_calls"] == 2
+        assert [code for code, _, _ in metrics.species_latencies()] == ["emu1"]
+
+    def test_when_recent_observations_fetched_then_span_recorded(
+        self, fake_server, collecting
+    ):
+        ebird_api.get_recent_observations("AU-VIC", 7, {})
+        assert metrics.snapshot()["spans"]["fetch_recent"]["count"] == 1
+        assert metrics.snapshot()["counters"]["api_calls"] == 1
+
+
+class TestPrometheus:
+    def test_when_exported_then_text_format_lists_spans_and_counters(
+        self, collecting, tmp_path
+    ):
+        with metrics.span("fetch_recent"):
+            pass
+        metrics.increment("retries", 2)
+        path = tmp_path / "lifers.prom"
+        metrics.write_prometheus(path)
+
+        text = path.read_text()
+        assert 'lifers_span_seconds_count{span="fetch_recent"} 1' in text
+        assert "lifers_retries_total 2" in text
+        assert "# TYPE lifers_api_calls_total counter" in text
+
+    def test_when_sessions_export_together_then_every_write_succeeds(
+        self, collecting, tmp_path
+    ):
+        path = tmp_path / "lifers.prom"
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda _: metrics.write_prometheus(path), range(200)))
+
+        assert "lifers_api_calls_total" in path.read_text()
+        assert [p.name for p in tmp_path.iterdir()] == ["lifers.prom"]
@@ -0,0 +1,360 @@
+import pytest
+import numpy as np
+import pandas as pd
+from lifers import ebird_api, pipeline, scheduler, store
+
+LIFELIST_CSV = b"""Row #,Taxon Order,Category,Common Name,Scientific Name,Count,Location,S/P,Date,LocID,SubID,Exotic,Countable
+1,3764,species,Australian Owlet-nightjar,Aegotheles cristatus,1,"Finland Road, Paradise Waters",AU-QLD,12 Aug 2023,L3862700,S147015015,,1
+"""
+
+
+@pytest.fixture(autouse=True)
+def clear_stages():
+    pipeline.clear_stages()
+    yield
+    pipeline.clear_stages()
+
+
+class TestContentHash:
+    def test_when_inputs_equal_then_hashes_equal(self):
+        frame = pd.DataFrame({"a": [1, 2]})
+        assert pipeline.content_hash(b"x", frame, ("AU", 7)) == pipeline.content_hash(
+            b"x", frame.copy(), ("AU", 7)
+        )
+
+    def test_when_frame_content_differs_then_hashes_differ(self):
+        assert pipeline.content_hash(
+            pd.DataFrame({"a": [1, 2]})
+        ) != pipeline.content_hash(pd.DataFrame({"a": [1, 3]}))
+
+    def test_when_object_array_given_then_hashes_by_value(self):
+        codes = np.array(["emu1", "ostric2"], dtype=object)
+        assert pipeline.content_hash(codes) == pipeline.content_hash(
+            ["emu1", "ostric2"]
+        )
+
+
+class TestMemoize:
+    def test_when_inputs_repeat_then_function_runs_once(self):
+        calls = []
+
+        @pipeline.memoize()
+        def stage(value):
+            calls.append(value)
+            return value * 2
+
+        assert stage(2) == 4
+        assert stage(2) == 4
+        assert calls == [2]
+        assert stage.cache_stats() == {"hits": 1, "misses": 1, "entries": 1}
+
+    def test_when_over_max_entries_then_oldest_is_evicted(self):
+        calls = []
+
+        @pipeline.memoize(max_entries=2)
+        def stage(value):
+            calls.append(value)
+            return value
+
+        for value in [1, 2, 3, 1]:
+            stage(value)
+        assert calls == [1, 2, 3, 1]
+
+    def test_when_result_mutated_then_memo_is_unchanged(self):
+        @pipeline.memoize()
+        def stage():
+            return pd.DataFrame({"a": [1, 2]})
+
+        result = stage()
+        result.loc[0, "a"] = 99
+        assert stage()["a"].tolist() == [1, 2]
+
+    def test_when_kwarg_ignored_then_it_does_not_affect_key(self):
+        calls = []
+
+        @pipeline.memoize(ignore=("callback",))
+        def stage(value, callback=None):
+            calls.append(value)
+            return value
+
+        stage(1, callback=lambda: None)
+        stage(1, callback=lambda: None)
+        assert calls == [1]
+
+    def test_when_cache_if_rejects_result_then_not_memoized(self):
+        calls = []
+
+        @pipeline.memoize(cache_if=lambda result: result > 0)
+        def stage(value):
+            calls.append(value)
+            return value
+
+        stage(0)
+        stage(0)
+        assert calls == [0, 0]
+
+    def test_when_over_max_bytes_then_oldest_is_evicted(self):
+        calls = []
+
+        @pipeline.memoize(max_bytes=2000)
+        def stage(value):
+            calls.append(value)
+            return pd.DataFrame({"a": np.full(100, value, dtype=np.int64)})
+
+        for value in [1, 2, 3, 1]:
+            stage(value)
+        assert calls == [1, 2, 3, 1]
+        assert stage.cache_stats()["entries"] == 2
+
+    def test_when_result_over_max_bytes_then_not_memoized(self):
+        calls = []
+
+        @pipeline.memoize(max_bytes=100)
+        def stage(value):
+            calls.append(value)
+            return pd.DataFrame({"a": np.zeros(100)})
+
+        stage(1)
+        stage(1)
+        assert calls == [1, 1]
+
+    def test_when_uncached_then_nested_stages_recompute(self):
+        calls = []
+
+        @pipeline.memoize()
+        def inner(value):
+            calls.append(value)
+            return value
+
+        @pipeline.memoize()
+        def outer(value):
+            return inner(value) * 2
+
+        outer(1)
+        with pipeline.uncached():
+            assert outer(1) == 2
+        assert calls == [1, 1]
+        assert outer.cache_stats()["entries"] == 1
+
+    def test_when_result_set_then_call_is_answered_from_memo(self):
+        calls = []
+
+        @pipeline.memoize()
+        def stage(value):
+            calls.append(value)
+            return value * 2
+
+        assert stage.cache_get(2) is None
+        stage.cache_set(5, 2)
+        assert stage.cache_get(2) == 5
+        assert stage(2) == 5
+        assert calls == []
+
+
+class TestStages:
+    mock_url = "https://api.ebird.org/v2/data/obs/AU-VIC/recent"
+
+    def test_when_lifelist_unchanged_then_load_is_memoized(self):
+        first = pipeline.load_lifelist(LIFELIST_CSV)
+        pipeline.load_lifelist(LIFELIST_CSV)
+        assert len(first) == 1
+        assert pipeline.load_lifelist.cache_stats()["hits"] == 1
+
+    def test_when_needs_computed_then_lifelist_species_are_excluded(
+        self, requests_mock
+    ):
+        requests_mock.get(
+            self.mock_url,
+            json=[{"speciesCode": "auonig1"}, {"speciesCode": "emu1"}],
+        )
+        needs_df = pipeline.compute_needs(LIFELIST_CSV, "AU-VIC", 7, {})
+        assert needs_df["speciesCode"].tolist() == ["emu1"]
+
+    def test_when_subspecies_and_spuhs_observed_then_needs_are_species(
+        self, requests_mock
+    ):
+        requests_mock.get(
+            self.mock_url,
+            json=[
+                {"speciesCode": "maslap3"},
+                {"speciesCode": "lapwin1"},
+                {"speciesCode": "maslap1"},
+            ],
+        )
+        needs_df = pipeline.compute_needs(LIFELIST_CSV, "AU-VIC", 7, {})
+        assert needs_df["speciesCode"].tolist() == ["maslap1"]
+
+    def test_when_only_days_back_changes_then_lifelist_is_not_reloaded(
+        self, requests_mock
+    ):
+        requests_mock.get(self.mock_url, json=[{"speciesCode": "emu1"}])
+        pipeline.compute_needs(LIFELIST_CSV, "AU-VIC", 7, {})
+        pipeline.compute_needs(LIFELIST_CSV, "AU-VIC", 14, {})
+        assert pipeline.load_lifelist.cache_stats() == {
+            "hits": 1,
+            "misses": 1,
+            "entries": 1,
+        }
+        assert pipeline.fetch_recent.cache_stats()["misses"] == 2
+
+    def test_when_recent_fetched_then_observations_are_compact(self, requests_mock):
+        requests_mock.get(
+            self.mock_url,
+            json=[
+                {
+                    "speciesCode": "emu1",
+                    "comName": "Emu",
+                    "obsDt": "2024-05-31 07:00",
+                    "obsValid": True,
+                }
+            ],
+        )
+        recent_obs_df = pipeline.fetch_recent("AU-VIC", 7, {})
+        assert recent_obs_df.dtypes.astype(str).to_dict() == {
+            "speciesCode": "category",
+            "comName": "category",
+            "obsDt": "datetime64[ns]",
+        }
+
+    def test_when_recent_observations_empty_then_needs_are_empty(self, requests_mock):
+        requests_mock.get(self.mock_url, json=[])
+        assert pipeline.compute_needs(LIFELIST_CSV, "AU-VIC", 7, {}).empty
+
+
+class TestLazySpeciesObs:
+    @pytest.fixture
+    def needs_df(self):
+        return pd.DataFrame(
+            {
+                "speciesCode": ["auonig1", "emu1", "ostric2"],
+                "comName": ["Australian Owlet-nightjar", "Emu", "Common Ostrich"],
+                "locId": ["L2", "L3", "L4"],
+                "lat": [-37.7, -37.6, -37.5],
+                "lng": [144.8, 144.7, 144.6],
+                "obsDt": ["2024-05-30 07:00", "2024-05-31 07:00", "2024-05-29 07:00"],
+            }
+        )
+
+    def test_when_ranked_by_recency_then_newest_sighting_first(self, needs_df):
+        assert pipeline.rank_species(needs_df, "AU-VIC", 7, {}) == [
+            "emu1",
+            "auonig1",
+            "ostric2",
+        ]
+
+    def test_when_ranked_by_rarity_then_notable_species_lead(
+        self, needs_df, requests_mock
+    ):
+        requests_mock.get(
+            "https://api.ebird.org/v2/data/obs/AU-VIC/recent/notable",
+            json=[{"speciesCode": "ostric2"}, {"speciesCode": "ostric2"}],
+        )
+        assert pipeline.rank_species(needs_df, "AU-VIC", 7, {}, "rarity") == [
+            "ostric2",
+            "emu1",
+            "auonig1",
+        ]
+
+    def test_when_ranking_unknown_then_raises(self, needs_df):
+        with pytest.raises(ValueError):
+            pipeline.rank_species(needs_df, "AU-VIC", 7, {}, "size")
+
+    def test_when_top_species_fetched_then_others_keep_latest_sighting(
+        self, needs_df, fake_server
+    ):
+        region_needs_df, failed_species = pipeline.lazy_species_obs(
+            "AU-VIC", needs_df, ["emu1"], 7, {}
+        )
+
+        assert [path.split("?")[0] for path in fake_server.paths] == [
+            "/v2/data/obs/AU-VIC/recent/emu1"
+        ]
+        assert sorted(
+            zip(region_needs_df["speciesCode"], region_needs_df["locId"])
+        ) == [
+            ("auonig1", "L2"),
+            ("emu1", "L1"),
+            ("ostric2", "L4"),
+        ]
+        assert failed_species == []
+
+    def test_when_no_species_chosen_then_nothing_is_fetched(
+        self, needs_df, fake_server
+    ):
+        region_needs_df, _ = pipeline.lazy_species_obs("AU-VIC", needs_df, [], 7, {})
+        assert fake_server.stats["requests"] == 0
+        assert len(region_needs_df) == 3
+
+    def test_when_species_chosen_then_only_it_goes_upstream(
+        self, needs_df, fake_server, tmp_path, monkeypatch
+    ):
+        ebird_api.set_observation_store(
+            store.ObservationStore(str(tmp_path / "observations.sqlite"))
+        )
+        streamed = []
+        stream_species_obs = pipeline.ebird_async.stream_species_obs
+
+        def spy(region_code, species_codes, *args, **kwargs):
+            streamed.append(sorted(species_codes))
+            return stream_species_obs(region_code, species_codes, *args, **kwargs)
+
+        monkeypatch.setattr(pipeline.ebird_async, "stream_species_obs", spy)
+        pipeline.lazy_species_obs("AU-VIC", needs_df, ["emu1", "ostric2"], 7, {})
+        ebird_api.response_cache.clear()
+        region_needs_df, failed_species = pipeline.lazy_species_obs(
+            "AU-VIC", needs_df, ["emu1", "ostric2", "auonig1"], 7, {}
+        )
+
+        assert sorted(path.split("?")[0] for path in fake_server.paths) == [
+            "/v2/data/obs/AU-VIC/recent/auonig1",
+            "/v2/data/obs/AU-VIC/recent/emu1",
+            "/v2/data/obs/AU-VIC/recent/ostric2",
+        ]
+        assert streamed == [["emu1", "ostric2"], ["auonig1"]]
+        assert sorted(region_needs_df["speciesCode"]) == ["auonig1", "emu1", "ostric2"]
+        assert failed_species == []
+
+    def test_when_sessions_share_species_then_each_is_fetched_once(self, fake_server):
+        species_codes = [f"species{i}" for i in range(40)]
+        with scheduler.session("first"):
+            pipeline.fetch_species_obs("AU-VIC", species_codes, 7, {})
+        ebird_api.response_cache.clear()
+        with scheduler.session("second"):
+            region_needs_df, _ = pipeline.fetch_species_obs(
+                "AU-VIC", species_codes[::-1], 7, {}
+            )
+
+        assert fake_server.stats["requests"] == 40
+        assert len(region_needs_df) == 40
+        assert pipeline.species_memo.cache_stats()["hits"] == 40
+
+
+class TestSearchAreas:
+    def test_when_regions_overlap_then_species_fetched_only_where_reported(
+        self, fake_server
+    ):
+        fake_server.region_species = {
+            "AU-VIC": ["emu1", "ostric2"],
+            "AU-NSW": ["emu1", "auonig1"],
+        }
+        areas = ("AU-VIC", "AU-NSW")
+
+        needs_df = pipeline.compute_needs(LIFELIST_CSV, areas, 7, {})
+        region_needs_df, failed_species = pipeline.fetch_species_obs(
+            areas, tuple(sorted(needs_df["speciesCode"])), 7, {}
+        )
+
+        assert sorted(needs_df["speciesCode"]) == ["emu1", "ostric2"]
+        species_paths = sorted(
+            path.split("/v2/")[1].split("?")[0]
+            for path in fake_server.paths
+            if "/recent/" in path
+        )
+        assert species_paths == [
+            "data/obs/AU-NSW/recent/emu1",
+            "data/obs/AU-VIC/recent/emu1",
+            "data/obs/AU-VIC/recent/ostric2",
+        ]
+        # Both regions report emu1 at the same location, which is kept once
+        assert sorted(region_needs_df["speciesCode"]) == ["emu1", "ostric2"]
+        assert failed_species == []
@@ -0,0 +1,63 @@
+import os
+import pytest
+from lifers import regions
+
+SUBNATIONAL1_URL = "https://api.ebird.org/v2/ref/region/list/subnational1/AU"
+SUBNATIONAL2_URL = "https://api.ebird.org/v2/ref/region/list/subnational2/AU"
+
+
+@pytest.fixture
+def mock_regions(requests_mock):
+    requests_mock.get(
+        SUBNATIONAL1_URL,
+        json=[
+            {"name": "Victoria", "code": "AU-VIC"},
+            {"name": "Tasmania", "code": "AU-TAS"},
+        ],
+    )
+    requests_mock.get(
+        SUBNATIONAL2_URL,
+        json=[
+            {"name": "Melbourne", "code": "AU-VIC-MEL"},
+            {"name": "Geelong", "code": "AU-VIC-GEE"},
+            {"name": "Hobart", "code": "AU-TAS-HOB"},
+        ],
+    )
+    return requests_mock
+
+
+class TestRegionIndex:
+    def test_when_built_then_answers_name_to_code_lookups(self, mock_regions):
+        index = regions.fetch_region_index("AU", headers={})
+        assert index.subnational1_codes == {"Victoria": "AU-VIC", "Tasmania": "AU-TAS"}
+        assert index.names["AU-VIC-MEL"] == "Melbourne"
+
+    def test_when_built_then_answers_parent_to_children_lookups(self, mock_regions):
+        index = regions.fetch_region_index("AU", headers={})
+        assert index.subnational2_codes("AU-VIC") == {
+            "Melbourne": "AU-VIC-MEL",
+            "Geelong": "AU-VIC-GEE",
+        }
+        assert index.subnational2_codes("AU-TAS") == {"Hobart": "AU-TAS-HOB"}
+
+    def test_when_parent_has_no_children_then_returns_empty_dict(self, mock_regions):
+        index = regions.fetch_region_index("AU", headers={})
+        assert index.subnational2_codes("AU-XX") == {}
+
+
+class TestLoadRegionIndex:
+    def test_when_loaded_twice_then_second_load_is_offline(
+        self, mock_regions, tmp_path
+    ):
+        regions.load_region_index("AU", headers={}, regions_dir=tmp_path)
+        calls = mock_regions.call_count
+        index = regions.load_region_index("AU", headers={}, regions_dir=tmp_path)
+        assert mock_regions.call_count == calls
+        assert index.subnational2_codes("AU-TAS") == {"Hobart": "AU-TAS-HOB"}
+
+    def test_when_persisted_index_is_stale_then_rebuilds(self, mock_regions, tmp_path):
+        regions.load_region_index("AU", headers={}, regions_dir=tmp_path)
+        path = tmp_path / "AU.json"
+        os.utime(path, (0, 0))
+        regions.load_region_index("AU", headers={}, regions_dir=tmp_path, max_age=60)
+        assert os.path.getmtime(path) > 0
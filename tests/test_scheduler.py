@@ -0,0 +1,176 @@
+import asyncio
+import time
+import pytest
+from benchmarks import fake_ebird
+from lifers import ebird_api, ebird_async, scheduler
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+@pytest.fixture
+def unlimited():
+    request_scheduler = scheduler.Scheduler(
+        rate=1e9, burst=1e9, initial_concurrency=1, max_concurrency=1
+    )
+    yield request_scheduler
+    request_scheduler.close()
+
+
+class TestTokenBucket:
+    def test_when_burst_spent_then_requests_wait_for_refill(self):
+        request_scheduler = scheduler.Scheduler(rate=20, burst=2)
+        start = time.monotonic()
+        for _ in range(4):
+            request_scheduler.acquire()
+            request_scheduler.release(200)
+        assert time.monotonic() - start >= 0.09
+        request_scheduler.close()
+
+
+class TestConcurrency:
+    def test_when_limit_reached_then_acquire_times_out(self, unlimited):
+        unlimited.acquire()
+        with pytest.raises(TimeoutError):
+            unlimited.acquire(timeout=0.05)
+        assert unlimited.stats()["queue_depth"] == 0
+
+    def test_when_slot_released_then_waiter_proceeds(self, unlimited):
+        unlimited.acquire()
+        granted = []
+        unlimited.submit(lambda: granted.append(True))
+        assert unlimited.stats()["queue_depth"] == 1
+        unlimited.release(200)
+        wait_until(lambda: granted)
+
+    def test_when_throttled_then_limit_halves_and_recovers(self):
+        request_scheduler = scheduler.Scheduler(initial_concurrency=8)
+        request_scheduler.acquire()
+        request_scheduler.release(429)
+        assert request_scheduler.stats()["concurrency_limit"] == 4
+        for _ in range(20):
+            request_scheduler.acquire()
+            request_scheduler.release(200)
+        assert request_scheduler.stats()["concurrency_limit"] > 4
+        request_scheduler.close()
+
+    def test_when_rate_limited_then_rate_halves_and_recovers(self):
+        request_scheduler = scheduler.Scheduler(rate=1000, burst=1000)
+        for status_code in (429, 429):
+            request_scheduler.acquire()
+            request_scheduler.release(status_code)
+        assert request_scheduler.stats()["rate"] == 500
+        request_scheduler.acquire()
+        request_scheduler.release(503)
+        assert request_scheduler.stats()["rate"] == 500
+        request_scheduler.acquire()
+        request_scheduler.release(200)
+        assert request_scheduler.rate > 500
+        request_scheduler.close()
+
+    def test_when_burst_of_failures_then_limit_halves_once(self):
+        request_scheduler = scheduler.Scheduler(initial_concurrency=16)
+        for _ in range(16):
+            request_scheduler.acquire()
+        for _ in range(16):
+            request_scheduler.release(503)
+        stats = request_scheduler.stats()
+        assert (stats["throttled"], stats["concurrency_limit"]) == (16, 8)
+        request_scheduler.close()
+
+    def test_when_request_abandoned_then_limit_is_unchanged(self):
+        request_scheduler = scheduler.Scheduler(initial_concurrency=8)
+        request_scheduler.acquire()
+        request_scheduler.release(None, adapt=False)
+        stats = request_scheduler.stats()
+        assert (stats["throttled"], stats["concurrency_limit"]) == (0, 8)
+        assert stats["in_flight"] == 0
+        request_scheduler.close()
+
+
+class TestFairQueuing:
+    def test_when_sessions_queue_then_granted_round_robin(self, unlimited):
+        unlimited.acquire("holder")
+        granted = []
+        for _ in range(3):
+            unlimited.submit(lambda: granted.append("large"), "large")
+        unlimited.submit(lambda: granted.append("small"), "small")
+
+        for count in range(1, 5):
+            unlimited.release(200)
+            wait_until(lambda: len(granted) == count)
+        assert granted == ["large", "small", "large", "large"]
+
+    def test_when_session_context_set_then_requests_use_it(self, unlimited):
+        unlimited.acquire()
+        with scheduler.session("suburb"):
+            ticket = unlimited.submit(lambda: None)
+        assert ticket.session == "suburb"
+
+    def test_when_counting_then_only_own_grants_are_tallied(self, unlimited):
+        unlimited.acquire()
+        unlimited.release(200)
+        with scheduler.counting() as tally:
+            for _ in range(2):
+                unlimited.acquire()
+                unlimited.release(200)
+        assert tally == {"requests": 2}
+
+
+class TestAcquireAsync:
+    def test_when_cancelled_while_waiting_then_nothing_leaks(self, unlimited):
+        async def run():
+            unlimited.acquire()
+            task = asyncio.ensure_future(unlimited.acquire_async())
+            await asyncio.sleep(0.01)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(run())
+        assert unlimited.stats()["queue_depth"] == 0
+        assert unlimited.stats()["in_flight"] == 1
+
+
+class TestClients:
+    def test_when_species_fetched_then_every_request_is_scheduled(self, fake_server):
+        ebird_async.fetch_species_obs("AU-VIC", ["emu1", "ostric2", "auonig1"], 7, {})
+        stats = scheduler.get_scheduler().stats()
+        assert stats["granted"] == 3
+        assert stats["in_flight"] == 0
+
+    def test_when_rate_limited_then_fan_out_retries_after_delay(self, monkeypatch):
+        with fake_ebird.FakeEBird({}, rate_limit=4, burst=1) as fake:
+            monkeypatch.setattr(ebird_api, "API_BASE_URL", fake.base_url)
+            results = ebird_async.fetch_species_obs(
+                "AU-VIC", ["emu1", "ostric2"], 7, {}
+            )
+
+        assert len(results) == 2
+        assert fake.stats["throttled"] >= 1
+        assert scheduler.get_scheduler().stats()["rate"] < scheduler.RATE
+
+    def test_when_fan_out_cancelled_then_shared_limit_is_kept(self, fake_server):
+        fake_server.delay = 0.5
+        limit = scheduler.get_scheduler().stats()["concurrency_limit"]
+
+        async def run():
+            task = asyncio.ensure_future(
+                ebird_async.gather_species_obs(
+                    "AU-VIC", [f"species{i}" for i in range(16)], 7, {}
+                )
+            )
+            await asyncio.sleep(0.1)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(run())
+        stats = scheduler.get_scheduler().stats()
+        assert stats["granted"] == 16
+        assert (stats["throttled"], stats["concurrency_limit"]) == (0, limit)
+        assert stats["in_flight"] == 0
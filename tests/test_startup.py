@@ -0,0 +1,53 @@
+import subprocess
+import sys
+from lifers import startup
+
+IMPORT_TIME_STDERR = """import time: self [us] | cumulative | imported package
+import time:       120 |        120 |   _json
+import time:      1500 |       1620 | json
+import time:       300 |        300 | data
+"""
+
+
+class TestParseImportTimes:
+    def test_when_stderr_parsed_then_returns_nested_rows(self):
+        rows = startup.parse_import_times(IMPORT_TIME_STDERR)
+        assert [(row["module"], row["depth"]) for row in rows] == [
+            ("_json", 1),
+            ("json", 0),
+            ("data", 0),
+        ]
+        assert rows[1]["cumulative_seconds"] == 0.00162
+
+    def test_when_formatted_then_total_counts_top_level_only(self):
+        rows = startup.parse_import_times(IMPORT_TIME_STDERR)
+        assert startup.format_import_times(rows).splitlines()[-1].endswith("1.9")
+
+
+class TestImportTimes:
+    def test_when_measured_then_reports_requested_modules(self):
+        rows = startup.import_times(("json", "metrics"))
+        assert [row["module"] for row in rows] == ["json", "metrics"]
+
+    def test_when_app_modules_imported_then_pydeck_and_tornado_are_deferred(self):
+        result = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "import sys; sys.path.insert(0, 'lifers'); "
+                "import data, ebird_async, pipeline, regions, visualise; "
+                "print(sorted({'pydeck', 'tornado'} & set(sys.modules)))",
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        assert result.stdout.strip() == "[]"
+
+
+class TestMark:
+    def test_when_marked_twice_then_first_time_is_kept(self, monkeypatch):
+        monkeypatch.setattr(startup, "_marks", {})
+        first = startup.mark("first_paint")
+        assert startup.mark("first_paint") == first
+        assert startup.marks() == {"first_paint": first}
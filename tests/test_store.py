@@ -0,0 +1,199 @@
+import datetime
+import pytest
+from lifers import ebird_api, ebird_async, pipeline, store
+
+HOUR = 60 * 60
+NOW = datetime.datetime(2024, 5, 31, 12, tzinfo=datetime.timezone.utc).timestamp()
+
+
+class FakeClock:
+    def __init__(self, now=NOW):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def observation(species_code, obs_dt, loc_id="L1"):
+    return {"speciesCode": species_code, "locId": loc_id, "obsDt": obs_dt}
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def observation_store(tmp_path, clock):
+    return store.ObservationStore(str(tmp_path / "observations.sqlite"), clock=clock)
+
+
+class TestPlan:
+    def test_when_region_unseen_then_fetches_full_window(self, observation_store):
+        assert observation_store.plan("AU-VIC", "", 7, NOW) == [("recent", 7)]
+
+    def test_when_fetched_recently_then_fetches_delta(self, observation_store):
+        observation_store.merge("AU-VIC", "", [], "recent", 7, NOW)
+        assert observation_store.plan("AU-VIC", "", 7, NOW + HOUR) == [("recent", 1)]
+        assert observation_store.plan("AU-VIC", "", 7, NOW + 50 * HOUR) == [
+            ("recent", 3)
+        ]
+
+    def test_when_delta_spans_window_then_fetches_full_window(self, observation_store):
+        observation_store.merge("AU-VIC", "", [], "recent", 7, NOW)
+        assert observation_store.plan("AU-VIC", "", 2, NOW + 3 * 24 * HOUR) == [
+            ("recent", 2)
+        ]
+
+    def test_when_region_window_grows_then_fetches_only_older_days(
+        self, observation_store
+    ):
+        observation_store.merge("AU-VIC", "", [], "recent", 7, NOW)
+        assert observation_store.plan("AU-VIC", "", 9, NOW + HOUR) == [
+            ("recent", 1),
+            ("historic", datetime.date(2024, 5, 23)),
+            ("historic", datetime.date(2024, 5, 22)),
+        ]
+
+    def test_when_species_window_grows_then_widens_request(self, observation_store):
+        observation_store.merge("AU-VIC", "emu1", [], "recent", 7, NOW)
+        assert observation_store.plan("AU-VIC", "emu1", 9, NOW + HOUR) == [
+            ("recent", 9)
+        ]
+
+    def test_when_fetched_within_fresh_for_then_nothing_is_needed(
+        self, observation_store
+    ):
+        observation_store.merge("AU-VIC", "", [], "recent", 7, NOW)
+        assert observation_store.plan("AU-VIC", "", 7, NOW + 60, 15 * 60) == []
+        assert observation_store.plan("AU-VIC", "", 8, NOW + 60, 15 * 60) == [
+            ("historic", datetime.date(2024, 5, 23))
+        ]
+        assert observation_store.plan("AU-VIC", "", 7, NOW + HOUR, 15 * 60) == [
+            ("recent", 1)
+        ]
+
+    def test_when_window_grows_by_many_days_then_fetches_it_at_once(
+        self, observation_store
+    ):
+        observation_store.merge("AU-VIC", "", [], "recent", 7, NOW)
+        assert observation_store.plan("AU-VIC", "", 30, NOW + 60, 15 * 60) == [
+            ("recent", 30)
+        ]
+
+    def test_when_older_days_merged_then_coverage_extends(self, observation_store):
+        observation_store.merge("AU-VIC", "", [], "recent", 7, NOW)
+        for kind, value in observation_store.plan("AU-VIC", "", 9, NOW):
+            observation_store.merge("AU-VIC", "", [], kind, value, NOW)
+        assert observation_store.plan("AU-VIC", "", 9, NOW) == [("recent", 1)]
+
+
+class TestMergeAndQuery:
+    def test_when_newer_observation_merged_then_replaces_older(self, observation_store):
+        observation_store.merge(
+            "AU-VIC", "", [observation("emu1", "2024-05-28 07:00")], "recent", 7, NOW
+        )
+        observation_store.merge(
+            "AU-VIC",
+            "",
+            [
+                observation("emu1", "2024-05-31 09:00"),
+                observation("ostric2", "2024-05-31 08:00"),
+            ],
+            "recent",
+            1,
+            NOW + HOUR,
+        )
+        observation_store.merge(
+            "AU-VIC", "", [observation("emu1", "2024-05-20 07:00")], "historic", 0, NOW
+        )
+
+        result = observation_store.query("AU-VIC", "", 7, NOW + HOUR)
+        assert [(row["speciesCode"], row["obsDt"]) for row in result] == [
+            ("emu1", "2024-05-31 09:00"),
+            ("ostric2", "2024-05-31 08:00"),
+        ]
+
+    def test_when_queried_then_only_window_is_returned(self, observation_store):
+        observation_store.merge(
+            "AU-VIC",
+            "emu1",
+            [
+                observation("emu1", "2024-05-30 07:00", "L1"),
+                observation("emu1", "2024-05-25 07:00", "L2"),
+            ],
+            "recent",
+            7,
+            NOW,
+        )
+        assert [
+            row["locId"] for row in observation_store.query("AU-VIC", "emu1", 3, NOW)
+        ] == ["L1"]
+        assert len(observation_store.query("AU-VIC", "emu1", 7, NOW)) == 2
+
+
+class TestStoredFetches:
+    def test_when_region_requeried_then_only_delta_goes_upstream(
+        self, requests_mock, observation_store, clock
+    ):
+        ebird_api.set_observation_store(observation_store)
+        mock_url = "https://api.ebird.org/v2/data/obs/AU-VIC/recent"
+        requests_mock.get(mock_url, json=[observation("emu1", "2024-05-31 07:00")])
+
+        ebird_api.get_recent_observations("AU-VIC", 7, {})
+        clock.now += HOUR
+        result = ebird_api.get_recent_observations("AU-VIC", 7, {})
+
+        assert [request.qs["back"] for request in requests_mock.request_history] == [
+            ["7"],
+            ["1"],
+        ]
+        assert [row["speciesCode"] for row in result] == ["emu1"]
+
+    def test_when_region_requeried_soon_then_store_answers(
+        self, requests_mock, observation_store, clock
+    ):
+        ebird_api.set_observation_store(observation_store)
+        mock_url = "https://api.ebird.org/v2/data/obs/AU-VIC/recent"
+        requests_mock.get(mock_url, json=[observation("emu1", "2024-05-31 07:00")])
+
+        ebird_api.get_recent_observations("AU-VIC", 7, {})
+        ebird_api.response_cache.clear()
+        clock.now += 60
+        result = ebird_api.get_recent_observations("AU-VIC", 7, {})
+        with ebird_api.refresh_cache():
+            ebird_api.get_recent_observations("AU-VIC", 7, {})
+
+        # Only the cache warmer goes upstream for coverage this fresh
+        assert [request.qs["back"] for request in requests_mock.request_history] == [
+            ["7"],
+            ["1"],
+        ]
+        assert [row["speciesCode"] for row in result] == ["emu1"]
+
+    def test_when_regions_searched_together_then_each_is_fetched_once(
+        self, fake_server, tmp_path
+    ):
+        ebird_api.set_observation_store(
+            store.ObservationStore(str(tmp_path / "observations.sqlite"))
+        )
+        pipeline.clear_stages()
+        pipeline.fetch_recent(("AU-VIC", "AU-NSW"), 7, {})
+        pipeline.clear_stages()
+
+        assert sorted(path.split("?")[0] for path in fake_server.paths) == [
+            "/v2/data/obs/AU-NSW/recent",
+            "/v2/data/obs/AU-VIC/recent",
+        ]
+
+    def test_when_species_fetched_async_then_store_is_used(self, fake_server, tmp_path):
+        ebird_api.set_observation_store(
+            store.ObservationStore(str(tmp_path / "observations.sqlite"))
+        )
+        first = ebird_async.fetch_species_obs("AU-VIC", ["emu1"], 7, {})
+        ebird_api.response_cache.clear()
+        second = ebird_async.fetch_species_obs("AU-VIC", ["emu1"], 7, {})
+
+        # The second fetch is within the observation TTL, so the store answers it
+        assert [path.rsplit("=", 1)[-1] for path in fake_server.paths] == ["7"]
+        assert first[0]["locId"].tolist() == second[0]["locId"].tolist() == ["L1"]
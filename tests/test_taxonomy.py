@@ -0,0 +1,120 @@
+import os
+import pytest
+import pandas as pd
+from lifers import taxonomy
+
+
+class TestTaxonomyVersion:
+    def test_when_filename_has_version_then_returns_version(self):
+        assert taxonomy.taxonomy_version("lifers/eBird_taxonomy_v2024.xlsx") == "2024"
+
+    def test_when_filename_has_no_version_then_returns_unknown(self):
+        assert taxonomy.taxonomy_version("taxonomy.xlsx") == "unknown"
+
+
+class TestCompileTaxonomy:
+    @pytest.fixture
+    def sample_xlsx(self, tmp_path):
+        xlsx_path = tmp_path / "eBird_taxonomy_v2099.xlsx"
+        pd.DataFrame(
+            {
+                "TAXON_ORDER": [1, 2],
+                "CATEGORY": ["species", "issf"],
+                "SPECIES_CODE": ["emu1", "emu2"],
+                "PRIMARY_COM_NAME": ["Emu", "Emu (Tasmanian)"],
+                "SCI_NAME": ["Dromaius novaehollandiae", "Dromaius n. diemenensis"],
+                "REPORT_AS": [None, "emu1"],
+            }
+        ).to_excel(xlsx_path, index=False)
+        return xlsx_path
+
+    def test_when_compiled_then_artifact_is_keyed_by_version_and_hash(
+        self, sample_xlsx, tmp_path
+    ):
+        path = taxonomy.compile_taxonomy(sample_xlsx, tmp_path / "cache")
+        assert os.path.exists(path)
+        assert os.path.basename(path) == (
+            f"taxonomy_v2099_{taxonomy.file_hash(sample_xlsx)}.parquet"
+        )
+
+    def test_when_loaded_then_matches_source_rows(self, sample_xlsx, tmp_path):
+        result = taxonomy.load_taxonomy(sample_xlsx, tmp_path / "cache")
+        assert result["SPECIES_CODE"].tolist() == ["emu1", "emu2"]
+        assert list(result.columns) == taxonomy.TAXONOMY_COLUMNS
+
+    def test_when_source_changes_then_artifact_is_rebuilt(self, sample_xlsx, tmp_path):
+        cache_dir = tmp_path / "cache"
+        first_path = taxonomy.compile_taxonomy(sample_xlsx, cache_dir)
+
+        df = pd.read_excel(sample_xlsx)
+        df.loc[0, "SPECIES_CODE"] = "emu3"
+        df.to_excel(sample_xlsx, index=False)
+        second_path = taxonomy.compile_taxonomy(sample_xlsx, cache_dir)
+
+        assert second_path != first_path
+        assert not os.path.exists(first_path)
+        assert taxonomy.load_taxonomy(sample_xlsx, cache_dir)["SPECIES_CODE"][0] == (
+            "emu3"
+        )
+
+
+class TestGetTaxonomy:
+    def test_when_called_twice_then_returns_same_object(self):
+        assert taxonomy.get_taxonomy() is taxonomy.get_taxonomy()
+
+
+class TestTaxonomyIndex:
+    @pytest.fixture
+    def index(self):
+        taxonomy_df = pd.DataFrame(
+            {
+                "TAXON_ORDER": [1, 2, 3, 4, 5],
+                "CATEGORY": ["species", "issf", "form", "spuh", "species"],
+                "SPECIES_CODE": ["emu1", "emu2", "emu3", "ratite1", "ostric2"],
+                "PRIMARY_COM_NAME": [
+                    "Emu",
+                    "Emu (Tasmanian)",
+                    "Emu/Cassowary",
+                    "ratite sp.",
+                    "Common Ostrich",
+                ],
+                "SCI_NAME": [
+                    "Dromaius novaehollandiae",
+                    "Dromaius n. diemenensis",
+                    "Dromaius/Casuarius",
+                    "Struthioniformes sp.",
+                    "Struthio camelus",
+                ],
+                "REPORT_AS": [None, "emu1", None, None, None],
+            }
+        )
+        return taxonomy.TaxonomyIndex(
+            taxonomy_df,
+            {"Dromaius ater": "emu1", "Struthio camelus": "emu1", "Gone": "absent1"},
+        )
+
+    def test_when_built_then_links_taxa_to_their_species(self, index):
+        assert index.parent_ids.tolist() == [0, 0, -1, -1, 4]
+
+    def test_when_codes_looked_up_then_rolls_up_to_species(self, index):
+        taxon_ids = index.ids_for_codes(["emu2", "ratite1", "unknown", "ostric2"])
+        assert index.species_codes(taxon_ids).tolist() == [
+            "emu1",
+            None,
+            None,
+            "ostric2",
+        ]
+
+    def test_when_names_looked_up_then_synonyms_resolve(self, index):
+        taxon_ids = index.ids_for_names(
+            ["Dromaius ater", "Dromaius n. diemenensis", "Struthio camelus", "Gone"]
+        )
+        assert taxon_ids.tolist() == [0, 1, 4, -1]
+
+
+class TestGetIndex:
+    def test_when_renamed_taxon_looked_up_then_resolves_current_species(self):
+        index = taxonomy.get_index()
+        taxon_ids = index.ids_for_names(["Charadrius bicinctus"])
+        assert index.species_codes(taxon_ids).tolist() == ["dobplo1"]
+        assert taxonomy.get_index() is index
@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+import pandas as pd
+from lifers import data, visualise
+
+
+def synthetic_needs(num_locations, num_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    location = rng.integers(0, num_locations, num_rows)
+    lat = rng.uniform(-40, -10, num_locations)
+    lng = rng.uniform(115, 153, num_locations)
+    return pd.DataFrame(
+        {
+            "locId": [f"L{i}" for i in location],
+            "locName": [f"Hotspot {i}" for i in location],
+            "lat": lat[location],
+            "lng": lng[location],
+            "comName": [f"Species {i}" for i in rng.integers(0, 200, num_rows)],
+        }
+    )
+
+
+class TestFitZoom:
+    def test_when_area_is_smaller_then_zoom_is_higher(self):
+        country = pd.DataFrame({"lat": [-40.0, -10.0], "lng": [115.0, 153.0]})
+        suburb = pd.DataFrame({"lat": [-37.80, -37.75], "lng": [144.90, 144.98]})
+        assert visualise.fit_zoom(suburb) > visualise.fit_zoom(country)
+
+    def test_when_single_point_then_zoom_is_capped(self):
+        point = pd.DataFrame({"lat": [-37.8], "lng": [144.9]})
+        assert visualise.fit_zoom(point) <= visualise.MAX_ZOOM
+
+    def test_when_fitted_then_view_is_centred_on_bounds(self):
+        map_data = pd.DataFrame(
+            {"lat": [-40.0, -10.0, -11.0], "lng": [115.0, 153.0, 150.0]}
+        )
+        view_state = visualise.fit_view_state(map_data)
+        assert view_state.latitude == -25.0
+        assert view_state.longitude == 134.0
+
+
+class TestMapLayerData:
+    def test_when_within_budget_then_returns_raw_hotspots(self):
+        region_needs_df = synthetic_needs(50, 500)
+        region_loc_data = data.format_region_needs_data_for_map(region_needs_df)
+        result = visualise.map_layer_data(region_needs_df, region_loc_data)
+        assert result is region_loc_data
+
+    def test_when_over_budget_then_returns_at_most_max_points_cells(self):
+        region_needs_df = synthetic_needs(3000, 20000)
+        region_loc_data = data.format_region_needs_data_for_map(region_needs_df)
+        result = visualise.map_layer_data(
+            region_needs_df, region_loc_data, max_points=100
+        )
+        assert 0 < len(result) <= 100
+        assert result["num_locations"].sum() == len(region_loc_data)
+
+    def test_when_region_grows_then_payload_stays_bounded(self):
+        sizes = []
+        for num_locations in [1000, 10000]:
+            region_needs_df = synthetic_needs(num_locations, num_locations * 5)
+            region_loc_data = data.format_region_needs_data_for_map(region_needs_df)
+            chart = visualise.map_deck(
+                visualise.map_layer_data(region_needs_df, region_loc_data)
+            )
+            sizes.append(len(chart.to_json()))
+        assert sizes[1] < sizes[0] * 2
+
+
+class TestFormatBinnedRegionNeedsDataForMap:
+    def test_when_binned_then_cells_count_distinct_species_and_locations(self):
+        region_needs_df = pd.DataFrame(
+            {
+                "locId": ["L1", "L2", "L2", "L3"],
+                "locName": ["A", "B", "B", "C"],
+                "lat": [0.1, 0.2, 0.2, 5.5],
+                "lng": [0.1, 0.3, 0.3, 5.5],
+                "comName": ["Sparrow", "Sparrow", "Pigeon", "Pigeon"],
+            }
+        )
+        cells = data.format_binned_region_needs_data_for_map(region_needs_df, 1.0)
+        assert cells["num_species"].tolist() == [2, 1]
+        assert cells["num_locations"].tolist() == [2, 1]
+        assert cells["locName"][0] == "2 locations"
+        assert cells["lat"][0] == pytest.approx(0.15)
+
+    def test_when_cell_has_many_species_then_tooltip_is_truncated(self):
+        region_needs_df = pd.DataFrame(
+            {
+                "locId": ["L1"] * 15,
+                "locName": ["A"] * 15,
+                "lat": [0.1] * 15,
+                "lng": [0.1] * 15,
+                "comName": [f"Species {i:02d}" for i in range(15)],
+            }
+        )
+        cells = data.format_binned_region_needs_data_for_map(region_needs_df, 1.0)
+        lines = cells["tooltip_species"][0].split("\n")
+        assert len(lines) == data.MAX_TOOLTIP_SPECIES + 1
+        assert lines[-2] == "10. Species 09"
+        assert lines[-1] == "... and 5 more"
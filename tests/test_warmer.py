@@ -0,0 +1,133 @@
+import pytest
+from lifers import ebird_api, warmer
+
+DAY = 24 * 60 * 60
+
+
+class FakeClock:
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture(autouse=True)
+def no_warmer():
+    yield
+    warmer.set_warmer(None)
+
+
+class TestRecordQuery:
+    def test_when_search_not_warmed_then_is_miss(self, clock):
+        cache_warmer = warmer.Warmer({}, clock=clock)
+        assert not cache_warmer.record_query("AU-VIC", 7)
+        assert cache_warmer.stats()["warm_hit_ratio"] == 0.0
+
+    def test_when_search_warmed_within_ttl_then_is_hit(self, fake_server, clock):
+        cache_warmer = warmer.Warmer({}, clock=clock)
+        cache_warmer.refresh("AU-VIC", 7, 10)
+
+        assert cache_warmer.record_query("AU-VIC", 7)
+        assert not cache_warmer.record_query("AU-VIC", 14)
+        clock.now += ebird_api.OBSERVATION_TTL
+        assert not cache_warmer.record_query("AU-VIC", 7)
+        assert cache_warmer.stats()["warm_hit_ratio"] == pytest.approx(1 / 3)
+
+
+class TestHottest:
+    def test_when_searched_rarely_then_not_warmed(self, clock):
+        cache_warmer = warmer.Warmer({}, min_queries=2, clock=clock)
+        cache_warmer.record_query("AU-VIC", 7)
+        for _ in range(3):
+            cache_warmer.record_query("AU-NSW", 7)
+        cache_warmer.record_query("AU-QLD", 7)
+        cache_warmer.record_query("AU-QLD", 7)
+
+        assert cache_warmer.hottest() == [("AU-NSW", 7), ("AU-QLD", 7)]
+
+    def test_when_counts_age_then_they_decay(self, clock):
+        cache_warmer = warmer.Warmer({}, min_queries=2, clock=clock)
+        for _ in range(3):
+            cache_warmer.record_query("AU-VIC", 7)
+        clock.now += DAY
+
+        assert cache_warmer.hottest() == []
+        assert cache_warmer.stats()["tracked_searches"] == 1
+
+    def test_when_pinned_then_always_warmed_first(self, clock):
+        cache_warmer = warmer.Warmer(
+            {}, top_searches=1, pinned=[("AU-TAS", 7)], clock=clock
+        )
+        for region_code in ("AU-VIC", "AU-VIC", "AU-VIC", "AU-NSW", "AU-NSW"):
+            cache_warmer.record_query(region_code, 7)
+        cache_warmer.record_query("AU-TAS", 7)
+
+        assert cache_warmer.hottest() == [("AU-TAS", 7), ("AU-VIC", 7)]
+
+
+class TestRefresh:
+    def test_when_refreshed_then_cached_responses_are_replaced(
+        self, fake_server, recent_species
+    ):
+        cache_warmer = warmer.Warmer({})
+        assert cache_warmer.refresh("AU-VIC", 7, 10) == 1 + len(recent_species)
+        requests = fake_server.stats["requests"]
+        cache_warmer.refresh("AU-VIC", 7, 10)
+
+        assert fake_server.stats["requests"] == 2 * requests
+        assert ebird_api.response_cache.get(
+            ebird_api.cache_key("data/obs/AU-VIC/recent/emu1", {"back": 7})
+        )
+
+    def test_when_budget_short_then_species_are_truncated(self, fake_server):
+        cache_warmer = warmer.Warmer({})
+        assert cache_warmer.refresh("AU-VIC", 7, 2) == 2
+        assert fake_server.stats["requests"] == 2
+
+    def test_when_areas_overlap_then_every_request_is_charged(self, fake_server):
+        fake_server.region_species = {
+            "AU-VIC": ["emu1", "ostric2"],
+            "AU-NSW": ["emu1", "auonig1"],
+        }
+        cache_warmer = warmer.Warmer({})
+        areas = ("AU-VIC", "AU-NSW")
+
+        # Two region lists, then emu1 from both areas and the others from one each
+        assert cache_warmer.refresh(areas, 7, 10) == fake_server.stats["requests"] == 6
+        assert cache_warmer.refresh(areas, 7, 4) == 4
+        assert fake_server.stats["requests"] == 10
+
+    def test_when_cycle_runs_then_budget_is_shared(self, fake_server):
+        cache_warmer = warmer.Warmer(
+            {}, budget=5, pinned=[("AU-VIC", 7), ("AU-NSW", 7), ("AU-QLD", 7)]
+        )
+        assert cache_warmer.run_once() == 5
+        assert cache_warmer.stats()["refreshes"] == 2
+
+    def test_when_region_fails_then_others_are_warmed(self, requests_mock):
+        base_url = "https://api.ebird.org/v2/data/obs"
+        requests_mock.get(f"{base_url}/AU-NSW/recent", status_code=503)
+        requests_mock.get(f"{base_url}/AU-VIC/recent", json=[])
+        cache_warmer = warmer.Warmer({}, pinned=[("AU-NSW", 7), ("AU-VIC", 7)])
+        cache_warmer.run_once()
+        stats = cache_warmer.stats()
+        assert (stats["errors"], stats["refreshes"]) == (1, 1)
+
+
+class TestRefreshCache:
+    def test_when_refreshing_then_cache_is_not_read(self, requests_mock):
+        mock_url = "https://api.ebird.org/v2/data/obs/AU-VIC/recent"
+        requests_mock.get(mock_url, json=[{"speciesCode": "emu1"}])
+
+        ebird_api.get_recent_observations("AU-VIC", 7, {})
+        ebird_api.get_recent_observations("AU-VIC", 7, {})
+        with ebird_api.refresh_cache():
+            ebird_api.get_recent_observations("AU-VIC", 7, {})
+
+        assert requests_mock.call_count == 2